@@ -1,22 +1,54 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, Header, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy.orm import Session
-from typing import List, Optional
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import TypeAdapter
+from typing import List, Literal, Optional
 import os
+import json
+import asyncio
+import hashlib
+import secrets
 from dotenv import load_dotenv
 
-from database import get_db, init_db
+import database
+from database import get_async_db, get_read_db, primary_session
+import purchases
+import promo
+import users
+import pagination
+import fastjson
+import ledger
+import idempotency
+import deposits
+import ratelimit
+import metrics
+import logconfig
+import cache
+import catalog
+from cache import balance_cache, user_cache
 from models import User, UserGift, Transaction, PromoCode
 from schemas import (
     UserResponse, UserCreate, 
     UserGiftResponse, UserGiftCreate,
     TransactionResponse, TransactionCreate,
-    PurchaseRequest, DepositRequest, BalanceResponse
+    PurchaseRequest, CheckoutRequest, DepositRequest, BalanceResponse,
+    BootstrapResponse, GiftPreview
 )
 
 # Загружаем переменные окружения
 load_dotenv()
 
+# Миграции при старте: true - проверить версию схемы и догнать ее (по умолчанию),
+# false - не трогать БД при старте, миграции запускаются отдельно (python init_db.py)
+MIGRATE_ON_STARTUP = os.getenv('MIGRATE_ON_STARTUP', 'true').lower() in ('1', 'true', 'yes')
+
+log = logconfig.get_logger("capsule.api")
+# Частое событие: DEBUG-записи семплируются (LOG_SAMPLING)
+balance_log = logconfig.get_logger("capsule.balance")
+
 # Создаем приложение FastAPI
 app = FastAPI(
     title="Capsule Market API",
@@ -24,6 +56,12 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Лимиты частоты (RATE_LIMITS, RATE_LIMIT_DEFAULT) и одновременных запросов
+# (MAX_CONCURRENT_REQUESTS). Добавляется до CORS, чтобы ответы 429/503 шли через
+# CORSMiddleware и мини-апп мог прочитать Retry-After
+rate_limiter = ratelimit.RateLimiter.from_env()
+app.add_middleware(ratelimit.RateLimitMiddleware, limiter=rate_limiter)
+
 # Настройка CORS
 app.add_middleware(
     CORSMiddleware,
@@ -37,208 +75,401 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
     allow_headers=["*"],
+    # Чтобы мини-апп мог прочитать курсор пагинации, ETag баланса, признак повтора и Retry-After
+    expose_headers=[pagination.NEXT_CURSOR_HEADER, "ETag", idempotency.REPLAYED_HEADER, "Retry-After"],
 )
 
+# Метрики Prometheus (GET /metrics): внешний слой, чтобы учитывать и отказы лимитов
+app.add_middleware(metrics.MetricsMiddleware)
+
 # Инициализация БД при старте
 @app.on_event("startup")
 async def startup_event():
-    init_db()
-    print("Database initialized")
+    if MIGRATE_ON_STARTUP:
+        version = await database.init_db_async()
+        log.info("database initialized", extra={"schema_version": version})
+    # Фоновые задачи: снапшоты балансов леджера и очистка ключей идемпотентности
+    app.state.background_tasks = [
+        asyncio.create_task(ledger.Snapshotter(database.AsyncSessionLocal).run_forever()),
+        asyncio.create_task(idempotency.Sweeper(database.AsyncSessionLocal).run_forever()),
+    ]
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in app.state.background_tasks:
+        task.cancel()
+
+async def _idempotent(db: AsyncSession, user_id: int, key: Optional[str], endpoint: str, payload, operation,
+                      response_model=None):
+    """
+    Выполняет operation() один раз на Idempotency-Key: повтор получает сохраненный
+    ответ (и ошибки 4xx тоже), не выполняя операцию. Без ключа - обычный вызов
+    """
+    if key is None:
+        return await operation()
+    try:
+        stored = await idempotency.begin(db, user_id, key, idempotency.fingerprint(endpoint, payload))
+    except idempotency.IdempotencyError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    if stored is not None:
+        return Response(
+            stored.body, status_code=stored.status_code, media_type="application/json",
+            headers={idempotency.REPLAYED_HEADER: "true"}
+        )
+    
+    try:
+        result = await operation()
+    except HTTPException as e:
+        if e.status_code >= 500:
+            await idempotency.release(db, user_id, key)
+        else:
+            await idempotency.complete(db, user_id, key, e.status_code, json.dumps({"detail": e.detail}))
+        raise
+    except BaseException:
+        await idempotency.release(db, user_id, key)
+        raise
+    
+    content = TypeAdapter(response_model).validate_python(result, from_attributes=True) if response_model else result
+    await idempotency.complete(db, user_id, key, status.HTTP_200_OK, json.dumps(jsonable_encoder(content)))
+    return result
 
 # ==================== USER ENDPOINTS ====================
 
+def _user_response(user: User, balance) -> UserResponse:
+    """Профиль с балансом из леджера вместо устаревших колонок users"""
+    return UserResponse.model_validate(user).model_copy(
+        update={"balance_ton": balance[0], "balance_stars": balance[1]}
+    )
+
+async def _remember_user(response: UserResponse):
+    """Кладет профиль и баланс в кэш; профиль хранится без баланса, JSON-совместимым"""
+    await user_cache.set(
+        response.user_id, response.model_dump(mode="json", exclude={"balance_ton", "balance_stars"})
+    )
+    await balance_cache.set(response.user_id, [response.balance_ton, response.balance_stars])
+
+async def _cached_user(user_id: int) -> Optional[UserResponse]:
+    """Профиль с балансом из кэша без обращения к БД; None, если чего-то нет в кэше"""
+    profile = await user_cache.get(user_id)
+    if profile is None:
+        return None
+    balance = await balance_cache.get(user_id)
+    if balance is None:
+        return None
+    return UserResponse(**profile, balance_ton=balance[0], balance_stars=balance[1])
+
+async def _user_with_balance(db: AsyncSession, user_id: int):
+    """Строка пользователя и (balance_ton, balance_stars) одним запросом; None, если нет"""
+    row = (await db.execute(
+        select(User, *ledger.balance_columns(user_id)).where(User.user_id == user_id)
+    )).first()
+    return (row.User, ledger.to_balances(row)) if row else None
+
 @app.get("/api/user/{user_id}", response_model=UserResponse)
-async def get_user(user_id: int, db: Session = Depends(get_db)):
+async def get_user(user_id: int, db: AsyncSession = Depends(get_read_db)):
     """Получить информацию о пользователе"""
-    user = db.query(User).filter(User.user_id == user_id).first()
-    if not user:
+    cached = await _cached_user(user_id)
+    if cached is not None:
+        return cached
+    found = await _user_with_balance(db, user_id)
+    if not found:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    user_response = _user_response(*found)
+    await _remember_user(user_response)
+    return user_response
 
 @app.post("/api/user", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def create_user(user_data: UserCreate, db: Session = Depends(get_db)):
+async def create_user(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Создать или обновить пользователя"""
-    # Проверяем, существует ли пользователь
-    existing_user = db.query(User).filter(User.user_id == user_data.user_id).first()
-    if existing_user:
-        # Обновляем данные пользователя если они изменились
-        if user_data.username:
-            existing_user.username = user_data.username
-        if user_data.first_name:
-            existing_user.first_name = user_data.first_name
-        if user_data.last_name:
-            existing_user.last_name = user_data.last_name
-        if user_data.is_premium is not None:
-            existing_user.is_premium = user_data.is_premium
-        db.commit()
-        db.refresh(existing_user)
-        return existing_user
-    
-    # Создаем нового пользователя
-    db_user = User(**user_data.dict())
-    db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return db_user
+    # user_id в теле запроса: закрепляем пользователя за primary после записи
+    db.info["user_id"] = user_data.user_id
+    user = await users.upsert_user(db, user_data.model_dump())
+    user_response = _user_response(user, await ledger.get_balances(db, user.user_id))
+    await _remember_user(user_response)
+    return user_response
+
+def _balance_etag(balance_ton: float, balance_stars: int) -> str:
+    """ETag баланса: меняется только вместе с самим балансом"""
+    digest = hashlib.sha1(f"{balance_ton!r}:{balance_stars}".encode()).hexdigest()[:16]
+    return f'"{digest}"'
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверка заголовка If-None-Match (список тегов, W/-префикс, *)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
 
 @app.get("/api/user/{user_id}/balance", response_model=BalanceResponse)
-async def get_balance(user_id: int, db: Session = Depends(get_db)):
+async def get_balance(
+    user_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_read_db)
+):
     """Получить баланс пользователя"""
-    print(f"[API] Getting balance for user_id: {user_id} (type: {type(user_id)})")
+    balance = await balance_cache.get(user_id)
+    cached = balance is not None
+    if not cached:
+        # Снапшот + хвост леджера одним запросом по индексам
+        balance = await ledger.get_balances(db, user_id)
+        if balance is None:
+            # Создаем пользователя с нулевым балансом (на primary, даже если читали реплику)
+            async with primary_session(db) as primary:
+                await users.ensure_user(primary, user_id)
+                await primary.commit()
+                balance = await ledger.get_balances(primary, user_id)
+        await balance_cache.set(user_id, balance)
+    balance_log.debug("balance lookup", extra={"user_id": user_id, "cached": cached})
     
-    # Проверяем, сколько всего пользователей в БД
-    total_users = db.query(User).count()
-    print(f"[API] Total users in database: {total_users}")
+    etag = _balance_etag(*balance)
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
     
-    user = db.query(User).filter(User.user_id == user_id).first()
-    if not user:
-        print(f"[API] User {user_id} not found, creating new user")
-        # Создаем пользователя с нулевым балансом
-        user = User(user_id=user_id, balance_ton=0.0, balance_stars=0)
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-    else:
-        print(f"[API] User {user_id} found:")
-        print(f"  - balance_ton: {user.balance_ton}")
-        print(f"  - balance_stars: {user.balance_stars}")
-        print(f"  - username: {user.username}")
-        print(f"  - created_at: {user.created_at}")
-    
-    response = BalanceResponse(balance_ton=user.balance_ton, balance_stars=user.balance_stars)
-    print(f"[API] Returning balance: {response.balance_ton} TON, {response.balance_stars} STARS")
-    return response
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return BalanceResponse(balance_ton=balance[0], balance_stars=balance[1])
 
 @app.post("/api/user/{user_id}/deposit", response_model=TransactionResponse)
 async def deposit_balance(
     user_id: int, 
     deposit_data: DepositRequest,
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Пополнить баланс пользователя"""
-    user = db.query(User).filter(User.user_id == user_id).first()
-    if not user:
-        # Создаем пользователя если его нет
-        user = User(user_id=user_id, balance_ton=0.0, balance_stars=0)
-        db.add(user)
-        db.commit()
-        db.refresh(user)
-    
-    # Обновляем баланс
-    if deposit_data.currency == 'TON':
-        user.balance_ton += deposit_data.amount
-    elif deposit_data.currency == 'STARS':
-        user.balance_stars += int(deposit_data.amount)
-    else:
+    if deposit_data.currency not in ('TON', 'STARS'):
         raise HTTPException(status_code=400, detail="Invalid currency")
     
-    # Создаем транзакцию
-    transaction = Transaction(
-        user_id=user_id,
-        transaction_type='deposit',
-        amount=deposit_data.amount,
-        currency=deposit_data.currency,
-        tx_hash=deposit_data.tx_hash,
-        status='completed'
-    )
-    db.add(transaction)
-    db.commit()
-    db.refresh(transaction)
+    async def deposit():
+        # Создаем пользователя если его нет (профиль в кэше - точно есть);
+        # зачисление - только новая запись леджера
+        if await user_cache.get(user_id) is None:
+            await users.ensure_user(db, user_id)
+        try:
+            transaction = await ledger.append(
+                db, user_id, 'deposit', deposit_data.amount, deposit_data.currency, tx_hash=deposit_data.tx_hash
+            )
+        except IntegrityError:
+            # tx_hash уже зачислен (uq_transactions_deposit_tx_hash): этим запросом, сверкой или параллельно
+            await db.rollback()
+            raise HTTPException(status_code=409, detail="Deposit already processed")
+        await db.commit()
+        await balance_cache.invalidate(user_id)
+        metrics.DEPOSITS.labels("api", deposit_data.currency).inc()
+        return transaction
     
-    return transaction
+    return await _idempotent(
+        db, user_id, idempotency_key, "deposit", deposit_data.model_dump(), deposit, TransactionResponse
+    )
+
+# Токен для служебных эндпоинтов (сверка платежей); без него они выключены
+ADMIN_API_TOKEN = os.getenv('ADMIN_API_TOKEN', '')
+
+@app.post("/api/deposits/bulk")
+async def bulk_deposits(
+    request: Request,
+    x_admin_token: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Пакетная загрузка пополнений из NDJSON (сверка платежей); дубли по tx_hash пропускаются"""
+    if not ADMIN_API_TOKEN or not secrets.compare_digest(x_admin_token or "", ADMIN_API_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    try:
+        records = deposits.parse_ndjson((await request.body()).splitlines())
+    except deposits.InvalidRecord as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await deposits.ingest(db, records)
 
 # ==================== GIFTS ENDPOINTS ====================
 
+async def _gifts_page(db: AsyncSession, user_id: int, cursor: Optional[str], limit: int, as_rows: bool = False):
+    query = select(*fastjson.GIFT_COLUMNS) if as_rows else select(UserGift)
+    return await pagination.fetch_page(
+        db, query.where(UserGift.user_id == user_id),
+        UserGift.purchase_date, UserGift.id, "purchase_date", cursor, limit, as_rows
+    )
+
 @app.get("/api/user/{user_id}/gifts", response_model=List[UserGiftResponse])
-async def get_user_gifts(user_id: int, db: Session = Depends(get_db)):
-    """Получить список подарков пользователя"""
-    # Проверяем существование пользователя
-    user = db.query(User).filter(User.user_id == user_id).first()
-    if not user:
-        return []
-    
-    gifts = db.query(UserGift).filter(UserGift.user_id == user_id).all()
+async def get_user_gifts(
+    user_id: int,
+    response: Response,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Получить страницу подарков пользователя (новые первыми); курсор следующей - в X-Next-Cursor"""
+    try:
+        gifts, next_cursor = await _gifts_page(db, user_id, cursor, limit, fastjson.ENABLED)
+    except pagination.InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    headers = {pagination.NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    if fastjson.ENABLED:
+        # Быстрый путь: кортежи колонок -> orjson, без построчной валидации pydantic
+        return fastjson.FastJSONResponse(fastjson.rows_to_dicts(gifts, fastjson.GIFT_COLUMNS), headers=headers)
+    response.headers.update(headers)
     return gifts
 
 @app.post("/api/user/{user_id}/purchase", response_model=UserGiftResponse)
 async def purchase_gift(
     user_id: int,
     purchase_data: PurchaseRequest,
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Купить подарок"""
-    # Получаем пользователя
-    user = db.query(User).filter(User.user_id == user_id).first()
-    if not user:
-        raise HTTPException(status_code=404, detail="User not found")
-    
-    # Проверяем баланс
-    if user.balance_ton < purchase_data.gift_price:
-        raise HTTPException(
-            status_code=400, 
-            detail="Insufficient balance"
-        )
-    
-    # Проверяем, нет ли уже такого подарка
-    existing_gift = db.query(UserGift).filter(
-        UserGift.user_id == user_id,
-        UserGift.gift_id == purchase_data.gift_id
-    ).first()
-    
-    if existing_gift:
-        raise HTTPException(
-            status_code=400,
-            detail="Gift already purchased"
-        )
-    
-    # Списываем баланс
-    user.balance_ton -= purchase_data.gift_price
+    async def purchase():
+        try:
+            gift = await purchases.purchase_gift(db, user_id, purchase_data)
+        except purchases.PurchaseError as e:
+            metrics.PURCHASES.labels("purchase", type(e).__name__).inc()
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        metrics.PURCHASES.labels("purchase", "ok").inc()
+        metrics.GIFTS_PURCHASED.inc()
+        return gift
     
-    # Создаем запись о подарке
-    user_gift = UserGift(
-        user_id=user_id,
-        gift_id=purchase_data.gift_id,
-        gift_name=purchase_data.gift_name,
-        gift_preview=purchase_data.gift_preview,
-        gift_price=purchase_data.gift_price
+    return await _idempotent(
+        db, user_id, idempotency_key, "purchase", purchase_data.model_dump(), purchase, UserGiftResponse
     )
-    db.add(user_gift)
+
+@app.post("/api/user/{user_id}/checkout", response_model=List[UserGiftResponse])
+async def checkout(
+    user_id: int,
+    cart: CheckoutRequest,
+    idempotency_key: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Купить несколько подарков одной операцией: все или ни одного"""
+    async def buy_cart():
+        try:
+            gifts = await purchases.checkout(db, user_id, cart)
+        except purchases.PurchaseError as e:
+            metrics.PURCHASES.labels("checkout", type(e).__name__).inc()
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        metrics.PURCHASES.labels("checkout", "ok").inc()
+        metrics.GIFTS_PURCHASED.inc(len(gifts))
+        return gifts
     
-    # Создаем транзакцию
-    transaction = Transaction(
-        user_id=user_id,
-        transaction_type='purchase',
-        amount=purchase_data.gift_price,
-        currency='TON',
-        gift_id=purchase_data.gift_id,
-        status='completed'
+    return await _idempotent(
+        db, user_id, idempotency_key, "checkout", cart.model_dump(), buy_cart, List[UserGiftResponse]
     )
-    db.add(transaction)
-    
-    db.commit()
-    db.refresh(user_gift)
-    
-    return user_gift
 
 # ==================== TRANSACTIONS ENDPOINTS ====================
 
+async def _transactions_page(db: AsyncSession, user_id: int, cursor: Optional[str], limit: int, as_rows: bool = False):
+    query = select(*fastjson.TRANSACTION_COLUMNS) if as_rows else select(Transaction)
+    return await pagination.fetch_page(
+        db, query.where(Transaction.user_id == user_id),
+        Transaction.created_at, Transaction.id, "created_at", cursor, limit, as_rows
+    )
+
 @app.get("/api/user/{user_id}/transactions", response_model=List[TransactionResponse])
 async def get_user_transactions(
     user_id: int,
-    limit: int = 50,
-    db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db)
 ):
-    """Получить историю транзакций пользователя"""
-    user = db.query(User).filter(User.user_id == user_id).first()
-    if not user:
-        return []
-    
-    transactions = db.query(Transaction).filter(
-        Transaction.user_id == user_id
-    ).order_by(Transaction.created_at.desc()).limit(limit).all()
-    
+    """Получить страницу истории транзакций (новые первыми); курсор следующей - в X-Next-Cursor"""
+    try:
+        transactions, next_cursor = await _transactions_page(db, user_id, cursor, limit, fastjson.ENABLED)
+    except pagination.InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    headers = {pagination.NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    if fastjson.ENABLED:
+        # Быстрый путь: кортежи колонок -> orjson, без построчной валидации pydantic
+        return fastjson.FastJSONResponse(
+            fastjson.rows_to_dicts(transactions, fastjson.TRANSACTION_COLUMNS), headers=headers
+        )
+    response.headers.update(headers)
     return transactions
 
+# ==================== BOOTSTRAP ENDPOINT ====================
+
+@app.get("/api/user/{user_id}/bootstrap", response_model=BootstrapResponse)
+async def get_bootstrap(
+    user_id: int,
+    gifts_limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    # 0 - без транзакций (мини-апп загружает историю, когда ее открывают)
+    transactions_limit: int = Query(20, ge=0, le=pagination.MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Все данные для старта мини-аппа одним запросом: профиль, баланс, первая
+    страница подарков и последние транзакции. Три запроса к БД (два, если профиль
+    и баланс в кэше; пять для нового пользователя); transactions_limit=0 - на один меньше
+    """
+    cached = await _cached_user(user_id)
+    if cached is not None:
+        return await _bootstrap_response(db, cached, gifts_limit, transactions_limit)
+    found = await _user_with_balance(db, user_id)
+    if not found:
+        # Как и /balance, создаем пользователя с нулевым балансом; дальше читаем с primary,
+        # потому что реплика может еще не знать о новом пользователе
+        async with primary_session(db) as primary:
+            await users.ensure_user(primary, user_id)
+            await primary.commit()
+            user_response = _user_response(*await _user_with_balance(primary, user_id))
+            await _remember_user(user_response)
+            return await _bootstrap_response(primary, user_response, gifts_limit, transactions_limit)
+    user_response = _user_response(*found)
+    await _remember_user(user_response)
+    return await _bootstrap_response(db, user_response, gifts_limit, transactions_limit)
+
+async def _bootstrap_response(db: AsyncSession, user_response: UserResponse, gifts_limit: int, transactions_limit: int):
+    user_id = user_response.user_id
+    gifts, gifts_next_cursor = await _gifts_page(db, user_id, None, gifts_limit)
+    transactions, transactions_next_cursor = [], None
+    if transactions_limit:
+        transactions, transactions_next_cursor = await _transactions_page(db, user_id, None, transactions_limit)
+    
+    return BootstrapResponse(
+        user=user_response,
+        balance=BalanceResponse(balance_ton=user_response.balance_ton, balance_stars=user_response.balance_stars),
+        gifts=[UserGiftResponse.model_validate(gift) for gift in gifts],
+        gifts_next_cursor=gifts_next_cursor,
+        transactions=[TransactionResponse.model_validate(transaction) for transaction in transactions],
+        transactions_next_cursor=transactions_next_cursor
+    )
+
+# ==================== CATALOG ====================
+
+@app.get("/api/catalog", response_model=List[GiftPreview])
+async def get_catalog(
+    response: Response,
+    collection: List[str] = Query(default=[]),
+    model: List[str] = Query(default=[]),
+    backdrop: List[str] = Query(default=[]),
+    symbol: List[str] = Query(default=[]),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    sort: Literal["latest", "price-low", "price-high", "id-asc", "id-desc"] = "latest",
+    limit: int = Query(pagination.DEFAULT_PAGE_SIZE, ge=1, le=pagination.MAX_PAGE_SIZE),
+    cursor: Optional[str] = None
+):
+    """
+    Страница каталога подарков на продажу из индекса в памяти. Повтор параметра -
+    любое из значений (?backdrop=Onyx Black&backdrop=Cobalt Blue); курсор следующей
+    страницы - в X-Next-Cursor
+    """
+    try:
+        store = catalog.get_catalog()
+    except catalog.CatalogUnavailable:
+        log.exception("catalog unavailable")
+        raise HTTPException(status_code=503, detail="Catalog unavailable")
+    filters = {"collection": collection, "model": model, "backdrop": backdrop, "symbol": symbol}
+    try:
+        items, next_cursor = store.query(filters, min_price, max_price, sort, cursor, limit)
+    except pagination.InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    headers = {pagination.NEXT_CURSOR_HEADER: next_cursor} if next_cursor else {}
+    if fastjson.ENABLED:
+        # Элементы каталога уже словари полей GiftPreview
+        return fastjson.FastJSONResponse(items, headers=headers)
+    response.headers.update(headers)
+    return items
+
 # ==================== HEALTH CHECK ====================
 
 @app.get("/")
@@ -257,12 +488,15 @@ async def api_root():
             "balance": "/api/user/{user_id}/balance",
             "gifts": "/api/user/{user_id}/gifts",
             "purchase": "/api/user/{user_id}/purchase",
-            "transactions": "/api/user/{user_id}/transactions"
+            "checkout": "/api/user/{user_id}/checkout",
+            "transactions": "/api/user/{user_id}/transactions",
+            "bootstrap": "/api/user/{user_id}/bootstrap",
+            "catalog": "/api/catalog"
         }
     }
 
 @app.get("/api/debug/db")
-async def debug_db(db: Session = Depends(get_db)):
+async def debug_db(db: AsyncSession = Depends(get_read_db)):
     """Debug endpoint to check database connection"""
     import os
     from database import SQLALCHEMY_DATABASE_URL
@@ -273,14 +507,15 @@ async def debug_db(db: Session = Depends(get_db)):
     
     # Пытаемся получить количество пользователей
     try:
-        total_users = db.query(User).count()
+        total_users = await db.scalar(select(func.count()).select_from(User))
         # Получаем первого пользователя для примера
-        first_user = db.query(User).first()
+        first_user = await db.scalar(select(User).limit(1))
         user_info = None
         if first_user:
+            balance_ton, _ = await ledger.get_balances(db, first_user.user_id)
             user_info = {
                 "user_id": first_user.user_id,
-                "balance_ton": first_user.balance_ton,
+                "balance_ton": balance_ton,
                 "username": first_user.username
             }
     except Exception as e:
@@ -295,65 +530,51 @@ async def debug_db(db: Session = Depends(get_db)):
         "first_user": user_info
     }
 
+@app.get("/api/debug/pool")
+async def debug_pool():
+    """Debug endpoint: состояние пулов соединений для подбора DB_POOL_* по данным"""
+    from database import (
+        engine, async_engine, replica_engines, pool_status, sync_pool_stats, async_pool_stats, replica_pool_stats
+    )
+    
+    return {
+        "async": pool_status(async_engine.sync_engine, async_pool_stats),
+        "sync": pool_status(engine, sync_pool_stats),
+        "replicas": [
+            pool_status(replica.sync_engine, stats) for replica, stats in zip(replica_engines, replica_pool_stats)
+        ],
+        "requests": rate_limiter.stats()
+    }
+
+@app.get("/api/debug/cache")
+async def debug_cache():
+    """Debug endpoint: попадания/промахи кэша профилей и балансов"""
+    return cache.stats()
+
 @app.post("/api/promo/activate")
 async def activate_promo_code(
     code: str,
     user_id: int,
-    db: Session = Depends(get_db)
+    idempotency_key: Optional[str] = Header(default=None),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Активация промокода"""
-    # Ищем промокод
-    promo = db.query(PromoCode).filter(PromoCode.code == code.upper()).first()
+    async def activate():
+        try:
+            result = await promo.activate_promo(db, code, user_id)
+        except promo.PromoError as e:
+            metrics.PROMO_ACTIVATIONS.labels(type(e).__name__).inc()
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        metrics.PROMO_ACTIVATIONS.labels("ok").inc()
+        return result
     
-    if not promo:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Promo code not found"
-        )
-    
-    if promo.is_used:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Promo code already used"
-        )
-    
-    # Находим или создаем пользователя
-    user = db.query(User).filter(User.user_id == user_id).first()
-    if not user:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    # Пополняем баланс TON
-    user.balance_ton += promo.amount
-    
-    # Создаем транзакцию
-    from datetime import datetime
-    transaction = Transaction(
-        user_id=user_id,
-        transaction_type='deposit',
-        amount=promo.amount,
-        currency='TON',
-        status='completed',
-        tx_hash=f"PROMO_{code}"
-    )
-    db.add(transaction)
-    db.commit()
-    db.refresh(transaction)
-    
-    # Отмечаем промокод как использованный
-    promo.is_used = True
-    promo.user_id = user_id
-    promo.used_at = datetime.utcnow()
-    promo.transaction_id = transaction.id
-    db.commit()
-    
-    return {
-        "success": True,
-        "amount": promo.amount,
-        "new_balance": user.balance_ton
-    }
+    return await _idempotent(db, user_id, idempotency_key, "promo", {"code": code.upper()}, activate)
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Метрики в формате Prometheus"""
+    body, content_type = metrics.render()
+    return Response(body, media_type=content_type)
 
 @app.get("/health")
 async def health():
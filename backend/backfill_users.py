@@ -0,0 +1,84 @@
+"""
+Бэкфилл пользователей из NDJSON-файла (выгрузка из Telegram, старой БД и т.п.)
+Одна запись на строку: {"user_id": 123, "username": "...", "first_name": "...",
+"last_name": "...", "is_premium": true, "wallet_address": "..."}; обязателен только user_id.
+Новые пользователи создаются с нулевым балансом, у существующих обновляются
+только поля, заполненные в записи. Каждая пачка - INSERT ... ON CONFLICT пачками
+(users.bulk_upsert_users) и своя транзакция, поэтому прерванный бэкфилл можно
+просто запустить повторно.
+Запуск: python backfill_users.py users.ndjson [--batch-size 5000]
+        (или "-" для чтения из stdin; использует DATABASE_URL, как и API)
+"""
+import sys
+import json
+import asyncio
+import argparse
+from itertools import islice
+
+from database import AsyncSessionLocal, init_db
+import users
+
+BATCH_SIZE = 5000
+STRING_FIELDS = ('wallet_address', 'username', 'first_name', 'last_name')
+
+
+class InvalidRecord(ValueError):
+    """Строка NDJSON не является корректной записью пользователя"""
+
+
+def parse_record(line_number: int, line) -> dict:
+    """Строка NDJSON -> поля для bulk_upsert_users; отсутствующие поля не попадают в запись"""
+    try:
+        data = json.loads(line)
+        record = {'user_id': int(data['user_id'])}
+    except (ValueError, TypeError, KeyError) as e:
+        raise InvalidRecord(f"line {line_number}: {e!r}") from e
+    for field in STRING_FIELDS:
+        if data.get(field) is not None:
+            record[field] = str(data[field])
+    if data.get('is_premium') is not None:
+        if not isinstance(data['is_premium'], bool):
+            raise InvalidRecord(f"line {line_number}: is_premium must be true or false")
+        record['is_premium'] = data['is_premium']
+    return record
+
+
+async def backfill(stream, batch_size: int) -> int:
+    total = 0
+    line_number = 0
+    while True:
+        lines = list(islice(stream, batch_size))
+        if not lines:
+            return total
+        records = [
+            parse_record(line_number + offset, line)
+            for offset, line in enumerate(lines, start=1)
+            if line.strip()
+        ]
+        line_number += len(lines)
+        async with AsyncSessionLocal() as db:
+            total += await users.bulk_upsert_users(db, records)
+        print(f"👥 [USERS] {line_number} lines, {total} users upserted")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-register users from NDJSON records")
+    parser.add_argument("path", help='NDJSON file or "-" for stdin')
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    init_db()
+    try:
+        if args.path == "-":
+            total = asyncio.run(backfill(sys.stdin, args.batch_size))
+        else:
+            with open(args.path, encoding="utf-8") as stream:
+                total = asyncio.run(backfill(stream, args.batch_size))
+    except InvalidRecord as e:
+        print(f"❌ [USERS] {e}")
+        sys.exit(1)
+    print(f"✅ [USERS] Done: {total} users")
+
+
+if __name__ == "__main__":
+    main()
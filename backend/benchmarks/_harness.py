@@ -0,0 +1,89 @@
+"""
+Общие утилиты для бенчмарков бэкенда
+Бенчмарки запускаются из директории backend: python benchmarks/<имя>.py
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import statistics
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Модули бэкенда импортируются плоско (from database import ...), как в app.py
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+
+def use_temp_sqlite() -> str:
+    """Направляет бэкенд во временную SQLite БД. Вызывать до импорта database/app"""
+    path = os.path.join(tempfile.mkdtemp(prefix="capsule-bench-"), "bench.sqlite3")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    return path
+
+
+def add_sqlite_latency(sync_engine, seconds: float):
+    """
+    Имитирует сетевую задержку до сервера БД: каждый SQL-запрос SQLite
+    выполняется на seconds дольше. Задержка возникает в потоке драйвера,
+    поэтому для aiosqlite она не блокирует event loop - как у asyncpg.
+    """
+    from sqlalchemy import event
+
+    def _sleep(_statement):
+        time.sleep(seconds)
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        raw = getattr(dbapi_connection, "driver_connection", dbapi_connection)
+        # aiosqlite.Connection хранит исходное sqlite3-соединение в _conn
+        raw = getattr(raw, "_conn", raw)
+        raw.set_trace_callback(_sleep)
+
+
+def percentile(values, pct: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def run_concurrent(send, total: int, concurrency: int):
+    """
+    Выполняет total вызовов корутины send(i) не более чем по concurrency одновременно.
+    Возвращает (список задержек в секундах, общее время, список результатов).
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def _one(i):
+        async with semaphore:
+            started = time.perf_counter()
+            result = await send(i)
+            latencies.append(time.perf_counter() - started)
+            return result
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(_one(i) for i in range(total)))
+    return latencies, time.perf_counter() - started, results
+
+
+def summarize(name: str, latencies, elapsed: float) -> dict:
+    """Печатает и возвращает сводку: RPS и p50/p95/p99 в миллисекундах"""
+    summary = {
+        "name": name,
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+    }
+    print(
+        f"{name:<40} {summary['rps']:>9} req/s  "
+        f"p50={summary['p50_ms']}ms p95={summary['p95_ms']}ms p99={summary['p99_ms']}ms"
+    )
+    return summary
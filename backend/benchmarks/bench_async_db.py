@@ -0,0 +1,77 @@
+"""
+Бенчмарк: пропускная способность при конкурентных запросах до и после
+перевода обработчиков на асинхронную сессию БД.
+
+"До" - исходный обработчик: async def + синхронная Session, каждый запрос
+к БД блокирует event loop. "После" - реальный GET /api/user/{user_id}
+на AsyncSession. Сетевая задержка до БД имитируется через --latency-ms.
+
+Запуск: python benchmarks/bench_async_db.py [--requests 400] [--concurrency 10]
+
+При concurrency больше размера пула (5 + 10 overflow) исходный обработчик
+ждет свободное соединение прямо в event loop и зависает до pool_timeout -
+это та же проблема, которую решает переход на AsyncSession.
+"""
+import argparse
+import asyncio
+
+from _harness import use_temp_sqlite, add_sqlite_latency, run_concurrent, summarize
+
+use_temp_sqlite()
+
+import httpx
+from fastapi import Depends, HTTPException
+from sqlalchemy.orm import Session
+
+import database
+from database import get_db, init_db, SessionLocal
+from models import User
+from schemas import UserResponse
+from app import app
+
+USER_ID = 1000001
+
+
+@app.get("/bench/legacy/user/{user_id}", response_model=UserResponse)
+async def legacy_get_user(user_id: int, db: Session = Depends(get_db)):
+    """Исходная реализация get_user на синхронной сессии"""
+    user = db.query(User).filter(User.user_id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
+
+
+async def bench(path: str, name: str, total: int, concurrency: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def send(_):
+            response = await client.get(path)
+            assert response.status_code == 200, response.text
+        latencies, elapsed, _ = await run_concurrent(send, total, concurrency)
+    return summarize(name, latencies, elapsed)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    init_db()
+    with SessionLocal() as db:
+        db.add(User(user_id=USER_ID, balance_ton=10.0, balance_stars=0))
+        db.commit()
+
+    latency = args.latency_ms / 1000
+    add_sqlite_latency(database.engine, latency)
+    add_sqlite_latency(database.async_engine.sync_engine, latency)
+
+    print(f"requests={args.requests} concurrency={args.concurrency} db_latency={args.latency_ms}ms")
+    before = await bench(f"/bench/legacy/user/{USER_ID}", "before: sync Session", args.requests, args.concurrency)
+    after = await bench(f"/api/user/{USER_ID}", "after: AsyncSession", args.requests, args.concurrency)
+    print(f"speedup: x{after['rps'] / before['rps']:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+"""
+Бенчмарк: сверка платежей через POST /api/deposits/bulk против отдельных
+вызовов POST /deposit.
+
+--records пополнений для --users пользователей загружаются сначала по одному
+HTTP-запросу на пополнение, затем (с другими tx_hash) одним NDJSON-запросом.
+Повторная загрузка того же NDJSON должна ничего не добавить. Затем --racers
+одинаковых NDJSON-запросов идут одновременно с POST /deposit тех же tx_hash:
+каждый хеш должен зачислиться ровно один раз. После прогона проверяется, что
+балансы пользователей равны сумме пополнений.
+
+Запуск: python benchmarks/bench_bulk_deposits.py [--records 2000] [--users 200]
+"""
+import os
+import json
+import time
+import argparse
+import asyncio
+
+from _harness import use_temp_sqlite, run_concurrent, summarize
+
+use_temp_sqlite()
+os.environ["ADMIN_API_TOKEN"] = "bench"
+
+import httpx
+from sqlalchemy import func, select
+
+import ledger
+from database import init_db, SessionLocal
+from models import Transaction
+from app import app
+
+FIRST_USER_ID = 6000001
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--amount", type=float, default=0.25)
+    parser.add_argument("--racers", type=int, default=4, help="concurrent duplicate bulk uploads")
+    parser.add_argument("--racing-singles", type=int, default=50, help="POST /deposit racing the bulk uploads")
+    args = parser.parse_args()
+
+    init_db()
+
+    def record(prefix, i):
+        return {
+            "user_id": FIRST_USER_ID + i % args.users, "amount": args.amount,
+            "currency": "TON", "tx_hash": f"{prefix}-{i}"
+        }
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        async def single(i):
+            data = record("single", i)
+            response = await client.post(f"/api/user/{data.pop('user_id')}/deposit", json=data)
+            assert response.status_code == 200, response.text
+
+        latencies, elapsed, _ = await run_concurrent(single, args.records, args.concurrency)
+        before = summarize(f"{args.records} x POST /deposit", latencies, elapsed)
+
+        async def bulk(prefix):
+            response = await client.post(
+                "/api/deposits/bulk", content="\n".join(json.dumps(record(prefix, i)) for i in range(args.records)),
+                headers={"Content-Type": "application/x-ndjson", "X-Admin-Token": "bench"}
+            )
+            assert response.status_code == 200, response.text
+            return response.json()
+
+        timings = []
+        for attempt in range(2):
+            started = time.perf_counter()
+            result = await bulk("bulk")
+            timings.append(time.perf_counter() - started)
+            print(f"  bulk attempt {attempt + 1}: {result} in {timings[-1] * 1000:.1f}ms")
+
+        # Одинаковые загрузки и отдельные пополнения тех же tx_hash одновременно
+        async def racing_single(i):
+            data = record("race", i)
+            response = await client.post(f"/api/user/{data.pop('user_id')}/deposit", json=data)
+            assert response.status_code in (200, 409), response.text
+            return response.status_code == 200
+
+        results = await asyncio.gather(
+            *[bulk("race") for _ in range(args.racers)],
+            *[racing_single(i) for i in range(min(args.racing_singles, args.records))]
+        )
+        bulk_inserted = sum(result["inserted"] for result in results[:args.racers])
+        singles_inserted = sum(results[args.racers:])
+        print(f"  {args.racers} racing bulk uploads inserted {bulk_inserted}, racing POST /deposit {singles_inserted}")
+        assert bulk_inserted + singles_inserted == args.records, "racing uploads credited a tx_hash twice"
+
+    bulk_rps = args.records / timings[0]
+    print(f"{'1 x POST /api/deposits/bulk':<40} {bulk_rps:>9.1f} records/s")
+    print(f"bulk ingestion throughput: x{bulk_rps / before['rps']:.1f}")
+
+    with SessionLocal() as db:
+        transactions = db.scalar(select(func.count()).select_from(Transaction))
+        balances = db.execute(
+            select(Transaction.user_id, func.sum(Transaction.ledger_amount)).group_by(Transaction.user_id)
+        ).all()
+    expected = {}
+    for i in range(args.records):
+        user_id = FIRST_USER_ID + i % args.users
+        expected[user_id] = expected.get(user_id, 0) + 3 * ledger.to_minor(args.amount)
+    print(f"  transactions={transactions} users={len(balances)}")
+    assert transactions == 3 * args.records, "duplicate or missing deposits"
+    assert dict(balances) == expected, "balance mismatch"
+    print("  invariants hold")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
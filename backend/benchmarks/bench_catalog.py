@@ -0,0 +1,119 @@
+"""
+Бенчмарк каталога подарков: GET /api/catalog против загрузки всего gifts.json.
+
+Сейчас мини-апп скачивает весь gifts.json и фильтрует его на телефоне;
+/api/catalog отдает одну страницу из индекса в памяти (catalog.py).
+Для набора типичных запросов (без фильтров, коллекция, фон + диапазон цен,
+сортировки по цене) сравниваются:
+- байты ответа: страница против всего файла;
+- время запроса через API (ASGITransport, в процессе);
+- время выборки в catalog.py (движок CATALOG_ENGINE) против построчного прохода по словарям gifts.json.
+
+Запуск: python benchmarks/bench_catalog.py [--repeat 200] [--limit 15]
+"""
+import os
+import time
+import json
+import random
+import asyncio
+import argparse
+import statistics
+
+from _harness import use_temp_sqlite
+
+use_temp_sqlite()
+
+import httpx
+
+import catalog
+from app import app
+
+
+def dict_scan(listings, filters, min_price, max_price, sort, limit):
+    """То же, что фронтенд: фильтр по всем строкам, сортировка всех совпадений, срез"""
+    wanted = {attribute: {catalog.normalize(value) for value in values} for attribute, values in filters.items() if values}
+    result = []
+    for listing in listings:
+        if any(not listing.get(a) or catalog.normalize(listing[a]) not in values for a, values in wanted.items()):
+            continue
+        price = listing["price_ton_discounted"] or 0
+        if (min_price is not None and price < min_price) or (max_price is not None and price > max_price):
+            continue
+        result.append(listing)
+    if sort in catalog.PRICE_SORTS:
+        result.sort(key=lambda listing: catalog.PRICE_SORTS[sort] * (listing["price_ton_discounted"] or 0))
+    return [catalog.to_preview(listing) for listing in result[:limit]]
+
+
+def timed(function, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=15, help="page size (the mini app loads 15 at a time)")
+    args = parser.parse_args()
+
+    with open(catalog.CATALOG_PATH, encoding="utf-8") as stream:
+        listings = json.load(stream)
+    file_bytes = os.path.getsize(catalog.CATALOG_PATH)
+    started = time.perf_counter()
+    store = catalog.get_catalog()
+    print(f"listings={len(store)} file={file_bytes / 1024:.0f}KB load={(time.perf_counter() - started) * 1000:.1f}ms")
+
+    rng = random.Random(1)
+    sample = rng.choice(listings)
+    queries = {
+        "no filters": ({}, None, None, "latest"),
+        "collection": ({"collection": [sample["collection"]]}, None, None, "latest"),
+        "backdrop + price": ({"backdrop": [sample["backdrop"]]}, 1.0, 50.0, "price-low"),
+        "price range, price-high": ({}, 5.0, 20.0, "price-high"),
+        "3 symbols, id-asc": ({"symbol": [rng.choice(listings)["symbol"] for _ in range(3)]}, None, None, "id-asc"),
+    }
+
+    async def api_timings():
+        transport = httpx.ASGITransport(app=app)
+        results = {}
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, (filters, min_price, max_price, sort) in queries.items():
+                params = {**filters, "sort": sort, "limit": args.limit}
+                if min_price is not None:
+                    params["min_price"] = min_price
+                if max_price is not None:
+                    params["max_price"] = max_price
+                samples, size = [], 0
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    response = await client.get("/api/catalog", params=params)
+                    samples.append(time.perf_counter() - started)
+                    assert response.status_code == 200, response.text
+                    size = len(response.content)
+                results[name] = (statistics.median(samples) * 1000, size)
+        return results
+
+    api = asyncio.run(api_timings())
+    print(f"\n{'query':<26}{'page bytes':>12}{'vs file':>10}{'API p50':>11}{'catalog':>11}{'dict scan':>12}")
+    for name, (filters, min_price, max_price, sort) in queries.items():
+        page, _ = store.query(filters, min_price, max_price, sort, None, args.limit)
+        if sort in ("latest",) + tuple(catalog.PRICE_SORTS):
+            # Порядок id-asc фронтенд считает отдельно; сверяем только совпадающие сортировки
+            assert [item["price"] for item in page] == [
+                item["price"] for item in dict_scan(listings, filters, min_price, max_price, sort, args.limit)
+            ], name
+        index_us = timed(lambda: store.query(filters, min_price, max_price, sort, None, args.limit), args.repeat)
+        scan_us = timed(lambda: dict_scan(listings, filters, min_price, max_price, sort, args.limit), args.repeat)
+        api_ms, size = api[name]
+        print(
+            f"{name:<26}{size:>12}{file_bytes / max(size, 1):>9.0f}x{api_ms:>9.2f}ms"
+            f"{index_us:>9.0f}us{scan_us:>10.0f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
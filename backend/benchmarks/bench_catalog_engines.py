@@ -0,0 +1,117 @@
+"""
+Бенчмарк движков каталога на 1k, 100k и 1M листингов: время одного запроса.
+
+- dict scan - построчный проход по словарям gifts.json (как фильтрует мини-апп):
+  проверка атрибутов и цены, сортировка всех совпадений, срез страницы;
+- index - catalog.Catalog: множества позиций и порядки на чистом Python;
+- numpy - catalog.ColumnarCatalog: колонки float64/int32, булевы маски, argsort.
+
+Листинги больше 1k - копии строк gifts.json с новыми id и случайной ценой.
+Время - медиана; для каждого запроса сверяется, что все движки вернули одну страницу.
+
+Запуск: python benchmarks/bench_catalog_engines.py [--sizes 1000,100000,1000000] [--limit 15]
+"""
+import gc
+import json
+import time
+import random
+import argparse
+import statistics
+from functools import lru_cache
+
+import _harness  # noqa: F401 - путь к модулям бэкенда
+
+import catalog
+
+if not catalog.HAS_NUMPY:
+    raise SystemExit("numpy is not installed: pip install numpy")
+
+normalize = lru_cache(maxsize=None)(catalog.normalize)
+
+
+def dict_scan(listings, filters, min_price, max_price, sort, limit):
+    wanted = {attribute: {normalize(value) for value in values} for attribute, values in filters.items() if values}
+    result = []
+    for listing in listings:
+        if any(not listing.get(a) or normalize(listing[a]) not in values for a, values in wanted.items()):
+            continue
+        price = listing["price_ton_discounted"] or 0
+        if (min_price is not None and price < min_price) or (max_price is not None and price > max_price):
+            continue
+        result.append(listing)
+    if sort in catalog.PRICE_SORTS:
+        result.sort(key=lambda listing: catalog.PRICE_SORTS[sort] * (listing["price_ton_discounted"] or 0))
+    return [catalog.to_preview(listing) for listing in result[:limit]]
+
+
+def synthesize(listings, size: int, rng: random.Random):
+    if size <= len(listings):
+        return listings[:size]
+    return [
+        dict(rng.choice(listings), id=str(i), price_ton_discounted=round(rng.uniform(0.5, 100.0), 1))
+        for i in range(size)
+    ]
+
+
+def timed(function, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    parser.add_argument("--limit", type=int, default=15)
+    parser.add_argument("--repeat", type=int, default=50, help="repeats at 1k; fewer on larger catalogs")
+    args = parser.parse_args()
+
+    with open(catalog.CATALOG_PATH, encoding="utf-8") as stream:
+        source = json.load(stream)
+    rng = random.Random(1)
+    sample = rng.choice(source)
+    queries = {
+        "no filters": ({}, None, None, "latest"),
+        "collection": ({"collection": [sample["collection"]]}, None, None, "latest"),
+        "backdrop + price": ({"backdrop": [sample["backdrop"]]}, 1.0, 50.0, "price-low"),
+        "collection + price-high": ({"collection": [sample["collection"]]}, 5.0, 20.0, "price-high"),
+        "3 symbols + model": (
+            {"symbol": [rng.choice(source)["symbol"] for _ in range(3)], "model": [sample["model"]]}, None, None, "latest"
+        ),
+    }
+
+    for size in (int(value) for value in args.sizes.split(",")):
+        listings = synthesize(source, size, rng)
+        started = time.perf_counter()
+        index = catalog.Catalog(listings)
+        index_build = time.perf_counter() - started
+        started = time.perf_counter()
+        columnar = catalog.ColumnarCatalog(listings)
+        columnar_build = time.perf_counter() - started
+        repeat = max(3, args.repeat * 1000 // size)
+        print(
+            f"\nlistings={len(columnar)} build: index={index_build:.2f}s numpy={columnar_build:.2f}s repeat={repeat}"
+        )
+        print(f"{'query':<26}{'dict scan':>12}{'index':>11}{'numpy':>11}{'numpy vs scan':>15}")
+        for name, (filters, min_price, max_price, sort) in queries.items():
+            expected = columnar.query(filters, min_price, max_price, sort, None, args.limit)[0]
+            assert index.query(filters, min_price, max_price, sort, None, args.limit)[0] == expected, name
+            if sort != "latest" or size <= len(source):
+                # Без дубликатов порядок "latest" у scan тот же; на копиях сверяем только цены
+                scanned = dict_scan(listings, filters, min_price, max_price, sort, args.limit)
+                assert [item["price"] for item in scanned] == [item["price"] for item in expected], name
+            scan_ms = timed(lambda: dict_scan(listings, filters, min_price, max_price, sort, args.limit), repeat)
+            index_ms = timed(lambda: index.query(filters, min_price, max_price, sort, None, args.limit), repeat * 4)
+            numpy_ms = timed(lambda: columnar.query(filters, min_price, max_price, sort, None, args.limit), repeat * 4)
+            print(
+                f"{name:<26}{scan_ms:>10.2f}ms{index_ms:>9.3f}ms{numpy_ms:>9.3f}ms{scan_ms / numpy_ms:>14.0f}x"
+            )
+        del listings, index, columnar
+        gc.collect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Бенчмарк: покупка корзины одним POST /checkout против N последовательных
+POST /purchase.
+
+--carts пользователей покупают по --cart-size подарков: сначала по одному
+подарку за запрос, затем (другим набором подарков) одной корзиной. Сетевая
+задержка до БД имитируется через --latency-ms. После прогона проверяется,
+что у каждого пользователя куплены все подарки, а баланс списан ровно на их сумму.
+
+Запуск: python benchmarks/bench_checkout.py [--carts 20] [--cart-size 10]
+"""
+import argparse
+import asyncio
+
+from _harness import use_temp_sqlite, add_sqlite_latency, run_concurrent, summarize
+
+use_temp_sqlite()
+
+import httpx
+from sqlalchemy import func, select
+
+import database
+import ledger
+from database import init_db, SessionLocal
+from models import User, UserGift, Transaction
+from app import app
+
+FIRST_USER_ID = 5000001
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--carts", type=int, default=20)
+    parser.add_argument("--cart-size", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--price", type=float, default=1.5)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    init_db()
+    balance = 2 * args.cart_size * args.price
+    with SessionLocal() as db:
+        for i in range(args.carts):
+            db.add(User(user_id=FIRST_USER_ID + i, balance_ton=0.0, balance_stars=0))
+            db.add(Transaction(
+                user_id=FIRST_USER_ID + i, transaction_type='deposit', amount=balance, currency='TON',
+                ledger_amount=ledger.to_minor(balance)
+            ))
+        db.commit()
+
+    latency = args.latency_ms / 1000
+    add_sqlite_latency(database.async_engine.sync_engine, latency)
+
+    def gift(prefix, n):
+        return {"gift_id": f"{prefix}-{n}", "gift_name": "Bench Gift", "gift_price": args.price}
+
+    print(f"carts={args.carts} cart_size={args.cart_size} concurrency={args.concurrency} db_latency={args.latency_ms}ms")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def sequential(i):
+            for n in range(args.cart_size):
+                response = await client.post(f"/api/user/{FIRST_USER_ID + i}/purchase", json=gift("single", n))
+                assert response.status_code == 200, response.text
+
+        async def cart(i):
+            response = await client.post(
+                f"/api/user/{FIRST_USER_ID + i}/checkout",
+                json={"items": [gift("cart", n) for n in range(args.cart_size)]}
+            )
+            assert response.status_code == 200, response.text
+
+        before_latencies, before_elapsed, _ = await run_concurrent(sequential, args.carts, args.concurrency)
+        after_latencies, after_elapsed, _ = await run_concurrent(cart, args.carts, args.concurrency)
+
+    before = summarize(f"{args.cart_size} x POST /purchase (per cart)", before_latencies, before_elapsed)
+    after = summarize("1 x POST /checkout (per cart)", after_latencies, after_elapsed)
+    if before["rps"]:
+        print(f"checkout throughput: x{after['rps'] / before['rps']:.1f}")
+
+    with SessionLocal() as db:
+        gifts = db.scalar(select(func.count()).select_from(UserGift))
+        remaining = ledger.from_minor(db.scalar(select(func.sum(Transaction.ledger_amount))))
+    print(f"  gifts={gifts} remaining_balance={remaining}")
+    assert gifts == 2 * args.carts * args.cart_size, "gift count mismatch"
+    assert abs(remaining) < 1e-9, "balance drift"
+    print("  invariants hold")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
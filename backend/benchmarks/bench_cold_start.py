@@ -0,0 +1,132 @@
+"""
+Бенчмарк холодного старта: время импорта app.py и время до первого ответа.
+
+Каждый замер - новый процесс:
+- import app: python -c "import app" (engine, драйверы БД и redis не должны грузиться);
+- первый ответ: от запуска uvicorn до первого ответа GET /api/user/{id}/balance
+  (запрос к БД), в трех режимах:
+  * fresh - пустая БД, при старте применяются все миграции;
+  * warm - схема актуальна (обычный редеплой): только чтение версии схемы;
+  * no-migrate - MIGRATE_ON_STARTUP=false, старт не трогает БД.
+--latency-ms добавляет задержку к каждому SQL-запросу (как сеть до PostgreSQL на
+Railway): локальная SQLite отвечает мгновенно и прячет лишние запросы при старте.
+--app-dir позволяет прогнать те же замеры на другой копии backend
+(например, git worktree старого коммита) и сравнить.
+
+Запуск: python benchmarks/bench_cold_start.py [--runs 5] [--latency-ms 10] [--app-dir ../old/backend]
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+from _harness import BACKEND_DIR
+
+import httpx
+
+# Результат пишется в stderr: stdout занят логами приложения
+IMPORT_SNIPPET = (
+    "import sys, time; started = time.perf_counter(); import app; "
+    "print(time.perf_counter() - started, file=sys.stderr); "
+    "print(','.join(name for name in ('aiosqlite', 'asyncpg', 'psycopg2', 'redis') if name in sys.modules), "
+    "file=sys.stderr)"
+)
+
+
+# uvicorn с задержкой SQL на всех движках процесса (движки могут создаваться лениво)
+SERVER_SNIPPET = (
+    "import sys; sys.path.insert(0, sys.argv[1]); "
+    "from sqlalchemy.engine import Engine; from _harness import add_sqlite_latency; "
+    "add_sqlite_latency(Engine, float(sys.argv[2])); "
+    "import uvicorn; uvicorn.run('app:app', host='127.0.0.1', port=int(sys.argv[3]), log_level='warning')"
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(app_dir: str, env: dict):
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET], cwd=app_dir, env=env, capture_output=True, text=True, check=True
+    )
+    seconds, _, loaded = result.stderr.partition("\n")
+    return float(seconds), loaded.strip()
+
+
+def time_to_first_response(app_dir: str, env: dict, latency: float, timeout: float = 60.0) -> float:
+    """Секунды от запуска uvicorn до первого ответа эндпоинта, читающего БД"""
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/api/user/1/balance"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-c", SERVER_SNIPPET, os.path.dirname(os.path.abspath(__file__)), str(latency), str(port)],
+        cwd=app_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        with httpx.Client(timeout=5.0) as client:
+            while time.perf_counter() - started < timeout:
+                if server.poll() is not None:
+                    raise RuntimeError(f"server exited with code {server.returncode}")
+                try:
+                    response = client.get(url)
+                except httpx.TransportError:
+                    time.sleep(0.005)
+                    continue
+                assert response.status_code in (200, 404), response.text
+                return time.perf_counter() - started
+        raise RuntimeError("server did not answer")
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def report(name: str, values):
+    print(
+        f"{name:<42} median={statistics.median(values) * 1000:8.1f}ms "
+        f"min={min(values) * 1000:8.1f}ms max={max(values) * 1000:8.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency-ms", type=float, default=10.0)
+    parser.add_argument("--app-dir", default=BACKEND_DIR, help="backend directory to measure")
+    args = parser.parse_args()
+    app_dir = os.path.abspath(args.app_dir)
+    latency = args.latency_ms / 1000
+
+    env = dict(os.environ, LOG_LEVEL="ERROR")
+    print(f"app_dir={app_dir} runs={args.runs} db_latency={args.latency_ms}ms")
+
+    db_dir = tempfile.mkdtemp(prefix="capsule-bench-")
+    env["DATABASE_URL"] = f"sqlite:///{os.path.join(db_dir, 'import.sqlite3')}"
+    imports = [measure_import(app_dir, env) for _ in range(args.runs)]
+    report("import app", [seconds for seconds, _ in imports])
+    print(f"  loaded at import: {imports[-1][1] or 'no DB drivers, no redis'}")
+
+    fresh = []
+    for run in range(args.runs):
+        env["DATABASE_URL"] = f"sqlite:///{os.path.join(db_dir, f'fresh{run}.sqlite3')}"
+        fresh.append(time_to_first_response(app_dir, env, latency))
+    report("first response (fresh, migrations)", fresh)
+
+    # Последняя fresh-БД уже мигрирована
+    warm = [time_to_first_response(app_dir, env, latency) for _ in range(args.runs)]
+    report("first response (warm, schema current)", warm)
+
+    no_migrate = [
+        time_to_first_response(app_dir, dict(env, MIGRATE_ON_STARTUP="false"), latency) for _ in range(args.runs)
+    ]
+    report("first response (MIGRATE_ON_STARTUP=false)", no_migrate)
+
+
+if __name__ == "__main__":
+    main()
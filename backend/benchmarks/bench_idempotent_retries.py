@@ -0,0 +1,84 @@
+"""
+Бенчмарк: повторы пополнений с Idempotency-Key.
+
+Клиент отправляет --deposits пополнений и повторяет каждое --retries раз с тем же
+ключом. Печатает задержки первых запросов и повторов (из LRU процесса и из
+таблицы). После прогона проверяется, что на каждый ключ создана ровно одна
+транзакция, а баланс равен сумме пополнений.
+
+Запуск: python benchmarks/bench_idempotent_retries.py [--deposits 100] [--retries 4]
+"""
+import argparse
+import asyncio
+from collections import Counter
+
+from _harness import use_temp_sqlite, run_concurrent, summarize
+
+use_temp_sqlite()
+
+import httpx
+from sqlalchemy import func, select
+
+import ledger
+import idempotency
+from database import init_db, SessionLocal
+from models import User, Transaction
+from app import app
+
+USER_ID = 4000001
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--deposits", type=int, default=100)
+    parser.add_argument("--retries", type=int, default=4)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--amount", type=float, default=0.1)
+    args = parser.parse_args()
+
+    init_db()
+    with SessionLocal() as db:
+        db.add(User(user_id=USER_ID, balance_ton=0.0, balance_stars=0))
+        db.commit()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def deposit(i):
+            response = await client.post(
+                f"/api/user/{USER_ID}/deposit",
+                json={"amount": args.amount, "tx_hash": f"bench-{i}"},
+                headers={idempotency.HEADER: f"deposit-{i}"}
+            )
+            return response.status_code, response.headers.get(idempotency.REPLAYED_HEADER) == "true"
+
+        latencies, elapsed, first = await run_concurrent(deposit, args.deposits, args.concurrency)
+        summarize("first attempts (executed)", latencies, elapsed)
+        # Повторы: сначала из LRU процесса, затем после его сброса - из таблицы
+        latencies, elapsed, retries = await run_concurrent(
+            lambda i: deposit(i % args.deposits), args.deposits * args.retries, args.concurrency
+        )
+        summarize("retries (replayed from LRU)", latencies, elapsed)
+        idempotency._responses.clear()
+        latencies, elapsed, table_retries = await run_concurrent(deposit, args.deposits, args.concurrency)
+        summarize("retries (replayed from table)", latencies, elapsed)
+
+    outcomes = Counter(first + retries + table_retries)
+    for (code, replayed), count in sorted(outcomes.items()):
+        print(f"  {code} {'replayed' if replayed else 'executed'}: {count}")
+
+    with SessionLocal() as db:
+        transactions = db.scalar(select(func.count()).select_from(Transaction).where(Transaction.user_id == USER_ID))
+        balance = ledger.from_minor(db.scalar(
+            select(func.sum(Transaction.ledger_amount)).where(Transaction.user_id == USER_ID)
+        ))
+
+    executed = outcomes[(200, False)]
+    print(f"  executed={executed} transactions={transactions} balance={balance}")
+    assert executed == transactions == args.deposits, "deposit executed more or less than once per key"
+    assert sum(outcomes.values()) == outcomes[(200, False)] + outcomes[(200, True)], "unexpected error responses"
+    assert balance == ledger.from_minor(args.deposits * ledger.to_minor(args.amount)), "balance mismatch"
+    print("  invariants hold")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,76 @@
+"""
+Стресс-тест: конкурентная активация промокодов.
+
+Для каждого из --codes промокодов одновременно отправляется --attempts
+активаций от разных пользователей. После прогона проверяется, что каждый
+код погашен ровно один раз: одна успешная активация, одна транзакция и
+суммарный баланс пользователей равен сумме промокодов.
+
+Запуск: python benchmarks/bench_promo_redemption.py [--codes 20] [--attempts 10]
+"""
+import argparse
+import asyncio
+from collections import Counter
+
+from _harness import use_temp_sqlite, run_concurrent, summarize
+
+use_temp_sqlite()
+
+import httpx
+from sqlalchemy import func, select
+
+import ledger
+from database import init_db, SessionLocal
+from models import User, Transaction, PromoCode
+from app import app
+
+FIRST_USER_ID = 3000001
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--codes", type=int, default=20)
+    parser.add_argument("--attempts", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--amount", type=float, default=2.5)
+    args = parser.parse_args()
+
+    init_db()
+    with SessionLocal() as db:
+        db.add_all(User(user_id=FIRST_USER_ID + i, balance_ton=0.0, balance_stars=0) for i in range(args.attempts))
+        db.add_all(PromoCode(code=f"BENCH{i}", amount=args.amount) for i in range(args.codes))
+        db.commit()
+
+    total = args.codes * args.attempts
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def send(i):
+            # Попытки одного кода перемешаны с попытками других
+            code, attempt = f"bench{i % args.codes}", i // args.codes
+            response = await client.post(
+                "/api/promo/activate", params={"code": code, "user_id": FIRST_USER_ID + attempt}
+            )
+            return response.status_code, response.json().get("detail")
+
+        latencies, elapsed, results = await run_concurrent(send, total, args.concurrency)
+
+    summarize("concurrent promo activations", latencies, elapsed)
+    outcomes = Counter(results)
+    for (code, detail), count in sorted(outcomes.items(), key=lambda item: str(item[0])):
+        print(f"  {code} {detail or 'OK'}: {count}")
+
+    with SessionLocal() as db:
+        used = db.scalar(select(func.count()).select_from(PromoCode).where(PromoCode.is_used.is_(True)))
+        linked = db.scalar(select(func.count()).select_from(PromoCode).where(PromoCode.transaction_id.is_not(None)))
+        transactions = db.scalar(select(func.count()).select_from(Transaction))
+        credited = ledger.from_minor(db.scalar(select(func.sum(Transaction.ledger_amount))))
+
+    succeeded = sum(count for (code, _), count in outcomes.items() if code == 200)
+    print(f"  succeeded={succeeded} used={used} linked={linked} transactions={transactions} credited={credited}")
+    assert succeeded == used == linked == transactions == args.codes, "promo redeemed more or less than once"
+    assert abs(credited - args.codes * args.amount) < 1e-9, "credited amount mismatch"
+    print("  invariants hold")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
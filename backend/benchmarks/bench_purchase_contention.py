@@ -0,0 +1,89 @@
+"""
+Бенчмарк: конкурентные покупки одним пользователем.
+
+Одновременно отправляется --requests покупок разных подарков по --price TON
+(плюс повторы одного и того же подарка) пользователю с балансом --balance.
+После прогона проверяется, что баланс не ушел в минус, успешных покупок
+ровно столько, на сколько хватало баланса, а на каждую покупку есть ровно
+один подарок и одна транзакция.
+
+Запуск: python benchmarks/bench_purchase_contention.py [--requests 200] [--concurrency 50]
+"""
+import argparse
+import asyncio
+from collections import Counter
+
+from _harness import use_temp_sqlite, run_concurrent, summarize
+
+use_temp_sqlite()
+
+import httpx
+from sqlalchemy import func, select
+
+import ledger
+from database import init_db, SessionLocal
+from models import User, UserGift, Transaction
+from app import app
+
+USER_ID = 2000001
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--balance", type=float, default=50.0)
+    parser.add_argument("--price", type=float, default=1.0)
+    parser.add_argument("--duplicates", type=int, default=20)
+    args = parser.parse_args()
+
+    init_db()
+    with SessionLocal() as db:
+        db.add(User(user_id=USER_ID, balance_ton=0.0, balance_stars=0))
+        db.add(Transaction(
+            user_id=USER_ID, transaction_type='deposit', amount=args.balance, currency='TON',
+            ledger_amount=ledger.to_minor(args.balance)
+        ))
+        db.commit()
+
+    # Первые duplicates запросов покупают один и тот же подарок
+    def gift_id(i):
+        return "gift-dup" if i < args.duplicates else f"gift-{i}"
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def send(i):
+            response = await client.post(
+                f"/api/user/{USER_ID}/purchase",
+                json={"gift_id": gift_id(i), "gift_name": "Bench Gift", "gift_price": args.price}
+            )
+            return response.status_code, response.json().get("detail")
+
+        latencies, elapsed, results = await run_concurrent(send, args.requests, args.concurrency)
+
+    summarize("parallel purchases, one user", latencies, elapsed)
+    outcomes = Counter(results)
+    for (code, detail), count in sorted(outcomes.items(), key=lambda item: str(item[0])):
+        print(f"  {code} {detail or 'OK'}: {count}")
+
+    distinct_gifts = len({gift_id(i) for i in range(args.requests)})
+    expected = min(distinct_gifts, int(args.balance // args.price))
+    with SessionLocal() as db:
+        balance = ledger.from_minor(db.scalar(
+            select(func.sum(Transaction.ledger_amount)).where(Transaction.user_id == USER_ID)
+        ))
+        gifts = db.scalar(select(func.count()).select_from(UserGift).where(UserGift.user_id == USER_ID))
+        transactions = db.scalar(select(func.count()).select_from(Transaction).where(
+            Transaction.user_id == USER_ID, Transaction.transaction_type == 'purchase'
+        ))
+
+    succeeded = sum(count for (code, _), count in outcomes.items() if code == 200)
+    print(f"  succeeded={succeeded} expected={expected} balance={balance} gifts={gifts} transactions={transactions}")
+    assert balance >= 0, "balance went negative"
+    assert succeeded == gifts == transactions == expected, "purchase accounting mismatch"
+    assert abs(balance - (args.balance - expected * args.price)) < 1e-9, "balance drift"
+    print("  invariants hold")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
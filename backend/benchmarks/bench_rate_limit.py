@@ -0,0 +1,95 @@
+"""
+Бенчмарк: обычные пользователи читают /balance, пока один клиент долбит
+/balance с частотой --abuser-rps (--abuser-concurrency запросов одновременно,
+не дожидаясь освобождения сервера).
+
+Прогон без лимитов и с лимитами (--limit на пользователя для /balance и
+--max-concurrent на процесс). Сравниваются задержки обычных пользователей и
+проверяется, что лишние запросы нарушителя получают 429 с Retry-After, а
+обычные пользователи лимитов не замечают.
+
+Запуск: python benchmarks/bench_rate_limit.py [--limit 20:20] [--max-concurrent 30]
+"""
+import argparse
+import asyncio
+
+from _harness import use_temp_sqlite, add_sqlite_latency, run_concurrent, summarize
+
+use_temp_sqlite()
+
+import httpx
+
+import database
+import ratelimit
+from database import init_db
+from app import app, rate_limiter
+
+ABUSER_ID = 9000000
+FIRST_USER_ID = 9000001
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--reads", type=int, default=10, help="reads per regular user")
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--abuser-concurrency", type=int, default=40)
+    parser.add_argument("--abuser-rps", type=float, default=400)
+    parser.add_argument("--limit", default="20:20", help="rate:burst for GET /balance per user")
+    parser.add_argument("--max-concurrent", type=int, default=30)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    init_db()
+    add_sqlite_latency(database.async_engine.sync_engine, args.latency_ms / 1000)
+    limited_rules = ratelimit.parse_rules(f"GET /api/user/{{user_id}}/balance={args.limit}")
+
+    print(
+        f"users={args.users}x{args.reads} abuser={args.abuser_rps}rps/{args.abuser_concurrency} "
+        f"limit={args.limit} max_concurrent={args.max_concurrent} db_latency={args.latency_ms}ms"
+    )
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        loop = asyncio.get_running_loop()
+
+        async def run(name):
+            stop = asyncio.Event()
+            statuses = {}
+
+            interval = args.abuser_concurrency / args.abuser_rps
+
+            async def abuser():
+                while not stop.is_set():
+                    started = loop.time()
+                    response = await client.get(f"/api/user/{ABUSER_ID}/balance")
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+                    if response.status_code == 429:
+                        assert response.headers.get("Retry-After"), "429 without Retry-After"
+                    await asyncio.sleep(max(0.0, interval - (loop.time() - started)))
+
+            async def regular(i):
+                response = await client.get(f"/api/user/{FIRST_USER_ID + i % args.users}/balance")
+                assert response.status_code == 200, response.text
+
+            abusers = [asyncio.create_task(abuser()) for _ in range(args.abuser_concurrency)]
+            await asyncio.sleep(0.2)
+            latencies, elapsed, _ = await run_concurrent(regular, args.users * args.reads, args.concurrency)
+            stop.set()
+            await asyncio.gather(*abusers)
+            print(f"  abuser statuses: {dict(sorted(statuses.items()))}")
+            return summarize(f"regular /balance ({name})", latencies, elapsed), statuses
+
+        rate_limiter.rules, rate_limiter.max_concurrent = [], 0
+        before, _ = await run("no limits")
+        rate_limiter.rules, rate_limiter.max_concurrent = limited_rules, args.max_concurrent
+        after, statuses = await run("limited")
+
+    if after["p95_ms"]:
+        print(f"regular p95 improvement: x{before['p95_ms'] / after['p95_ms']:.1f}")
+    assert statuses.get(429, 0) > 0, "abuser was not rate limited"
+    print(f"  limiter: {rate_limiter.stats()}")
+    print("  invariants hold")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,84 @@
+"""
+Проверка маршрутизации чтений на реплики (DATABASE_REPLICA_URLS) на двух
+SQLite-файлах-репликах.
+
+Реплики - копии primary, снятые после наполнения, поэтому они "отстают"
+навсегда: по ответу видно, откуда он прочитан. Проверяется, что чтения идут на
+реплики по кругу, что после записи пользователь читает с primary (видит свой
+новый баланс) и что по истечении окна REPLICA_PIN_SECONDS он снова читает реплику.
+
+Запуск: python benchmarks/bench_replica_routing.py [--reads 200] [--pin-seconds 0.5]
+"""
+import os
+import time
+import shutil
+import argparse
+import asyncio
+
+from _harness import use_temp_sqlite, run_concurrent, summarize
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--reads", type=int, default=200)
+parser.add_argument("--concurrency", type=int, default=10)
+parser.add_argument("--pin-seconds", type=float, default=0.5)
+args = parser.parse_args()
+
+PRIMARY_PATH = use_temp_sqlite()
+REPLICA_PATHS = [PRIMARY_PATH.replace("bench.sqlite3", f"replica-{n}.sqlite3") for n in (1, 2)]
+os.environ["DATABASE_REPLICA_URLS"] = ",".join(f"sqlite:///{path}" for path in REPLICA_PATHS)
+os.environ["REPLICA_PIN_SECONDS"] = str(args.pin_seconds)
+
+import httpx
+
+import database
+from database import init_db
+from app import app
+
+USER_ID = 7000001
+READER_ID = 7000002
+
+
+async def main():
+    init_db()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def balance(user_id):
+            response = await client.get(f"/api/user/{user_id}/balance")
+            assert response.status_code == 200, response.text
+            return response.json()["balance_ton"]
+
+        for user_id in (USER_ID, READER_ID):
+            response = await client.post(f"/api/user/{user_id}/deposit", json={"amount": 10.0})
+            assert response.status_code == 200, response.text
+        # "Репликация": реплики получают копию primary и дальше не обновляются
+        await database.async_engine.dispose()
+        # В профиле wal свежие записи могут лежать в -wal файле: переносим их в основной
+        with database.engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        for path in REPLICA_PATHS:
+            shutil.copy(PRIMARY_PATH, path)
+        time.sleep(args.pin_seconds)
+
+        checkouts_before = [stats.checkouts for stats in database.replica_pool_stats]
+        latencies, elapsed, _ = await run_concurrent(lambda _: balance(READER_ID), args.reads, args.concurrency)
+        summarize("balance reads via replicas", latencies, elapsed)
+        per_replica = [
+            stats.checkouts - before for stats, before in zip(database.replica_pool_stats, checkouts_before)
+        ]
+        print(f"  reads per replica: {per_replica}")
+        assert sum(per_replica) == args.reads and min(per_replica) > 0, "reads were not spread over replicas"
+
+        response = await client.post(f"/api/user/{USER_ID}/deposit", json={"amount": 5.0})
+        assert response.status_code == 200, response.text
+        after_write = await balance(USER_ID)
+        time.sleep(args.pin_seconds)
+        after_window = await balance(USER_ID)
+
+    print(f"  balance right after write: {after_write} (primary), after pin window: {after_window} (stale replica)")
+    assert after_write == 15.0, "write was not visible right after it (read-your-writes)"
+    assert after_window == 10.0, "read did not return to the replica after the pin window"
+    print("  routing holds")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,129 @@
+"""
+Бенчмарк: сериализация списков подарков на 10, 1k и 10k строк.
+
+"orm+pydantic" - текущий путь FastAPI: ORM-объекты, построчная валидация
+UserGiftResponse (from_attributes) и кодирование stdlib json.
+"rows+orjson" - быстрый путь fastjson: кортежи колонок, словари и orjson.
+Время включает выборку из БД; отдельно показана доля сериализации.
+Перед замером проверяется, что ответы совпадают побайтно, в том числе для дат
+с часовым поясом (SQLite возвращает их без пояса, поэтому они проверяются отдельно).
+
+Запуск: python benchmarks/bench_serialization.py [--repeat 20]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from _harness import use_temp_sqlite
+
+use_temp_sqlite()
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import select, insert
+
+from database import init_db, SessionLocal, AsyncSessionLocal
+from models import User, UserGift
+from schemas import UserGiftResponse
+import fastjson
+
+# Даты, какими их возвращает asyncpg (UTC), с другим поясом и без пояса
+AWARE_DATES = (
+    datetime(2024, 5, 1, 12, 30, 15, tzinfo=timezone.utc),
+    datetime(2024, 5, 1, 12, 30, 15, 250_000, tzinfo=timezone.utc),
+    datetime(2024, 5, 1, 15, 30, 15, tzinfo=timezone(timedelta(hours=3))),
+    datetime(2024, 5, 1, 12, 30, 15),
+)
+
+SIZES = (10, 1_000, 10_000)
+gifts_adapter = TypeAdapter(List[UserGiftResponse])
+
+
+def seed():
+    with SessionLocal() as db:
+        for size in SIZES:
+            db.add(User(user_id=size, balance_ton=0.0, balance_stars=0))
+            db.execute(insert(UserGift), [
+                {
+                    "user_id": size, "gift_id": f"gift-{i}", "gift_name": f"Gift #{i}",
+                    "gift_preview": f"https://example.com/preview/{i}.png", "gift_price": 1.5 + i
+                }
+                for i in range(size)
+            ])
+        db.commit()
+
+
+async def orm_pydantic(user_id: int):
+    async with AsyncSessionLocal() as db:
+        gifts = (await db.scalars(select(UserGift).where(UserGift.user_id == user_id))).all()
+    started = time.perf_counter()
+    body = pydantic_body(gifts)
+    return body, time.perf_counter() - started
+
+
+async def rows_orjson(user_id: int):
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(select(*fastjson.GIFT_COLUMNS).where(UserGift.user_id == user_id))).all()
+    started = time.perf_counter()
+    body = fastjson.FastJSONResponse(fastjson.rows_to_dicts(rows, fastjson.GIFT_COLUMNS)).body
+    return body, time.perf_counter() - started
+
+
+def pydantic_body(gifts) -> bytes:
+    # Так сериализует FastAPI при response_model=List[UserGiftResponse] и JSONResponse
+    validated = gifts_adapter.validate_python(gifts, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def check_dates():
+    rows = [
+        ("gift-1", "Gift #1", None, 1.5, i + 1, 1, purchase_date)
+        for i, purchase_date in enumerate(AWARE_DATES)
+    ]
+    gifts = fastjson.rows_to_dicts(rows, fastjson.GIFT_COLUMNS)
+    fast_body = fastjson.FastJSONResponse(gifts).body
+    assert fast_body == pydantic_body(gifts), f"dates differ: {fast_body!r}"
+
+
+async def measure(func, user_id: int, repeat: int):
+    totals, serialization = [], []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _, spent = await func(user_id)
+        totals.append(time.perf_counter() - started)
+        serialization.append(spent)
+    return statistics.median(totals) * 1000, statistics.median(serialization) * 1000
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if fastjson.orjson is None:
+        raise SystemExit("orjson is not installed")
+    check_dates()
+    init_db()
+    seed()
+
+    print(f"{'rows':>6}  {'path':<14} {'total ms':>9} {'serialize ms':>13}")
+    for size in SIZES:
+        # Оба пути должны отдавать одни и те же байты
+        slow_body, _ = await orm_pydantic(size)
+        fast_body, _ = await rows_orjson(size)
+        assert slow_body == fast_body, "fast path output differs"
+
+        results = {}
+        for name, func in (("orm+pydantic", orm_pydantic), ("rows+orjson", rows_orjson)):
+            total, serialize = await measure(func, size, args.repeat)
+            results[name] = total
+            print(f"{size:>6}  {name:<14} {total:>9.2f} {serialize:>13.2f}")
+        print(f"{'':>6}  speedup x{results['orm+pydantic'] / results['rows+orjson']:.2f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,166 @@
+"""
+Бенчмарк: смешанная нагрузка чтения и записи на SQLite в профилях
+SQLITE_PROFILE=default (журнал отката, общий пул) и wal (WAL, PRAGMA, писатели
+ждут блокировку в busy_timeout, отдельный движок-читатель).
+
+API (в процессе, через ASGITransport) получает --concurrency одновременных
+запросов: --write-share пополнений и покупок, остальное - чтения /balance и
+/transactions. Параллельно "бот" пишет в ту же БД своим sqlite3-соединением,
+как admin_bot/payment_bot. Считаются RPS и p50/p95/p99 отдельно для чтений и
+записей, ответы 5xx ("database is locked") и ошибки бота.
+Каждый профиль - отдельный процесс: движки настраиваются при импорте database.
+
+Запуск: python benchmarks/bench_sqlite_wal.py [--requests 2000] [--concurrency 50]
+"""
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+import threading
+import subprocess
+from collections import Counter
+
+from _harness import use_temp_sqlite, run_concurrent, summarize
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--requests", type=int, default=2000)
+parser.add_argument("--concurrency", type=int, default=50)
+parser.add_argument("--users", type=int, default=100)
+parser.add_argument("--write-share", type=float, default=0.2)
+parser.add_argument("--bot-interval-ms", type=float, default=5.0, help="pause between bot writes")
+parser.add_argument("--profile", choices=("default", "wal"), help=argparse.SUPPRESS)
+args = parser.parse_args()
+
+FIRST_USER_ID = 8000001
+
+
+def run_profile(profile: str) -> dict:
+    """Прогон одного профиля в отдельном процессе; результат - JSON в последней строке stdout"""
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "--profile", profile, *sys.argv[1:]],
+        env=dict(os.environ, LOG_LEVEL="ERROR"), text=True
+    )
+    lines = output.strip().splitlines()
+    print("\n".join(lines[:-1]))
+    return json.loads(lines[-1])
+
+
+def bot_writer(path: str, stop: threading.Event, counts: Counter):
+    """Пишет пополнения напрямую в SQLite, как боты (pysqlite, таймаут по умолчанию 5 с)"""
+    conn = sqlite3.connect(path, timeout=5.0)
+    rng = random.Random(2)
+    while not stop.is_set():
+        user_id = FIRST_USER_ID + rng.randrange(args.users)
+        try:
+            conn.execute(
+                "INSERT INTO transactions (user_id, transaction_type, amount, currency, status, ledger_amount) "
+                "VALUES (?, 'deposit', 0.001, 'TON', 'completed', 1000000)", (user_id,)
+            )
+            conn.commit()
+            counts["ok"] += 1
+        except sqlite3.OperationalError as e:
+            conn.rollback()
+            counts[str(e)] += 1
+        time.sleep(args.bot_interval_ms / 1000)
+    conn.close()
+
+
+def child(profile: str):
+    os.environ["SQLITE_PROFILE"] = profile
+    path = use_temp_sqlite()
+
+    import asyncio
+    import httpx
+
+    import ledger
+    from database import init_db, SessionLocal
+    from models import User, Transaction
+    from app import app
+
+    init_db()
+    with SessionLocal() as db:
+        for i in range(args.users):
+            user_id = FIRST_USER_ID + i
+            db.add(User(user_id=user_id, balance_ton=0.0, balance_stars=0))
+            db.add(Transaction(
+                user_id=user_id, transaction_type='deposit', amount=1000.0, currency='TON',
+                ledger_amount=ledger.to_minor(1000.0)
+            ))
+        db.commit()
+
+    rng = random.Random(1)
+    plan = [
+        rng.choice(("deposit", "purchase")) if rng.random() < args.write_share else rng.choice(("balance", "transactions"))
+        for _ in range(args.requests)
+    ]
+    latencies = {"read": [], "write": []}
+    statuses = Counter()
+
+    async def main():
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def send(i):
+                user_id = FIRST_USER_ID + i % args.users
+                kind = plan[i]
+                started = time.perf_counter()
+                if kind == "balance":
+                    response = await client.get(f"/api/user/{user_id}/balance")
+                elif kind == "transactions":
+                    response = await client.get(f"/api/user/{user_id}/transactions")
+                elif kind == "deposit":
+                    response = await client.post(f"/api/user/{user_id}/deposit", json={"amount": 1.0})
+                else:
+                    response = await client.post(
+                        f"/api/user/{user_id}/purchase",
+                        json={"gift_id": f"wal-{i}", "gift_name": "WAL Gift", "gift_price": 0.5}
+                    )
+                latencies["write" if kind in ("deposit", "purchase") else "read"].append(time.perf_counter() - started)
+                statuses[response.status_code] += 1
+
+            _, elapsed, _ = await run_concurrent(send, args.requests, args.concurrency)
+            return elapsed
+
+    stop = threading.Event()
+    bot_counts = Counter()
+    bot = threading.Thread(target=bot_writer, args=(path, stop, bot_counts))
+    bot.start()
+    try:
+        elapsed = asyncio.run(main())
+    finally:
+        stop.set()
+        bot.join()
+
+    print(f"profile={profile}")
+    reads = summarize(f"  reads ({profile})", latencies["read"], elapsed)
+    writes = summarize(f"  writes ({profile})", latencies["write"], elapsed)
+    print(f"  statuses: {dict(sorted(statuses.items()))} bot: {dict(bot_counts)}")
+    errors = sum(count for code, count in statuses.items() if code >= 500)
+    print(json.dumps({
+        "rps": round(args.requests / elapsed, 1), "reads": reads, "writes": writes,
+        "errors": errors, "bot_errors": sum(count for key, count in bot_counts.items() if key != "ok"),
+    }))
+
+
+def main():
+    print(
+        f"requests={args.requests} concurrency={args.concurrency} users={args.users} "
+        f"write_share={args.write_share} bot_interval={args.bot_interval_ms}ms"
+    )
+    before = run_profile("default")
+    after = run_profile("wal")
+    print(f"total throughput: {before['rps']} -> {after['rps']} req/s (x{after['rps'] / before['rps']:.2f})")
+    if after["reads"]["p95_ms"]:
+        print(f"read p95: x{before['reads']['p95_ms'] / after['reads']['p95_ms']:.1f} lower")
+    print(f"API errors: {before['errors']} -> {after['errors']}, bot errors: {before['bot_errors']} -> {after['bot_errors']}")
+    assert after["errors"] == 0 and after["bot_errors"] == 0, "wal profile still hits locked database"
+    print("  invariants hold")
+
+
+if __name__ == "__main__":
+    if args.profile:
+        child(args.profile)
+    else:
+        main()
@@ -0,0 +1,96 @@
+"""
+Бенчмарк: GET /api/user/{user_id} без кэша, с in-process кэшем (TTL + LRU)
+и с Redis-кэшем (локальный фейк fakeredis, если установлен).
+
+--users пользователей читаются по кругу --reads раз при имитации сетевой
+задержки до БД --latency-ms. После каждого прогона проверяется, что пополнение
+через API сразу видно в профиле (инвалидация), и печатаются счетчики кэша.
+
+Запуск: python benchmarks/bench_user_cache.py [--users 100] [--reads 2000]
+"""
+import argparse
+import asyncio
+
+from _harness import use_temp_sqlite, add_sqlite_latency, run_concurrent, summarize
+
+use_temp_sqlite()
+
+import httpx
+
+import cache
+import database
+from database import init_db
+from app import app
+
+FIRST_USER_ID = 8000001
+
+
+def configure(mode: str):
+    """Переключает кэши приложения: off / memory / redis"""
+    ttl = 0 if mode == "off" else 60
+    for namespaced in (cache.user_cache, cache.balance_cache):
+        namespaced.ttl = ttl
+        namespaced.stats = cache.CacheStats()
+        if mode == "redis":
+            import fakeredis
+            namespaced.backend = cache.RedisBackend(fakeredis.FakeAsyncRedis(), namespaced.namespace, ttl)
+        else:
+            namespaced.backend = cache.MemoryBackend(ttl)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--reads", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    args = parser.parse_args()
+
+    init_db()
+    modes = ["off", "memory"]
+    try:
+        import fakeredis  # noqa: F401
+        modes.append("redis")
+    except ImportError:
+        print("fakeredis is not installed, skipping the redis backend")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        configure("off")
+        for i in range(args.users):
+            user_id = FIRST_USER_ID + i
+            response = await client.post("/api/user", json={"user_id": user_id, "username": f"bench{i}"})
+            assert response.status_code == 201, response.text
+            response = await client.post(f"/api/user/{user_id}/deposit", json={"amount": 10.0})
+            assert response.status_code == 200, response.text
+
+        add_sqlite_latency(database.async_engine.sync_engine, args.latency_ms / 1000)
+        await database.async_engine.dispose()
+        print(f"users={args.users} reads={args.reads} concurrency={args.concurrency} db_latency={args.latency_ms}ms")
+
+        async def read(i):
+            response = await client.get(f"/api/user/{FIRST_USER_ID + i % args.users}")
+            assert response.status_code == 200, response.text
+            return response.json()["balance_ton"]
+
+        results = {}
+        for mode in modes:
+            configure(mode)
+            latencies, elapsed, _ = await run_concurrent(read, args.reads, args.concurrency)
+            results[mode] = summarize(f"GET /api/user ({mode})", latencies, elapsed)
+
+            before = await read(0)
+            response = await client.post(f"/api/user/{FIRST_USER_ID}/deposit", json={"amount": 1.0})
+            assert response.status_code == 200, response.text
+            after = await read(0)
+            assert after == before + 1.0, f"{mode}: stale balance after deposit ({before} -> {after})"
+            print(f"  counters: user={cache.user_cache.stats.as_dict()} balance={cache.balance_cache.stats.as_dict()}")
+
+    for mode in modes[1:]:
+        if results["off"]["rps"]:
+            print(f"{mode} cache throughput: x{results[mode]['rps'] / results['off']['rps']:.1f}")
+    print("  invalidation holds")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
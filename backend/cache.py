@@ -0,0 +1,235 @@
+"""
+Кэш горячих чтений: профили пользователей и балансы
+Cache - пространство ключей поверх бэкенда со счетчиками попаданий/промахов.
+Бэкенд выбирается CACHE_BACKEND:
+- memory (по умолчанию) - TTL + LRU внутри процесса; записи через API инвалидируют
+  его сразу, изменения из других процессов (админ-бот, другие воркеры) видны не
+  позже чем через TTL;
+- redis - общий для всех воркеров кэш в REDIS_URL (нужен пакет redis); админ-бот
+  сбрасывает в нем ключи сам. REDIS_URL=fakeredis:// - локальный фейк (пакет fakeredis).
+Ошибки Redis не ломают запрос: чтение считается промахом и идет в БД.
+"""
+import os
+import json
+import time
+from functools import lru_cache
+from collections import OrderedDict
+
+import logconfig
+
+log = logconfig.get_logger("capsule.cache")
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'memory')
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+# Префикс ключей в Redis: <prefix><namespace>:<key>, общий с админ-ботом
+CACHE_KEY_PREFIX = os.getenv('CACHE_KEY_PREFIX', 'capsule:')
+
+# TTL в секундах; 0 - кэш выключен
+BALANCE_CACHE_TTL = float(os.getenv('BALANCE_CACHE_TTL', '0'))
+BALANCE_CACHE_MAXSIZE = int(os.getenv('BALANCE_CACHE_MAXSIZE', '10000'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '60'))
+USER_CACHE_MAXSIZE = int(os.getenv('USER_CACHE_MAXSIZE', '10000'))
+
+
+class LRUCache:
+    """Словарь ограниченного размера, вытесняет давно не читанные записи"""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+
+    def get(self, key):
+        value = self._data.get(key)
+        if value is not None:
+            self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+class MemoryBackend:
+    """TTL + LRU в памяти процесса"""
+    # Исключения бэкенда, которые Cache считает промахом (см. RedisBackend)
+    errors = ()
+
+    def __init__(self, ttl: float, maxsize: int = 10000):
+        self.ttl = ttl
+        self._entries = LRUCache(maxsize)
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._entries.invalidate(key)
+            return None
+        return value
+
+    async def set(self, key: str, value):
+        self._entries.set(key, (time.monotonic() + self.ttl, value))
+
+    async def delete(self, key: str):
+        self._entries.invalidate(key)
+
+    async def clear(self):
+        self._entries.clear()
+
+
+class RedisBackend:
+    """Общий кэш в Redis: значения - JSON, время жизни - PX ключа"""
+
+    def __init__(self, client, namespace: str, ttl: float):
+        from redis.exceptions import RedisError
+        self.errors = (RedisError,)
+        self.client = client
+        self.prefix = f"{CACHE_KEY_PREFIX}{namespace}:"
+        self.ttl = ttl
+
+    async def get(self, key: str):
+        raw = await self.client.get(self.prefix + key)
+        return None if raw is None else json.loads(raw)
+
+    async def set(self, key: str, value):
+        await self.client.set(self.prefix + key, json.dumps(value), px=int(self.ttl * 1000))
+
+    async def delete(self, key: str):
+        await self.client.delete(self.prefix + key)
+
+    async def clear(self):
+        keys = [key async for key in self.client.scan_iter(match=self.prefix + "*")]
+        if keys:
+            await self.client.delete(*keys)
+
+
+class CacheStats:
+    """Счетчики кэша для /api/debug/cache"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.sets = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def as_dict(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "sets": self.sets,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+        }
+
+
+class Cache:
+    """
+    Пространство ключей (user_id -> значение) поверх бэкенда. Значения должны
+    переживать JSON: в Redis кортеж возвращается списком
+    """
+
+    def __init__(self, namespace: str, backend, ttl: float):
+        self.namespace = namespace
+        self.backend = backend
+        self.ttl = ttl
+        self.stats = CacheStats()
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0
+
+    async def get(self, key):
+        if not self.enabled:
+            return None
+        try:
+            value = await self.backend.get(str(key))
+        except self.backend.errors as e:
+            self.stats.errors += 1
+            log.warning("cache get failed", extra={"namespace": self.namespace, "error": repr(e)})
+            return None
+        if value is None:
+            self.stats.misses += 1
+        else:
+            self.stats.hits += 1
+        return value
+
+    async def set(self, key, value):
+        if not self.enabled:
+            return
+        try:
+            await self.backend.set(str(key), value)
+            self.stats.sets += 1
+        except self.backend.errors as e:
+            self.stats.errors += 1
+            log.warning("cache set failed", extra={"namespace": self.namespace, "error": repr(e)})
+
+    async def invalidate(self, key):
+        if not self.enabled:
+            return
+        try:
+            await self.backend.delete(str(key))
+            self.stats.invalidations += 1
+        except self.backend.errors as e:
+            # Запись в БД уже прошла; устаревшее значение доживет до TTL
+            self.stats.errors += 1
+            log.warning("cache invalidate failed", extra={"namespace": self.namespace, "error": repr(e)})
+
+    async def clear(self):
+        await self.backend.clear()
+
+
+@lru_cache(maxsize=None)
+def _redis_client():
+    """
+    Один клиент (и пул соединений) на все пространства ключей. redis импортируется
+    только здесь: при CACHE_BACKEND=memory пакет не грузится (быстрее холодный старт)
+    """
+    if REDIS_URL.startswith('fakeredis://'):
+        import fakeredis
+        return fakeredis.FakeAsyncRedis()
+    try:
+        import redis.asyncio as aioredis
+    except ImportError:
+        raise RuntimeError("CACHE_BACKEND=redis requires the redis package")
+    return aioredis.from_url(REDIS_URL)
+
+
+def make_backend(namespace: str, ttl: float, maxsize: int):
+    """Бэкенд по CACHE_BACKEND: общий для воркеров Redis или память процесса"""
+    if CACHE_BACKEND == 'redis':
+        return RedisBackend(_redis_client(), namespace, ttl)
+    if CACHE_BACKEND != 'memory':
+        raise ValueError(f"Unknown CACHE_BACKEND: {CACHE_BACKEND!r}")
+    return MemoryBackend(ttl, maxsize)
+
+
+def _make_cache(namespace: str, ttl: float, maxsize: int) -> Cache:
+    return Cache(namespace, make_backend(namespace, ttl, maxsize), ttl)
+
+
+# user_id -> [balance_ton, balance_stars]
+balance_cache = _make_cache("balance", BALANCE_CACHE_TTL, BALANCE_CACHE_MAXSIZE)
+# user_id -> профиль UserResponse без баланса (JSON-совместимый dict)
+user_cache = _make_cache("user", USER_CACHE_TTL, USER_CACHE_MAXSIZE)
+
+
+def stats() -> dict:
+    return {
+        "backend": CACHE_BACKEND,
+        "balance": balance_cache.stats.as_dict(),
+        "user": user_cache.stats.as_dict(),
+    }
@@ -0,0 +1,366 @@
+"""
+Каталог подарков на продажу (public/gifts.json) в памяти процесса
+Файл читается один раз при первом запросе. Для каждого атрибута (collection,
+model, backdrop, symbol) строится индекс "значение -> множество позиций", для
+каждой сортировки - готовый порядок позиций. Запрос пересекает множества
+фильтров и проходит порядок сортировки только до конца страницы, поэтому
+ответ по размеру и времени зависит от страницы, а не от каталога.
+
+Значения фильтров сравниваются как на фронтенде: без процента редкости,
+регистра, цифр, пробелов и дефисов ("Cobalt Blue 1.2%" == "cobaltblue").
+Цена - price_ton_discounted (ее показывает мини-апп).
+
+Два движка с одинаковыми ответами:
+- numpy (по умолчанию, если установлен numpy) - ColumnarCatalog: колонки
+  float64 и коды категорий int32, фильтры - векторные булевы маски, порядки
+  сортировок - argsort при загрузке; держит сотни тысяч листингов;
+- index - Catalog: множества позиций и списки на чистом Python.
+
+Переменные окружения: CATALOG_PATH - путь к gifts.json (по умолчанию
+../public/gifts.json), CATALOG_ENGINE - numpy или index.
+"""
+import os
+import re
+import json
+import base64
+import bisect
+import threading
+import importlib.util
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import logconfig
+from pagination import InvalidCursor
+
+# numpy необязателен (без него работает индекс на чистом Python) и импортируется
+# только при загрузке каталога: импорт стоит ~0.1 с холодного старта
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+np = None
+
+CATALOG_PATH = os.getenv(
+    'CATALOG_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'public', 'gifts.json')
+)
+
+CATALOG_ENGINE = 'numpy' if HAS_NUMPY and os.getenv('CATALOG_ENGINE', 'numpy') == 'numpy' else 'index'
+
+ATTRIBUTES = ("collection", "model", "backdrop", "symbol")
+# Сортировки мини-аппа; latest - порядок файла
+SORTS = ("latest", "price-low", "price-high", "id-asc", "id-desc")
+PRICE_SORTS = {"price-low": 1, "price-high": -1}
+
+log = logconfig.get_logger("capsule.catalog")
+
+_RARITY = re.compile(r"\s*\d+\.?\d*\s*%")
+_DIGITS = re.compile(r"\s*\d+")
+_SEPARATORS = re.compile(r"[\s\-_]")
+
+_lock = threading.Lock()
+_catalog = None
+
+
+class CatalogUnavailable(RuntimeError):
+    """Файл каталога не найден или поврежден"""
+
+
+def normalize(value: str) -> str:
+    """"Cobalt Blue 1.2%" -> "cobaltblue" (как normalize в MarketContext.tsx)"""
+    value = _RARITY.sub("", value.lower())
+    return _SEPARATORS.sub("", _DIGITS.sub("", value)).strip()
+
+
+def _numeric_id(value: str) -> int:
+    digits = re.sub(r"\D", "", value)
+    return int(digits) if digits else 0
+
+
+def to_preview(listing: dict) -> dict:
+    """Строка gifts.json -> поля GiftPreview (как transformParsedGiftToGiftPreview)"""
+    return {
+        "id": str(listing["id"]),
+        "name": listing["name"].split("#", 1)[0].strip(),
+        "price": float(listing.get("price_ton_discounted") or 0),
+        "preview": listing.get("lottie_url") or None,
+        "collection": listing.get("collection") or None,
+        "backdrop": listing.get("backdrop") or None,
+        "symbol": listing.get("symbol") or None,
+    }
+
+
+def _unique(listings: Sequence[dict]) -> List[dict]:
+    """Дубликаты в выгрузке: один листинг - одна пара (collection, id), первая встреченная"""
+    unique = {}
+    for listing in listings:
+        unique.setdefault((listing.get("collection"), str(listing["id"])), listing)
+    return list(unique.values())
+
+
+def encode_cursor(sort: str, rank: int) -> str:
+    raw = json.dumps([sort, rank], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> int:
+    """Позиция в порядке sort, с которой продолжается выдача"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        cursor_sort, rank = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        rank = int(rank)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e)) from e
+    if cursor_sort != sort or rank < 0:
+        raise InvalidCursor("cursor belongs to another sort")
+    return rank
+
+
+class Catalog:
+    """Неизменяемый индекс листингов; безопасен для чтения из нескольких потоков"""
+
+    def __init__(self, listings: Sequence[dict]):
+        unique = _unique(listings)
+        self.items: List[dict] = [to_preview(listing) for listing in unique]
+        self.prices: List[float] = [item["price"] for item in self.items]
+
+        self.index: Dict[str, Dict[str, frozenset]] = {}
+        for attribute in ATTRIBUTES:
+            postings: Dict[str, set] = {}
+            for position, listing in enumerate(unique):
+                if listing.get(attribute):
+                    postings.setdefault(normalize(listing[attribute]), set()).add(position)
+            self.index[attribute] = {value: frozenset(positions) for value, positions in postings.items()}
+
+        positions = range(len(self.items))
+        ids = [_numeric_id(item["id"]) for item in self.items]
+        self.orders: Dict[str, List[int]] = {
+            "latest": list(positions),
+            "price-low": sorted(positions, key=lambda p: (self.prices[p], p)),
+            "price-high": sorted(positions, key=lambda p: (-self.prices[p], p)),
+            "id-asc": sorted(positions, key=lambda p: (ids[p], p)),
+            "id-desc": sorted(positions, key=lambda p: (-ids[p], p)),
+        }
+        # Ключи вдоль ценовых порядков (по возрастанию): диапазон цен -> диапазон позиций bisect'ом
+        self.sort_keys = {
+            sort: [direction * self.prices[p] for p in self.orders[sort]] for sort, direction in PRICE_SORTS.items()
+        }
+        self.ranks = {}
+        for sort, order in self.orders.items():
+            rank = [0] * len(order)
+            for i, position in enumerate(order):
+                rank[position] = i
+            self.ranks[sort] = rank
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def candidates(self, filters: Dict[str, Sequence[str]]) -> Optional[frozenset]:
+        """
+        Позиции, подходящие под фильтры атрибутов: значения одного атрибута - ИЛИ,
+        разные атрибуты - И. None - фильтров нет (подходит весь каталог)
+        """
+        result = None
+        groups = []
+        for attribute, values in filters.items():
+            if not values:
+                continue
+            index = self.index[attribute]
+            group = frozenset().union(*(index.get(normalize(value), frozenset()) for value in values))
+            groups.append(group)
+        # Пересекаем начиная с самого узкого множества
+        for group in sorted(groups, key=len):
+            result = group if result is None else result & group
+            if not result:
+                break
+        return result
+
+    def query(self, filters: Dict[str, Sequence[str]], min_price: Optional[float] = None,
+              max_price: Optional[float] = None, sort: str = "latest", cursor: Optional[str] = None,
+              limit: int = 50) -> Tuple[List[dict], Optional[str]]:
+        """Страница листингов и курсор следующей (или None)"""
+        order = self.orders[sort]
+        start = decode_cursor(cursor, sort) if cursor else 0
+        stop = len(order)
+        low = float("-inf") if min_price is None else min_price
+        high = float("inf") if max_price is None else max_price
+        if sort in PRICE_SORTS:
+            keys = self.sort_keys[sort]
+            bounds = (low, high) if PRICE_SORTS[sort] > 0 else (-high, -low)
+            start = max(start, bisect.bisect_left(keys, bounds[0]))
+            stop = bisect.bisect_right(keys, bounds[1])
+            low, high = float("-inf"), float("inf")  # цена уже учтена диапазоном позиций
+        if start >= stop:
+            return [], None
+
+        matched = self.candidates(filters)
+        if matched is not None and len(matched) < (stop - start) // 8:
+            # Узкий фильтр: сортируем сами совпадения, а не идем по всему порядку
+            rank = self.ranks[sort]
+            scan = [order[r] for r in sorted(rank[p] for p in matched) if start <= r < stop]
+            start, stop = 0, len(scan)
+        else:
+            scan = order
+
+        page, next_rank = [], None
+        prices = self.prices
+        for i in range(start, stop):
+            position = scan[i]
+            if matched is not None and position not in matched:
+                continue
+            if not low <= prices[position] <= high:
+                continue
+            if len(page) == limit:
+                next_rank = self.ranks[sort][position]
+                break
+            page.append(self.items[position])
+        return page, encode_cursor(sort, next_rank) if next_rank is not None else None
+
+
+class ColumnarCatalog:
+    """
+    Каталог колонками numpy: цена - float64, атрибуты - коды категорий int32
+    (-1 - значения нет), числовой id - int64. Словари GiftPreview собираются
+    только для листингов страницы. Ответы совпадают с Catalog
+    """
+
+    def __init__(self, listings: Sequence[dict]):
+        global np
+        import numpy as np
+
+        unique = _unique(listings)
+        self.ids = [str(listing["id"]) for listing in unique]
+        self.names = [listing["name"].split("#", 1)[0].strip() for listing in unique]
+        self.previews = [listing.get("lottie_url") or None for listing in unique]
+        self.prices = np.array([listing.get("price_ton_discounted") or 0 for listing in unique], dtype=np.float64)
+
+        self.categories: Dict[str, List[str]] = {}
+        self.codes = {}
+        # Нормализованное значение фильтра -> коды всех вариантов написания ("Onyx Black 1%", "Onyx Black 2%")
+        self.lookup: Dict[str, Dict[str, List[int]]] = {}
+        for attribute in ATTRIBUTES:
+            known: Dict[str, int] = {}
+            codes = np.fromiter(
+                (known.setdefault(listing[attribute], len(known)) if listing.get(attribute) else -1 for listing in unique),
+                dtype=np.int32, count=len(unique)
+            )
+            self.categories[attribute] = list(known)
+            self.codes[attribute] = codes
+            lookup: Dict[str, List[int]] = {}
+            for value, code in known.items():
+                lookup.setdefault(normalize(value), []).append(code)
+            self.lookup[attribute] = lookup
+
+        ids = np.array([_numeric_id(item) for item in self.ids], dtype=np.int64)
+        # Стабильный argsort: при равных ключах - порядок файла, как у Catalog
+        self.orders = {
+            "latest": np.arange(len(unique), dtype=np.int64),
+            "price-low": np.argsort(self.prices, kind="stable"),
+            "price-high": np.argsort(-self.prices, kind="stable"),
+            "id-asc": np.argsort(ids, kind="stable"),
+            "id-desc": np.argsort(-ids, kind="stable"),
+        }
+        self.sort_keys = {
+            sort: direction * self.prices[self.orders[sort]] for sort, direction in PRICE_SORTS.items()
+        }
+        self.ranks = {}
+        for sort, order in self.orders.items():
+            rank = np.empty_like(order)
+            rank[order] = np.arange(len(order))
+            self.ranks[sort] = rank
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def mask(self, filters: Dict[str, Sequence[str]], min_price: Optional[float] = None,
+             max_price: Optional[float] = None):
+        """Булева маска подходящих листингов; None - фильтров нет"""
+        result = None
+        for attribute, values in filters.items():
+            if not values:
+                continue
+            codes = self.codes[attribute]
+            wanted = [code for value in values for code in self.lookup[attribute].get(normalize(value), ())]
+            if len(wanted) <= 8:
+                # Несколько сравнений кодов дешевле выборки по таблице: та в разы медленнее на int32
+                matched = np.zeros(len(codes), dtype=bool)
+                for code in wanted:
+                    matched |= codes == code
+            else:
+                # Таблица "код -> подходит"; лишний последний элемент (False) отвечает коду -1
+                allowed = np.zeros(len(self.categories[attribute]) + 1, dtype=bool)
+                allowed[wanted] = True
+                matched = allowed[codes]
+            result = matched if result is None else np.logical_and(result, matched, out=result)
+        for bound, compare in ((min_price, np.greater_equal), (max_price, np.less_equal)):
+            if bound is not None:
+                matched = compare(self.prices, bound)
+                result = matched if result is None else np.logical_and(result, matched, out=result)
+        return result
+
+    def _preview(self, position: int) -> dict:
+        return {
+            "id": self.ids[position],
+            "name": self.names[position],
+            "price": float(self.prices[position]),
+            "preview": self.previews[position],
+            "collection": self._category("collection", position),
+            "backdrop": self._category("backdrop", position),
+            "symbol": self._category("symbol", position),
+        }
+
+    def _category(self, attribute: str, position: int) -> Optional[str]:
+        code = self.codes[attribute][position]
+        return self.categories[attribute][code] if code >= 0 else None
+
+    def query(self, filters: Dict[str, Sequence[str]], min_price: Optional[float] = None,
+              max_price: Optional[float] = None, sort: str = "latest", cursor: Optional[str] = None,
+              limit: int = 50) -> Tuple[List[dict], Optional[str]]:
+        """Страница листингов и курсор следующей (или None)"""
+        order = self.orders[sort]
+        start = decode_cursor(cursor, sort) if cursor else 0
+        stop = len(order)
+        if sort in PRICE_SORTS:
+            # Диапазон цен на ценовой сортировке - отрезок порядка, маска по цене не нужна
+            low = -np.inf if min_price is None else min_price
+            high = np.inf if max_price is None else max_price
+            keys = self.sort_keys[sort]
+            bounds = (low, high) if PRICE_SORTS[sort] > 0 else (-high, -low)
+            start = max(start, int(np.searchsorted(keys, bounds[0], side="left")))
+            stop = int(np.searchsorted(keys, bounds[1], side="right"))
+            min_price = max_price = None
+        if start >= stop:
+            return [], None
+
+        mask = self.mask(filters, min_price, max_price)
+        if mask is None:
+            ranks = np.arange(start, min(stop, start + limit + 1))
+        else:
+            matches = np.flatnonzero(mask)
+            if len(matches) * 8 < stop - start:
+                # Узкий фильтр: сортируем ранги самих совпадений
+                ranks = np.sort(self.ranks[sort][matches])
+                ranks = ranks[(ranks >= start) & (ranks < stop)][:limit + 1]
+            else:
+                ranks = np.flatnonzero(mask[order[start:stop]])[:limit + 1] + start
+        page = [self._preview(int(position)) for position in order[ranks[:limit]]]
+        next_cursor = encode_cursor(sort, int(ranks[limit])) if len(ranks) > limit else None
+        return page, next_cursor
+
+
+def load(path: str = CATALOG_PATH, engine: str = CATALOG_ENGINE):
+    try:
+        with open(path, encoding="utf-8") as stream:
+            listings = json.load(stream)
+    except (OSError, ValueError) as e:
+        raise CatalogUnavailable(f"{path}: {e}") from e
+    if not isinstance(listings, list):
+        raise CatalogUnavailable(f"{path}: expected a list of listings")
+    catalog = ColumnarCatalog(listings) if engine == "numpy" else Catalog(listings)
+    log.info("catalog loaded", extra={"path": path, "listings": len(catalog), "engine": engine})
+    return catalog
+
+
+def get_catalog():
+    """Каталог процесса; загружается один раз при первом обращении"""
+    global _catalog
+    if _catalog is None:
+        with _lock:
+            if _catalog is None:
+                _catalog = load()
+    return _catalog
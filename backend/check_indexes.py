@@ -0,0 +1,105 @@
+"""
+Проверка планов запросов: горячие запросы должны идти по индексам
+Запускает EXPLAIN (PostgreSQL) или EXPLAIN QUERY PLAN (SQLite) для каждого
+запроса и проверяет, что в плане есть ожидаемый индекс.
+Запуск: python check_indexes.py (использует DATABASE_URL, как и API)
+"""
+import sys
+from datetime import datetime
+
+from sqlalchemy import select, func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from database import engine, init_db
+from models import UserGift, Transaction, PromoCode
+import pagination
+
+CURSOR = pagination.encode_cursor(datetime(2024, 1, 1, 12, 0, 0), 100)
+
+# (описание, запрос, индексы, любой из которых должен быть в плане)
+HOT_QUERIES = [
+    (
+        "transactions page, newest first",
+        select(Transaction.id).where(Transaction.user_id == 1)
+        .order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(51),
+        {"ix_transactions_user_created_id"},
+    ),
+    (
+        "transactions page after cursor",
+        pagination.after_cursor(
+            select(Transaction.id).where(Transaction.user_id == 1),
+            Transaction.created_at, Transaction.id, CURSOR, engine.dialect.name
+        ).limit(51),
+        {"ix_transactions_user_created_id"},
+    ),
+    (
+        "gifts page after cursor",
+        pagination.after_cursor(
+            select(UserGift.id).where(UserGift.user_id == 1),
+            UserGift.purchase_date, UserGift.id, CURSOR, engine.dialect.name
+        ).limit(51),
+        {"ix_user_gifts_user_purchased_id"},
+    ),
+    (
+        "ledger tail after balance snapshot",
+        select(func.sum(Transaction.ledger_amount))
+        .where(Transaction.user_id == 1, Transaction.currency == "TON", Transaction.id > 100),
+        {"ix_transactions_ledger_tail"},
+    ),
+    (
+        "user gift duplicate check",
+        select(UserGift.id).where(UserGift.user_id == 1, UserGift.gift_id == "gift"),
+        {"uq_user_gifts_user_gift"},
+    ),
+    (
+        "transaction by tx_hash",
+        select(Transaction.id).where(Transaction.tx_hash == "hash"),
+        {"ix_transactions_tx_hash"},
+    ),
+    (
+        "unused promo code redemption lookup",
+        select(PromoCode.id).where(PromoCode.code == "CODE", PromoCode.is_used.is_(False)),
+        {"ix_promo_codes_unused", "ix_promo_codes_code"},
+    ),
+    (
+        "unused promo codes count",
+        select(func.count()).select_from(PromoCode).where(PromoCode.is_used.is_(False)),
+        {"ix_promo_codes_unused"},
+    ),
+]
+
+
+def explain(conn, query) -> str:
+    """План запроса одной строкой (литералы подставлены, чтобы не зависеть от драйвера)"""
+    if conn.dialect.name == "postgresql":
+        sql = str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+        rows = conn.exec_driver_sql(f"EXPLAIN {sql}").fetchall()
+        return "\n".join(row[0] for row in rows)
+    sql = str(query.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+    rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+    return "\n".join(row[-1] for row in rows)
+
+
+def check_indexes() -> bool:
+    ok = True
+    with engine.connect() as conn:
+        if conn.dialect.name == "postgresql":
+            # На маленьких таблицах планировщик выбирает seq scan; проверяем, что индекс применим
+            conn.exec_driver_sql("SET enable_seqscan = off")
+        for description, query, expected in HOT_QUERIES:
+            plan = explain(conn, query)
+            used = any(name in plan for name in expected)
+            # SQLite сортирует без индекса через временное B-дерево
+            if "TEMP B-TREE" in plan:
+                used = False
+            ok = ok and used
+            print(f"{'✅' if used else '❌'} {description}")
+            if not used:
+                print("   " + plan.replace("\n", "\n   "))
+        conn.rollback()
+    return ok
+
+
+if __name__ == "__main__":
+    init_db()
+    sys.exit(0 if check_indexes() else 1)
@@ -0,0 +1,113 @@
+"""
+Пакетная загрузка пополнений для сверки платежей
+NDJSON: одна запись на строку, {"user_id": ..., "amount": ..., "currency": "TON", "tx_hash": "..."}.
+Записи с уже загруженным tx_hash (в пачке или в БД) пропускаются, поэтому
+повторная загрузка того же файла ничего не меняет. Пополнения - записи
+леджера, вставляются одной массовой вставкой (COPY на PostgreSQL); дубли
+отсекает уникальный индекс uq_transactions_deposit_tx_hash, а не проверка
+перед вставкой, поэтому параллельные загрузки не зачисляют хеш дважды.
+"""
+import json
+from typing import Iterable, List, NamedTuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import ledger
+import locks
+import users
+import metrics
+from cache import balance_cache
+from models import Transaction
+
+CURRENCIES = ('TON', 'STARS')
+
+# Размер пачки для IN-запросов по tx_hash и для пачек CLI
+BATCH_SIZE = 5000
+
+
+class InvalidRecord(ValueError):
+    """Строка NDJSON не является корректной записью пополнения"""
+
+
+class DepositRecord(NamedTuple):
+    user_id: int
+    amount: float
+    currency: str
+    tx_hash: str
+
+
+def parse_record(line_number: int, line) -> DepositRecord:
+    try:
+        data = json.loads(line)
+        record = DepositRecord(
+            user_id=int(data['user_id']),
+            amount=float(data['amount']),
+            currency=str(data.get('currency', 'TON')),
+            tx_hash=str(data['tx_hash'])
+        )
+    except (ValueError, TypeError, KeyError) as e:
+        raise InvalidRecord(f"line {line_number}: {e!r}") from e
+    if record.amount <= 0:
+        raise InvalidRecord(f"line {line_number}: amount must be positive")
+    if record.currency not in CURRENCIES:
+        raise InvalidRecord(f"line {line_number}: invalid currency {record.currency!r}")
+    if not record.tx_hash:
+        raise InvalidRecord(f"line {line_number}: tx_hash is required")
+    return record
+
+
+def parse_ndjson(lines: Iterable) -> List[DepositRecord]:
+    """Разбирает строки NDJSON (пустые пропускаются); первая ошибка отклоняет весь файл"""
+    return [
+        parse_record(number, line)
+        for number, line in enumerate(lines, start=1)
+        if line.strip()
+    ]
+
+
+async def ingest(db: AsyncSession, records: Iterable[DepositRecord]) -> dict:
+    """
+    Загружает пополнения одной транзакцией БД: дедупликация по tx_hash, создание
+    недостающих пользователей, массовая вставка записей леджера. Возвращает счетчики
+    """
+    records = list(records)
+    unique = {}
+    for record in records:
+        unique.setdefault(record.tx_hash, record)
+
+    if db.get_bind().dialect.name == 'postgresql':
+        # Загрузки по очереди: пересекающиеся пачки не ждут друг друга на уникальном индексе
+        await db.execute(locks.xact_lock(locks.DEPOSIT_INGEST))
+
+    # Уже загруженные хеши - по индексу ix_transactions_tx_hash: для них не создаются
+    # пользователи; окончательно дубли отсекает ON CONFLICT в copy_entries
+    hashes = list(unique)
+    loaded = set()
+    for start in range(0, len(hashes), BATCH_SIZE):
+        loaded.update(await db.scalars(
+            select(Transaction.tx_hash).where(Transaction.tx_hash.in_(hashes[start:start + BATCH_SIZE]))
+        ))
+    new = [record for tx_hash, record in unique.items() if tx_hash not in loaded]
+
+    await users.ensure_users(db, sorted({record.user_id for record in new}))
+    inserted = await ledger.copy_entries(db, [
+        (
+            record.user_id, 'deposit', record.amount, record.currency, record.tx_hash, 'completed',
+            ledger.to_minor(record.amount, record.currency)
+        )
+        for record in new
+    ])
+    await db.commit()
+    user_ids = sorted({user_id for user_id, _ in inserted})
+    for user_id in user_ids:
+        await balance_cache.invalidate(user_id)
+    for currency in CURRENCIES:
+        metrics.DEPOSITS.labels("bulk", currency).inc(sum(row.currency == currency for row in inserted))
+
+    return {
+        "received": len(records),
+        "inserted": len(inserted),
+        "duplicates": len(records) - len(inserted),
+        "users": len(user_ids)
+    }
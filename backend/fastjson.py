@@ -0,0 +1,46 @@
+"""
+Быстрый путь сериализации списков
+Вместо ORM-объектов и построчной валидации через pydantic (from_attributes)
+списки выбираются кортежами нужных колонок и кодируются orjson.
+Включается переменной окружения FAST_JSON_LISTS=1 и только если установлен orjson.
+"""
+import os
+from typing import Any, Sequence
+
+from fastapi import Response
+
+from models import UserGift, Transaction
+
+try:
+    import orjson
+except ImportError:  # orjson необязателен: без него работает обычный путь FastAPI
+    orjson = None
+
+ENABLED = orjson is not None and os.getenv('FAST_JSON_LISTS', '').lower() in ('1', 'true', 'yes')
+
+# Колонки в порядке и с именами полей UserGiftResponse / TransactionResponse
+GIFT_COLUMNS = (
+    UserGift.gift_id, UserGift.gift_name, UserGift.gift_preview, UserGift.gift_price,
+    UserGift.id, UserGift.user_id, UserGift.purchase_date,
+)
+TRANSACTION_COLUMNS = (
+    Transaction.transaction_type, Transaction.amount, Transaction.currency, Transaction.gift_id,
+    Transaction.tx_hash, Transaction.id, Transaction.user_id, Transaction.status, Transaction.created_at,
+)
+
+
+class FastJSONResponse(Response):
+    """
+    JSON-ответ, закодированный orjson (datetime, числа и None - нативно)
+    Даты в UTC кодируются с "Z", как у pydantic: без OPT_UTC_Z orjson пишет "+00:00"
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+
+
+def rows_to_dicts(rows: Sequence, columns) -> list:
+    """Кортежи колонок -> словари с именами полей схемы ответа, без pydantic"""
+    keys = [column.key for column in columns]
+    return [dict(zip(keys, row)) for row in rows]
@@ -0,0 +1,194 @@
+"""
+Ключи идемпотентности для пополнения, покупки и активации промокодов
+Первый запрос с заголовком Idempotency-Key занимает строку idempotency_keys,
+выполняет операцию и сохраняет ответ. Повторы с тем же ключом получают
+сохраненный ответ без повторного выполнения: сначала из LRU процесса (без
+обращения к БД), затем из таблицы. Ключи живут IDEMPOTENCY_KEY_TTL секунд,
+просроченные удаляет фоновая задача Sweeper.
+"""
+import os
+import json
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, NamedTuple, Optional
+
+from sqlalchemy import select, update, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import logconfig
+from cache import LRUCache
+from models import IdempotencyKey
+
+log = logconfig.get_logger("capsule.idempotency")
+
+HEADER = "Idempotency-Key"
+# Заголовок ответа, отданного из сохраненного
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+KEY_TTL = float(os.getenv('IDEMPOTENCY_KEY_TTL', '86400'))
+CACHE_SIZE = int(os.getenv('IDEMPOTENCY_CACHE_SIZE', '10000'))
+SWEEP_INTERVAL = float(os.getenv('IDEMPOTENCY_SWEEP_INTERVAL', '300'))
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyError(Exception):
+    """Запрос с ключом отклонен; status_code и detail уходят клиенту как есть"""
+    status_code = 400
+    detail = "Invalid Idempotency-Key"
+
+
+class KeyInProgress(IdempotencyError):
+    status_code = 409
+    detail = "A request with this Idempotency-Key is still in progress"
+
+
+class KeyReused(IdempotencyError):
+    status_code = 422
+    detail = "Idempotency-Key was already used for a different request"
+
+
+class StoredResponse(NamedTuple):
+    fingerprint: str
+    status_code: int
+    body: str  # JSON
+    expires_at: datetime  # UTC без tzinfo
+
+
+# (user_id, key) -> StoredResponse завершенных запросов
+_responses = LRUCache(CACHE_SIZE)
+
+
+def fingerprint(endpoint: str, payload: Any) -> str:
+    """Отпечаток запроса: тот же ключ с другим телом - ошибка клиента"""
+    raw = json.dumps([endpoint, payload], sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _naive_utc(value: datetime) -> datetime:
+    """PostgreSQL возвращает timestamptz с tzinfo, SQLite - без; сравниваем в UTC без tzinfo"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _insert(db: AsyncSession):
+    """insert() с поддержкой ON CONFLICT для диалекта текущей БД"""
+    dialect = db.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(IdempotencyKey)
+    if dialect == 'sqlite':
+        return sqlite.insert(IdempotencyKey)
+    raise NotImplementedError(f"Upsert is not supported for {dialect}")
+
+
+async def begin(db: AsyncSession, user_id: int, key: str, request_fingerprint: str) -> Optional[StoredResponse]:
+    """
+    Занимает ключ для запроса. Возвращает сохраненный ответ, если запрос с этим
+    ключом уже выполнен; None - ключ занят, операцию нужно выполнить и вызвать
+    complete() или release()
+    """
+    if not key or len(key) > MAX_KEY_LENGTH:
+        raise IdempotencyError()
+    now = datetime.utcnow()
+    stored = _responses.get((user_id, key))
+    if stored is not None and stored.expires_at > now:
+        if stored.fingerprint != request_fingerprint:
+            raise KeyReused()
+        return stored
+
+    stmt = _insert(db).values(
+        user_id=user_id,
+        key=key,
+        fingerprint=request_fingerprint,
+        created_at=now,
+        expires_at=now + timedelta(seconds=KEY_TTL)
+    )
+    # Просроченный ключ, который Sweeper еще не удалил, занимается заново
+    claimed = await db.scalar(
+        stmt.on_conflict_do_update(
+            index_elements=[IdempotencyKey.user_id, IdempotencyKey.key],
+            set_={
+                'fingerprint': stmt.excluded.fingerprint,
+                'status_code': None,
+                'response_body': None,
+                'created_at': stmt.excluded.created_at,
+                'expires_at': stmt.excluded.expires_at,
+            },
+            where=IdempotencyKey.expires_at <= now
+        ).returning(IdempotencyKey.key)
+    )
+    await db.commit()
+    if claimed is not None:
+        return None
+
+    row = (await db.execute(
+        select(
+            IdempotencyKey.fingerprint, IdempotencyKey.status_code,
+            IdempotencyKey.response_body, IdempotencyKey.expires_at
+        ).where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+    )).first()
+    if row is not None and row.fingerprint != request_fingerprint:
+        raise KeyReused()
+    if row is None or row.status_code is None:
+        # Первый запрос еще выполняется (или только что освободил ключ) - клиент повторит позже
+        raise KeyInProgress()
+    stored = StoredResponse(row.fingerprint, row.status_code, row.response_body, _naive_utc(row.expires_at))
+    _responses.set((user_id, key), stored)
+    return stored
+
+
+async def complete(db: AsyncSession, user_id: int, key: str, status_code: int, body: str):
+    """Сохраняет ответ выполненного запроса (отдельным commit после операции)"""
+    row = (await db.execute(
+        update(IdempotencyKey)
+        .where(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+        .values(status_code=status_code, response_body=body)
+        .returning(IdempotencyKey.fingerprint, IdempotencyKey.expires_at)
+        .execution_options(synchronize_session=False)
+    )).first()
+    await db.commit()
+    if row is not None:
+        _responses.set((user_id, key), StoredResponse(row.fingerprint, status_code, body, _naive_utc(row.expires_at)))
+
+
+async def release(db: AsyncSession, user_id: int, key: str):
+    """Освобождает ключ после неожиданной ошибки, чтобы повтор выполнил операцию заново"""
+    await db.rollback()
+    await db.execute(
+        delete(IdempotencyKey)
+        .where(
+            IdempotencyKey.user_id == user_id,
+            IdempotencyKey.key == key,
+            IdempotencyKey.status_code.is_(None)
+        )
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+
+
+class Sweeper:
+    """Фоновое удаление просроченных ключей"""
+
+    def __init__(self, session_factory, interval: float = SWEEP_INTERVAL):
+        self.session_factory = session_factory
+        self.interval = interval
+
+    async def run_once(self) -> int:
+        async with self.session_factory() as db:
+            result = await db.execute(
+                delete(IdempotencyKey)
+                .where(IdempotencyKey.expires_at <= datetime.utcnow())
+                .execution_options(synchronize_session=False)
+            )
+            await db.commit()
+            return result.rowcount
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                log.exception("sweep of expired keys failed")
+            await asyncio.sleep(self.interval)
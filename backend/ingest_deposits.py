@@ -0,0 +1,58 @@
+"""
+Загрузка пополнений из NDJSON-файла (сверка платежей) напрямую в БД
+Формат и дедупликация по tx_hash - как у POST /api/deposits/bulk (deposits.py).
+Файл читается пачками по --batch-size записей, каждая пачка - своя транзакция,
+поэтому прерванную загрузку можно просто запустить повторно.
+Запуск: python ingest_deposits.py payments.ndjson [--batch-size 5000]
+        (или "-" для чтения из stdin; использует DATABASE_URL, как и API)
+"""
+import sys
+import asyncio
+import argparse
+from itertools import islice
+
+from database import AsyncSessionLocal, init_db
+import deposits
+
+
+async def ingest_file(stream, batch_size: int) -> dict:
+    totals = {"received": 0, "inserted": 0, "duplicates": 0}
+    line_number = 0
+    while True:
+        lines = list(islice(stream, batch_size))
+        if not lines:
+            return totals
+        records = [
+            deposits.parse_record(line_number + offset, line)
+            for offset, line in enumerate(lines, start=1)
+            if line.strip()
+        ]
+        line_number += len(lines)
+        async with AsyncSessionLocal() as db:
+            result = await deposits.ingest(db, records)
+        for key in totals:
+            totals[key] += result[key]
+        print(f"📥 [DEPOSITS] {line_number} lines: {result}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load NDJSON deposit records")
+    parser.add_argument("path", help='NDJSON file or "-" for stdin')
+    parser.add_argument("--batch-size", type=int, default=deposits.BATCH_SIZE)
+    args = parser.parse_args()
+
+    init_db()
+    try:
+        if args.path == "-":
+            totals = asyncio.run(ingest_file(sys.stdin, args.batch_size))
+        else:
+            with open(args.path, encoding="utf-8") as stream:
+                totals = asyncio.run(ingest_file(stream, args.batch_size))
+    except deposits.InvalidRecord as e:
+        print(f"❌ [DEPOSITS] {e}")
+        sys.exit(1)
+    print(f"✅ [DEPOSITS] Done: {totals}")
+
+
+if __name__ == "__main__":
+    main()
@@ -7,7 +7,7 @@ from models import Base
 
 if __name__ == "__main__":
     print("Инициализация базы данных...")
-    init_db()
-    print("База данных успешно инициализирована!")
+    version = init_db()
+    print(f"База данных успешно инициализирована! Версия схемы: {version}")
     print(f"Файл БД: db.sqlite3")
 
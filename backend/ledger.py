@@ -0,0 +1,268 @@
+"""
+Леджер балансов
+Каждое изменение баланса - новая строка transactions с ledger_amount в
+минимальных единицах (nanoTON для TON, штуки для STARS). Строки только
+добавляются, строка users не обновляется, поэтому зачисления не конкурируют
+между собой, а целые числа не накапливают ошибку округления.
+
+Баланс = снапшот из balance_snapshots + сумма хвоста леджера после снапшота.
+Фоновая задача периодически догоняет снапшоты, поэтому хвост остается коротким
+и чтение баланса - один запрос по индексам.
+"""
+import os
+import asyncio
+from decimal import Decimal
+from typing import List, Optional, Sequence, Tuple
+
+from sqlalchemy import (
+    select, insert, literal, func, exists, text, union_all, table, column, BigInteger, Float, String
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import locks
+import logconfig
+from models import User, Transaction, BalanceSnapshot, DEPOSIT_TX_HASH_WHERE
+
+log = logconfig.get_logger("capsule.ledger")
+
+TON_NANO = 10 ** 9
+
+# Как часто догонять снапшоты (секунды)
+SNAPSHOT_INTERVAL = float(os.getenv('LEDGER_SNAPSHOT_INTERVAL', '60'))
+
+# Снапшот догоняется до записи :cutoff включительно. Условие в ON CONFLICT не дает
+# откатить снапшот назад, если два воркера обновляют его одновременно.
+SNAPSHOT_SQL = text("""
+    INSERT INTO balance_snapshots (user_id, currency, balance_minor, last_entry_id, updated_at)
+    SELECT t.user_id, t.currency, COALESCE(s.balance_minor, 0) + SUM(t.ledger_amount), MAX(t.id), CURRENT_TIMESTAMP
+    FROM transactions t
+    LEFT JOIN balance_snapshots s ON s.user_id = t.user_id AND s.currency = t.currency
+    WHERE t.id > COALESCE(s.last_entry_id, 0) AND t.id <= :cutoff AND t.ledger_amount IS NOT NULL
+    GROUP BY t.user_id, t.currency, s.balance_minor
+    ON CONFLICT (user_id, currency) DO UPDATE SET
+        balance_minor = excluded.balance_minor,
+        last_entry_id = excluded.last_entry_id,
+        updated_at = excluded.updated_at
+    WHERE balance_snapshots.last_entry_id < excluded.last_entry_id
+""")
+
+# PostgreSQL: последняя видимая запись и границы снапшота транзакций (xmin - самая
+# старая активная транзакция, xmax - первый еще не выданный xid)
+HORIZON_SQL = text("""
+    SELECT COALESCE(MAX(id), 0),
+           pg_snapshot_xmin(pg_current_snapshot())::text::bigint,
+           pg_snapshot_xmax(pg_current_snapshot())::text::bigint
+    FROM transactions
+""")
+
+
+def to_minor(amount: float, currency: str = 'TON') -> int:
+    """Сумма в валюте -> минимальные единицы (через Decimal, без ошибки float)"""
+    if currency == 'TON':
+        return int((Decimal(repr(amount)) * TON_NANO).to_integral_value())
+    return int(amount)
+
+
+def from_minor(value: int, currency: str = 'TON'):
+    """Минимальные единицы -> сумма в валюте для ответов API"""
+    if currency == 'TON':
+        return value / TON_NANO
+    return int(value)
+
+
+def balance_minor(user_id: int, currency: str):
+    """SQL-выражение баланса: снапшот + хвост леджера после него"""
+    snapshot = select(BalanceSnapshot).where(
+        BalanceSnapshot.user_id == user_id, BalanceSnapshot.currency == currency
+    ).subquery()
+    last_entry_id = select(snapshot.c.last_entry_id).scalar_subquery()
+    tail = select(func.coalesce(func.sum(Transaction.ledger_amount), 0)).where(
+        Transaction.user_id == user_id,
+        Transaction.currency == currency,
+        Transaction.id > func.coalesce(last_entry_id, 0)
+    ).scalar_subquery()
+    return func.coalesce(select(snapshot.c.balance_minor).scalar_subquery(), 0) + tail
+
+
+def balance_columns(user_id: int):
+    """Колонки (ton_minor, stars_minor) для select() вместе со строкой пользователя"""
+    return (
+        balance_minor(user_id, 'TON').label('ton_minor'),
+        balance_minor(user_id, 'STARS').label('stars_minor'),
+    )
+
+
+def to_balances(row) -> Tuple[float, int]:
+    """(balance_ton, balance_stars) из строки с колонками balance_columns()"""
+    return from_minor(row.ton_minor, 'TON'), from_minor(row.stars_minor, 'STARS')
+
+
+async def get_balances(db: AsyncSession, user_id: int) -> Optional[Tuple[float, int]]:
+    """Балансы пользователя одним запросом; None, если пользователя нет"""
+    row = (await db.execute(
+        select(User.id, *balance_columns(user_id)).where(User.user_id == user_id)
+    )).first()
+    return to_balances(row) if row else None
+
+
+async def append(
+    db: AsyncSession,
+    user_id: int,
+    transaction_type: str,
+    amount: float,
+    currency: str = 'TON',
+    *,
+    debit: bool = False,
+    gift_id: Optional[str] = None,
+    tx_hash: Optional[str] = None
+) -> Optional[Transaction]:
+    """
+    Добавляет запись леджера (без commit). amount - положительная сумма в валюте.
+    Списание (debit=True) проходит, только если баланса хватает: проверка и вставка -
+    один INSERT ... SELECT ... WHERE. Возвращает запись или None, если пользователя
+    нет или не хватает баланса.
+    """
+    entries = await append_many(
+        db, user_id, [(transaction_type, amount, gift_id, tx_hash)], currency, debit=debit
+    )
+    return entries[0] if entries else None
+
+
+async def append_many(
+    db: AsyncSession,
+    user_id: int,
+    entries: Sequence[Tuple[str, float, Optional[str], Optional[str]]],
+    currency: str = 'TON',
+    *,
+    debit: bool = False
+) -> List[Transaction]:
+    """
+    Добавляет несколько записей одним INSERT ... SELECT (без commit): все или ни одной.
+    entries - (transaction_type, amount, gift_id, tx_hash). Для списания баланс
+    проверяется один раз на сумму всех записей. Возвращает записи или пустой список.
+    """
+    sign = -1 if debit else 1
+    rows = [
+        select(
+            literal(user_id, BigInteger).label('user_id'),
+            literal(transaction_type, String).label('transaction_type'),
+            literal(amount, Float).label('amount'),
+            literal(currency, String).label('currency'),
+            literal(gift_id, String).label('gift_id'),
+            literal(tx_hash, String).label('tx_hash'),
+            literal('completed', String).label('status'),
+            literal(sign * to_minor(amount, currency), BigInteger).label('ledger_amount'),
+        )
+        for transaction_type, amount, gift_id, tx_hash in entries
+    ]
+    conditions = [exists().where(User.user_id == user_id)]
+    if debit:
+        if db.get_bind().dialect.name == 'postgresql':
+            # В READ COMMITTED два INSERT ... SELECT могут увидеть один и тот же баланс,
+            # поэтому списания одного пользователя идут по очереди (до конца транзакции)
+            await db.execute(locks.xact_lock(locks.LEDGER, user_id))
+        total = sum(to_minor(amount, currency) for _, amount, _, _ in entries)
+        conditions.append(balance_minor(user_id, currency) >= total)
+
+    values = rows[0] if len(rows) == 1 else union_all(*rows).subquery().select()
+    return (await db.scalars(
+        insert(Transaction)
+        .from_select(
+            ['user_id', 'transaction_type', 'amount', 'currency', 'gift_id', 'tx_hash', 'status', 'ledger_amount'],
+            values.where(*conditions)
+        )
+        .returning(Transaction)
+    )).all()
+
+
+# Колонки записей для copy_entries(), в порядке значений кортежа
+ENTRY_COLUMNS = ('user_id', 'transaction_type', 'amount', 'currency', 'tx_hash', 'status', 'ledger_amount')
+# Временная таблица для COPY: COPY не умеет ON CONFLICT
+COPY_TABLE = table('ledger_copy', *[column(name) for name in ENTRY_COLUMNS])
+
+
+def _skip_loaded_deposits(stmt):
+    """ON CONFLICT DO NOTHING по uq_transactions_deposit_tx_hash: уже зачисленный tx_hash пропускается"""
+    return stmt.on_conflict_do_nothing(
+        index_elements=[Transaction.tx_hash], index_where=DEPOSIT_TX_HASH_WHERE
+    ).returning(Transaction.user_id, Transaction.currency)
+
+
+async def copy_entries(db: AsyncSession, entries: Sequence[tuple]) -> list:
+    """
+    Массовая вставка записей леджера без проверок баланса (без commit): COPY на
+    PostgreSQL, executemany на SQLite. entries - кортежи значений ENTRY_COLUMNS.
+    Пополнения с уже записанным tx_hash не вставляются; возвращает (user_id, currency)
+    действительно вставленных записей
+    """
+    if not entries:
+        return []
+    if db.get_bind().dialect.name == 'postgresql':
+        # COPY идет через asyncpg-соединение сессии во временную таблицу (внутри ее
+        # транзакции), оттуда - одним INSERT ... SELECT ... ON CONFLICT DO NOTHING
+        connection = await db.connection()
+        await connection.execute(text(
+            f"CREATE TEMP TABLE {COPY_TABLE.name} ON COMMIT DROP AS "
+            f"SELECT {', '.join(ENTRY_COLUMNS)} FROM transactions WITH NO DATA"
+        ))
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            COPY_TABLE.name, records=entries, columns=ENTRY_COLUMNS
+        )
+        inserted = (await db.execute(_skip_loaded_deposits(
+            postgresql.insert(Transaction).from_select(ENTRY_COLUMNS, select(COPY_TABLE))
+        ))).all()
+        await connection.execute(text(f"DROP TABLE {COPY_TABLE.name}"))
+        return inserted
+    return (await db.execute(
+        _skip_loaded_deposits(sqlite.insert(Transaction)), [dict(zip(ENTRY_COLUMNS, entry)) for entry in entries]
+    )).all()
+
+
+class Snapshotter:
+    """
+    Фоновое обновление снапшотов. Снапшот нельзя догнать до записи, пока запись
+    с меньшим id может быть еще не закоммичена: после коммита она оказалась бы
+    ниже last_entry_id и не попала бы в баланс.
+
+    PostgreSQL: MAX(id) прошлого прохода на следующем проходе становится границей
+    вместе с xmax текущего снапшота транзакций - к этому моменту каждая транзакция,
+    получившая id не больше границы, уже имеет xid меньше xmax. Снапшот догоняется
+    до границы, когда xmin (самая старая активная транзакция) дошел до этого xmax,
+    то есть все такие транзакции завершились, сколько бы они ни длились.
+    SQLite: писатель один, поэтому все записи до MAX(id) уже закоммичены.
+    """
+
+    def __init__(self, session_factory, interval: float = SNAPSHOT_INTERVAL):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._candidate = None  # MAX(id) прошлого прохода
+        self._fence = None      # (cutoff, xmax): догнать до cutoff, когда xmin >= xmax
+
+    async def _next_cutoff(self, db: AsyncSession) -> Optional[int]:
+        if db.get_bind().dialect.name != 'postgresql':
+            return await db.scalar(select(func.max(Transaction.id)))
+        latest, xmin, xmax = (await db.execute(HORIZON_SQL)).one()
+        cutoff = None
+        if self._fence and xmin >= self._fence[1]:
+            cutoff, self._fence = self._fence[0], None
+        if self._fence is None and self._candidate:
+            self._fence = (self._candidate, xmax)
+        self._candidate = latest
+        return cutoff
+
+    async def run_once(self):
+        async with self.session_factory() as db:
+            cutoff = await self._next_cutoff(db)
+            if cutoff:
+                await db.execute(SNAPSHOT_SQL, {"cutoff": cutoff})
+                await db.commit()
+
+    async def run_forever(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                log.exception("snapshot refresh failed")
+            await asyncio.sleep(self.interval)
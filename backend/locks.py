@@ -0,0 +1,28 @@
+"""
+Advisory lock PostgreSQL
+Все блокировки берутся в форме с двумя int4 (пространство, ключ): она не
+пересекается с формой с одним bigint, а у каждой подсистемы свое пространство,
+поэтому user_id не совпадет с ключом миграций или другой подсистемы.
+"""
+from sqlalchemy import select, func
+
+# Пространства ключей; новое пространство - новая константа, значения не меняются
+LEDGER = 727_011        # ключ - user_id: списания одного пользователя идут по очереди
+MIGRATIONS = 727_001    # ключ - 0: несколько воркеров не мигрируют одновременно
+# ключ - 0: загрузки пополнений идут по очереди, чтобы пересекающиеся пачки не ждали
+# друг друга на uq_transactions_deposit_tx_hash (и не ловили взаимную блокировку)
+DEPOSIT_INGEST = 727_002
+
+
+def int4_key(value: int) -> int:
+    """
+    BIGINT -> int4 для второго ключа. Большие user_id сворачиваются (старшие
+    32 бита XOR младшие); совпадение ключей лишь выстроит двух пользователей в очередь
+    """
+    folded = (value ^ (value >> 32)) & 0xFFFFFFFF
+    return folded - (1 << 32) if folded >= 1 << 31 else folded
+
+
+def xact_lock(namespace: int, key: int = 0):
+    """SELECT pg_advisory_xact_lock(namespace, key): блокировка до конца транзакции"""
+    return select(func.pg_advisory_xact_lock(namespace, int4_key(key)))
@@ -0,0 +1,123 @@
+"""
+Метрики Prometheus для GET /metrics
+- задержка запросов по маршруту (шаблону пути), методу и статусу, запросы в обработке;
+- запросы к БД: общее число и время по движку, число и суммарное время на HTTP-запрос
+  (события before/after_cursor_execute в database.py);
+- бизнес-счетчики: покупки, пополнения, активации промокодов.
+При нескольких воркерах задайте PROMETHEUS_MULTIPROC_DIR (пустая директория,
+общая для воркеров) - /metrics соберет метрики всех процессов.
+"""
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+)
+
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR', '')
+
+# Маршрут, если запрос не дошел до эндпоинта (404, отказ лимитов 429/503):
+# не плодим метки по сырым путям
+UNMATCHED_ROUTE = "unmatched"
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests being processed", multiprocess_mode="livesum"
+)
+
+DB_QUERIES = Counter("db_queries_total", "SQL statements executed", ["engine"])
+DB_QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "SQL statement latency", ["engine"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "SQL statements per HTTP request", ["method", "route"],
+    buckets=(0, 1, 2, 3, 4, 5, 8, 13, 21, 50)
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds", "Total SQL time per HTTP request", ["method", "route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+
+# outcome: ok или класс ошибки (InsufficientBalance, GiftAlreadyPurchased, ...)
+PURCHASES = Counter("capsule_purchases_total", "Purchase requests by endpoint and outcome", ["endpoint", "outcome"])
+GIFTS_PURCHASED = Counter("capsule_gifts_purchased_total", "Gifts bought via /purchase and /checkout")
+# source: api или bulk
+DEPOSITS = Counter("capsule_deposits_total", "Ledger deposits", ["source", "currency"])
+PROMO_ACTIVATIONS = Counter("capsule_promo_activations_total", "Promo code activations by outcome", ["outcome"])
+
+
+class RequestQueries:
+    """Запросы к БД текущего HTTP-запроса"""
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# Заполняется MetricsMiddleware; фоновые задачи и скрипты работают без него
+_current_request: ContextVar[Optional[RequestQueries]] = ContextVar("metrics_request", default=None)
+
+
+def record_query(engine: str, seconds: float):
+    """Вызывается из события after_cursor_execute (database.py)"""
+    DB_QUERIES.labels(engine).inc()
+    DB_QUERY_LATENCY.labels(engine).observe(seconds)
+    queries = _current_request.get()
+    if queries is not None:
+        queries.count += 1
+        queries.seconds += seconds
+
+
+def render() -> tuple:
+    """(тело, content-type) для GET /metrics"""
+    registry = REGISTRY
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+class MetricsMiddleware:
+    """ASGI middleware: задержка, статус и запросы к БД каждого HTTP-запроса"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        queries = RequestQueries()
+        token = _current_request.set(queries)
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            REQUESTS_IN_FLIGHT.dec()
+            _current_request.reset(token)
+            # Шаблон пути (/api/user/{user_id}) после маршрутизации, а не сырой путь
+            route = getattr(scope.get("route"), "path", UNMATCHED_ROUTE)
+            method = scope["method"]
+            REQUEST_LATENCY.labels(method, route, str(status_code)).observe(elapsed)
+            DB_QUERIES_PER_REQUEST.labels(method, route).observe(queries.count)
+            DB_TIME_PER_REQUEST.labels(method, route).observe(queries.seconds)
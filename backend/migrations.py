@@ -0,0 +1,211 @@
+"""
+Версионные миграции схемы БД
+Примененные версии хранятся в таблице schema_version; при старте
+выполняются только миграции с номером больше сохраненного.
+Новая миграция - новая функция и запись в MIGRATIONS, старые не меняются.
+"""
+from sqlalchemy import Column, Integer, String, DateTime, MetaData, Table, select, insert, func, text, inspect, bindparam
+from sqlalchemy.engine import Connection
+
+import locks
+import logconfig
+from database import Base
+
+log = logconfig.get_logger("capsule.migrations")
+
+# Таблица версий живет вне Base.metadata, чтобы create_all моделей ее не трогал
+schema_metadata = MetaData()
+schema_version = Table(
+    "schema_version", schema_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String(255), nullable=False),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+def _create_indexes(conn: Connection, table_name: str, names):
+    """Создает объявленные в models.py индексы, если их еще нет"""
+    table = Base.metadata.tables[table_name]
+    for index in table.indexes:
+        if index.name in names:
+            index.create(bind=conn, checkfirst=True)
+
+
+def _base_tables(conn: Connection):
+    import models  # noqa: F401 - регистрирует модели в Base.metadata
+    Base.metadata.create_all(bind=conn)
+
+
+def _user_gifts_unique(conn: Connection):
+    # Старая покупка без блокировки могла записать один подарок пользователю дважды
+    # и дважды списать его цену. Остается самая ранняя строка пары (user_id, gift_id),
+    # остальные удаляются, а их цена возвращается на users.balance_ton (миграция 5
+    # перенесет его во входящий остаток) с записью refund в истории транзакций
+    duplicates = conn.execute(text(
+        "SELECT g.id, g.user_id, g.gift_id, g.gift_price, g.purchase_date FROM user_gifts g "
+        "WHERE EXISTS (SELECT 1 FROM user_gifts e WHERE e.user_id = g.user_id AND e.gift_id = g.gift_id AND e.id < g.id) "
+        "ORDER BY g.id"
+    )).all()
+    for row in duplicates:
+        log.warning("refunding duplicated user gift", extra={
+            "id": row.id, "user_id": row.user_id, "gift_id": row.gift_id,
+            "gift_price": row.gift_price, "purchase_date": row.purchase_date,
+        })
+    refunds = [row for row in duplicates if row.gift_price]
+    if refunds:
+        conn.execute(
+            text("UPDATE users SET balance_ton = balance_ton + :amount WHERE user_id = :user_id"),
+            [{"user_id": row.user_id, "amount": row.gift_price} for row in refunds]
+        )
+        conn.execute(
+            text(
+                "INSERT INTO transactions (user_id, transaction_type, amount, currency, gift_id, status) "
+                "VALUES (:user_id, 'refund', :amount, 'TON', :gift_id, 'completed')"
+            ),
+            [{"user_id": row.user_id, "amount": row.gift_price, "gift_id": row.gift_id} for row in refunds]
+        )
+    for start in range(0, len(duplicates), 1000):
+        conn.execute(
+            text("DELETE FROM user_gifts WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+            {"ids": [row.id for row in duplicates[start:start + 1000]]}
+        )
+    if duplicates:
+        log.warning("duplicated user gifts refunded and removed", extra={
+            "rows": len(duplicates), "refunded_ton": sum(row.gift_price for row in refunds),
+        })
+    _create_indexes(conn, "user_gifts", {"uq_user_gifts_user_gift"})
+
+
+def _access_pattern_indexes(conn: Connection):
+    _create_indexes(conn, "transactions", {"ix_transactions_tx_hash"})
+    # ix_transactions_user_created объявлялся в models.py до миграции 4
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_transactions_user_created ON transactions (user_id, created_at DESC)"
+    ))
+    _create_indexes(conn, "promo_codes", {"ix_promo_codes_unused"})
+
+
+def _keyset_indexes(conn: Connection):
+    # Индекс с id в конце заменяет ix_transactions_user_created из миграции 3
+    _create_indexes(conn, "transactions", {"ix_transactions_user_created_id"})
+    _create_indexes(conn, "user_gifts", {"ix_user_gifts_user_purchased_id"})
+    conn.execute(text("DROP INDEX IF EXISTS ix_transactions_user_created"))
+
+
+def _balance_ledger(conn: Connection):
+    import ledger
+    columns = {column["name"] for column in inspect(conn).get_columns("transactions")}
+    if "ledger_amount" not in columns:
+        conn.execute(text("ALTER TABLE transactions ADD COLUMN ledger_amount BIGINT"))
+    Base.metadata.tables["balance_snapshots"].create(bind=conn, checkfirst=True)
+    _create_indexes(conn, "transactions", {"ix_transactions_ledger_tail"})
+    # Текущие балансы переносятся в леджер входящими остатками
+    conn.execute(text(
+        "INSERT INTO transactions (user_id, transaction_type, amount, currency, status, ledger_amount) "
+        "SELECT user_id, 'opening_balance', balance_ton, 'TON', 'completed', "
+        f"CAST(ROUND(balance_ton * {ledger.TON_NANO}) AS BIGINT) FROM users WHERE balance_ton <> 0"
+    ))
+    conn.execute(text(
+        "INSERT INTO transactions (user_id, transaction_type, amount, currency, status, ledger_amount) "
+        "SELECT user_id, 'opening_balance', balance_stars, 'STARS', 'completed', balance_stars "
+        "FROM users WHERE balance_stars <> 0"
+    ))
+    cutoff = conn.execute(text("SELECT MAX(id) FROM transactions")).scalar() or 0
+    conn.execute(ledger.SNAPSHOT_SQL, {"cutoff": cutoff})
+
+
+def _idempotency_keys(conn: Connection):
+    Base.metadata.tables["idempotency_keys"].create(bind=conn, checkfirst=True)
+    _create_indexes(conn, "idempotency_keys", {"ix_idempotency_keys_expires_at"})
+
+
+def _bigint_user_ids(conn: Connection):
+    # Раньше админ-бот проверял и менял тип при каждом импорте (bot/admin_bot.py)
+    if conn.dialect.name != "postgresql":
+        return
+    for table in ("users", "user_gifts", "transactions"):
+        data_type = conn.execute(text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_name = :table AND column_name = 'user_id'"
+        ), {"table": table}).scalar()
+        if data_type == "integer":
+            conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN user_id TYPE BIGINT"))
+
+
+def _unique_deposit_tx_hash(conn: Connection):
+    # Раньше дедупликация пополнений была проверкой перед вставкой, и параллельные
+    # загрузки могли зачислить один tx_hash несколько раз. Лишнее зачисление нельзя
+    # молча удалить или оставить, поэтому миграция останавливается со списком хешей
+    duplicates = conn.execute(text(
+        "SELECT tx_hash, COUNT(*) AS entries, SUM(amount) AS credited FROM transactions "
+        "WHERE tx_hash IS NOT NULL AND transaction_type = 'deposit' "
+        "GROUP BY tx_hash HAVING COUNT(*) > 1 ORDER BY tx_hash"
+    )).all()
+    if duplicates:
+        for row in duplicates:
+            log.error("duplicated deposit tx_hash", extra={
+                "tx_hash": row.tx_hash, "entries": row.entries, "credited": row.credited,
+            })
+        hashes = ", ".join(row.tx_hash for row in duplicates[:20])
+        raise RuntimeError(
+            f"{len(duplicates)} deposit tx_hash values are credited more than once ({hashes}"
+            f"{', ...' if len(duplicates) > 20 else ''}); resolve them before upgrading"
+        )
+    _create_indexes(conn, "transactions", {"uq_transactions_deposit_tx_hash"})
+
+
+# (версия, описание, функция) - строго по возрастанию версии
+MIGRATIONS = [
+    (1, "base tables", _base_tables),
+    (2, "unique user_gifts (user_id, gift_id)", _user_gifts_unique),
+    (3, "transactions, tx_hash and unused promo code indexes", _access_pattern_indexes),
+    (4, "keyset pagination indexes for transactions and gifts", _keyset_indexes),
+    (5, "append-only balance ledger and snapshots", _balance_ledger),
+    (6, "idempotency keys", _idempotency_keys),
+    (7, "BIGINT user_id in users, user_gifts and transactions", _bigint_user_ids),
+    (8, "unique deposit tx_hash", _unique_deposit_tx_hash),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn: Connection) -> int:
+    schema_metadata.create_all(bind=conn)
+    return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def stored_version(conn: Connection) -> int:
+    """Версия схемы без DDL и блокировок; 0, если БД еще не мигрировали"""
+    if not inspect(conn).has_table(schema_version.name):
+        return 0
+    return conn.execute(select(func.max(schema_version.c.version))).scalar() or 0
+
+
+def run_migrations(engine) -> int:
+    """Применяет недостающие миграции, каждую в своей транзакции. Возвращает версию схемы"""
+    with engine.connect() as conn:
+        # Быстрый путь при каждом старте: схема актуальна - ни блокировки, ни create_all
+        version = stored_version(conn)
+        conn.commit()
+        if version >= LATEST_VERSION:
+            return version
+        is_postgres = conn.dialect.name == "postgresql"
+        if is_postgres:
+            conn.execute(text("SELECT pg_advisory_lock(:namespace, 0)"), {"namespace": locks.MIGRATIONS})
+            conn.commit()
+        try:
+            version = current_version(conn)
+            conn.commit()
+            for number, description, migrate in MIGRATIONS:
+                if number <= version:
+                    continue
+                log.info("applying migration", extra={"version": number, "description": description})
+                with conn.begin():
+                    migrate(conn)
+                    conn.execute(insert(schema_version).values(version=number, description=description))
+                version = number
+            return version
+        finally:
+            if is_postgres:
+                conn.execute(text("SELECT pg_advisory_unlock(:namespace, 0)"), {"namespace": locks.MIGRATIONS})
+                conn.commit()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, ForeignKey, Text, Boolean, Index, and_, literal_column
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -9,6 +9,7 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(BigInteger, unique=True, index=True, nullable=False)  # Telegram user ID (может быть большим числом)
     wallet_address = Column(String(255), nullable=True)  # TON wallet address
+    # Устарело: API ведет баланс в леджере (transactions.ledger_amount), колонки не обновляются
     balance_ton = Column(Float, default=0.0, nullable=False)
     balance_stars = Column(Integer, default=0, nullable=False)
     username = Column(String(255), nullable=True)
@@ -37,6 +38,11 @@ class UserGift(Base):
     # Связи
     user = relationship("User", back_populates="gifts")
 
+    # Один и тот же подарок нельзя купить дважды
+    __table_args__ = (
+        Index('uq_user_gifts_user_gift', 'user_id', 'gift_id', unique=True),
+    )
+
 
 class Transaction(Base):
     __tablename__ = "transactions"
@@ -49,6 +55,9 @@ class Transaction(Base):
     gift_id = Column(String(255), nullable=True)  # Если это покупка подарка
     status = Column(String(50), default='completed')  # 'pending', 'completed', 'failed'
     tx_hash = Column(String(255), nullable=True)  # Хеш транзакции TON
+    # Изменение баланса в минимальных единицах (nanoTON / Stars), со знаком.
+    # NULL - запись только для истории, на баланс не влияет
+    ledger_amount = Column(BigInteger, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Связи
@@ -69,3 +78,55 @@ class PromoCode(Base):
     # Связь с транзакцией
     transaction_id = Column(Integer, nullable=True)
 
+
+# Баланс пользователя в валюте на момент записи леджера last_entry_id (см. ledger.py)
+class BalanceSnapshot(Base):
+    __tablename__ = "balance_snapshots"
+    
+    user_id = Column(BigInteger, primary_key=True)
+    currency = Column(String(10), primary_key=True)  # 'TON' or 'STARS'
+    balance_minor = Column(BigInteger, nullable=False)  # nanoTON / Stars
+    last_entry_id = Column(Integer, nullable=False)  # transactions.id последней учтенной записи
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+# Ответ на запрос с заголовком Idempotency-Key (см. idempotency.py)
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+    
+    user_id = Column(BigInteger, primary_key=True)
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)  # sha256 эндпоинта и тела запроса
+    status_code = Column(Integer, nullable=True)  # NULL - запрос еще выполняется
+    response_body = Column(Text, nullable=True)  # JSON ответа
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+
+
+# Индексы под основные запросы. На существующих БД их создают миграции (migrations.py)
+# История транзакций и подарков постранично: WHERE user_id = ? ORDER BY <дата> DESC, id DESC
+Index('ix_transactions_user_created_id', Transaction.user_id, Transaction.created_at.desc(), Transaction.id.desc())
+Index('ix_user_gifts_user_purchased_id', UserGift.user_id, UserGift.purchase_date.desc(), UserGift.id.desc())
+# Хвост леджера после снапшота: WHERE user_id = ? AND currency = ? AND id > ?
+Index('ix_transactions_ledger_tail', Transaction.user_id, Transaction.currency, Transaction.id)
+# Поиск транзакции по хешу TON
+Index('ix_transactions_tx_hash', Transaction.tx_hash)
+# Один tx_hash - одно пополнение: повторная сверка или гонка с POST /deposit не зачисляет дважды.
+# Условие нужно и в ON CONFLICT (index_where), чтобы БД нашла этот частичный индекс;
+# 'deposit' - литерал, с параметром PostgreSQL индекс не найдет
+DEPOSIT_TX_HASH_WHERE = and_(
+    Transaction.tx_hash.isnot(None), Transaction.transaction_type == literal_column("'deposit'")
+)
+Index(
+    'uq_transactions_deposit_tx_hash', Transaction.tx_hash, unique=True,
+    postgresql_where=DEPOSIT_TX_HASH_WHERE,
+    sqlite_where=DEPOSIT_TX_HASH_WHERE
+)
+# Очистка просроченных ключей идемпотентности
+Index('ix_idempotency_keys_expires_at', IdempotencyKey.expires_at)
+# Частичный индекс только по неиспользованным промокодам
+Index(
+    'ix_promo_codes_unused', PromoCode.code,
+    postgresql_where=PromoCode.is_used.is_(False),
+    sqlite_where=PromoCode.is_used.is_(False)
+)
@@ -0,0 +1,82 @@
+"""
+Курсорная (keyset) пагинация списков
+Страница выбирается условием (sort_column, id) < (курсор) по индексу
+(user_id, sort_column DESC, id DESC), поэтому стоимость страницы не зависит
+от того, насколько далеко пользователь пролистал. Курсор непрозрачен для клиента.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import String, and_, or_, type_coerce
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Заголовок ответа с курсором следующей страницы (тело остается списком)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursor(ValueError):
+    """Курсор поврежден или получен не от этого API"""
+
+
+def encode_cursor(sort_value: datetime, row_id: int) -> str:
+    raw = json.dumps([sort_value.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(str(e)) from e
+
+
+def _sqlite_datetime(value: datetime) -> str:
+    """
+    SQLite хранит даты строками; server_default (CURRENT_TIMESTAMP) пишет их без
+    микросекунд, поэтому сравниваем со строкой в том же формате, а не с параметром
+    DateTime (тот всегда добавляет .000000 и ломает сравнение равных значений)
+    """
+    text = value.strftime("%Y-%m-%d %H:%M:%S")
+    if value.microsecond:
+        text += f".{value.microsecond:06d}"
+    return text
+
+
+def after_cursor(stmt, sort_column, id_column, cursor: Optional[str], dialect_name: str):
+    """Добавляет к запросу порядок (sort_column DESC, id DESC) и условие продолжения после курсора"""
+    stmt = stmt.order_by(sort_column.desc(), id_column.desc())
+    if not cursor:
+        return stmt
+    sort_value, row_id = decode_cursor(cursor)
+    if dialect_name == "sqlite":
+        sort_column, sort_value = type_coerce(sort_column, String), _sqlite_datetime(sort_value)
+    return stmt.where(or_(
+        sort_column < sort_value,
+        and_(sort_column == sort_value, id_column < row_id)
+    ))
+
+
+def split_page(rows, limit: int, sort_attr: str):
+    """Из limit + 1 строк возвращает (страница, курсор следующей страницы или None)"""
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    last = page[-1]
+    return page, encode_cursor(getattr(last, sort_attr), last.id)
+
+
+async def fetch_page(db, stmt, sort_column, id_column, sort_attr: str, cursor: Optional[str], limit: int,
+                     as_rows: bool = False):
+    """
+    Выполняет запрос страницы (limit + 1 строк) и возвращает (строки, курсор следующей страницы).
+    as_rows=True - запрос выбирает колонки, а не ORM-объекты; результат - кортежи Row
+    """
+    stmt = after_cursor(stmt, sort_column, id_column, cursor, db.get_bind().dialect.name).limit(limit + 1)
+    rows = (await db.execute(stmt)).all() if as_rows else (await db.scalars(stmt)).all()
+    return split_page(rows, limit, sort_attr)
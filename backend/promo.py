@@ -0,0 +1,73 @@
+"""
+Активация промокодов
+Промокод гасится условным UPDATE ... WHERE NOT is_used RETURNING amount,
+поэтому одновременные активации одного кода не могут обе пройти.
+Гашение и запись зачисления в леджер фиксируются одним commit.
+"""
+from datetime import datetime
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import ledger
+from models import PromoCode
+from cache import balance_cache
+
+
+class PromoError(Exception):
+    """Активация отклонена; status_code и detail уходят клиенту как есть"""
+    status_code = 400
+    detail = "Promo activation failed"
+
+
+class PromoNotFound(PromoError):
+    status_code = 404
+    detail = "Promo code not found"
+
+
+class PromoAlreadyUsed(PromoError):
+    detail = "Promo code already used"
+
+
+class UserNotFound(PromoError):
+    status_code = 404
+    detail = "User not found"
+
+
+async def activate_promo(db: AsyncSession, code: str, user_id: int) -> dict:
+    """Гасит промокод и зачисляет его сумму на TON-баланс пользователя"""
+    redeemed = (await db.execute(
+        update(PromoCode)
+        .where(PromoCode.code == code.upper(), PromoCode.is_used.is_(False))
+        .values(is_used=True, user_id=user_id, used_at=datetime.utcnow())
+        .returning(PromoCode.id, PromoCode.amount)
+        .execution_options(synchronize_session=False)
+    )).first()
+    if redeemed is None:
+        await db.rollback()
+        # Медленный путь только для ошибки: кода нет или он уже погашен
+        exists = await db.scalar(select(PromoCode.id).where(PromoCode.code == code.upper()))
+        raise PromoAlreadyUsed() if exists else PromoNotFound()
+    promo_id, amount = redeemed
+
+    entry = await ledger.append(db, user_id, 'deposit', amount, 'TON', tx_hash=f"PROMO_{code}")
+    if entry is None:
+        # Пользователя нет - откат возвращает промокод в неиспользованные
+        await db.rollback()
+        raise UserNotFound()
+
+    await db.execute(
+        update(PromoCode)
+        .where(PromoCode.id == promo_id)
+        .values(transaction_id=entry.id)
+        .execution_options(synchronize_session=False)
+    )
+    new_balance, _ = await ledger.get_balances(db, user_id)
+    await db.commit()
+    await balance_cache.invalidate(user_id)
+
+    return {
+        "success": True,
+        "amount": amount,
+        "new_balance": new_balance
+    }
@@ -0,0 +1,134 @@
+"""
+Атомарная покупка подарков
+Списание - запись леджера, которая вставляется только если баланса хватает
+(см. ledger.append), поэтому две параллельные покупки не могут обе пройти проверку.
+Повторная покупка отсекается уникальным индексом (user_id, gift_id).
+Корзина (checkout) покупается целиком или не покупается вовсе.
+"""
+from typing import List
+
+from sqlalchemy import select, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import ledger
+from models import User, UserGift
+from cache import balance_cache
+from schemas import PurchaseRequest, CheckoutRequest
+
+
+class PurchaseError(Exception):
+    """Покупка отклонена; status_code и detail уходят клиенту как есть"""
+    status_code = 400
+    detail = "Purchase failed"
+
+
+class UserNotFound(PurchaseError):
+    status_code = 404
+    detail = "User not found"
+
+
+class InsufficientBalance(PurchaseError):
+    detail = "Insufficient balance"
+
+
+class GiftAlreadyPurchased(PurchaseError):
+    detail = "Gift already purchased"
+
+
+class InvalidPrice(PurchaseError):
+    detail = "Invalid gift price"
+
+
+class DuplicateCartItem(PurchaseError):
+    detail = "Duplicate gift in cart"
+
+
+async def purchase_gift(db: AsyncSession, user_id: int, purchase_data: PurchaseRequest) -> UserGift:
+    """Списывает баланс и записывает подарок в одной транзакции БД"""
+    price = purchase_data.gift_price
+    if price < 0:
+        raise InvalidPrice()
+
+    # Списание с проверкой баланса одним запросом; запись леджера - это и транзакция покупки
+    entry = await ledger.append(
+        db, user_id, 'purchase', price, 'TON', debit=True, gift_id=purchase_data.gift_id
+    )
+    if entry is None:
+        await db.rollback()
+        # Медленный путь только для ошибки: выясняем, есть ли пользователь вообще
+        exists = await db.scalar(select(User.id).where(User.user_id == user_id))
+        raise InsufficientBalance() if exists else UserNotFound()
+
+    try:
+        user_gift = await db.scalar(
+            insert(UserGift)
+            .values(
+                user_id=user_id,
+                gift_id=purchase_data.gift_id,
+                gift_name=purchase_data.gift_name,
+                gift_preview=purchase_data.gift_preview,
+                gift_price=price
+            )
+            .returning(UserGift)
+        )
+    except IntegrityError:
+        # Подарок уже куплен - откат возвращает и списанный баланс
+        await db.rollback()
+        raise GiftAlreadyPurchased()
+
+    await db.commit()
+    await balance_cache.invalidate(user_id)
+    return user_gift
+
+
+async def checkout(db: AsyncSession, user_id: int, cart: CheckoutRequest) -> List[UserGift]:
+    """
+    Покупает все подарки корзины в одной транзакции БД: одна проверка дублей (IN),
+    одно списание суммы корзины, по одной пачке подарков и записей леджера
+    """
+    items = cart.items
+    if any(item.gift_price < 0 for item in items):
+        raise InvalidPrice()
+    gift_ids = [item.gift_id for item in items]
+    if len(set(gift_ids)) != len(gift_ids):
+        raise DuplicateCartItem()
+
+    owned = await db.scalar(
+        select(UserGift.id).where(UserGift.user_id == user_id, UserGift.gift_id.in_(gift_ids)).limit(1)
+    )
+    if owned is not None:
+        await db.rollback()
+        raise GiftAlreadyPurchased()
+
+    # Баланс проверяется на сумму корзины; запись леджера на каждый подарок
+    entries = await ledger.append_many(
+        db, user_id, [('purchase', item.gift_price, item.gift_id, None) for item in items], 'TON', debit=True
+    )
+    if not entries:
+        await db.rollback()
+        exists = await db.scalar(select(User.id).where(User.user_id == user_id))
+        raise InsufficientBalance() if exists else UserNotFound()
+
+    try:
+        user_gifts = (await db.scalars(
+            insert(UserGift).returning(UserGift, sort_by_parameter_order=True),
+            [
+                {
+                    'user_id': user_id,
+                    'gift_id': item.gift_id,
+                    'gift_name': item.gift_name,
+                    'gift_preview': item.gift_preview,
+                    'gift_price': item.gift_price,
+                }
+                for item in items
+            ]
+        )).all()
+    except IntegrityError:
+        # Подарок купили параллельным запросом - откат возвращает списание всей корзины
+        await db.rollback()
+        raise GiftAlreadyPurchased()
+
+    await db.commit()
+    await balance_cache.invalidate(user_id)
+    return user_gifts
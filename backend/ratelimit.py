@@ -0,0 +1,179 @@
+"""
+Ограничение частоты запросов и сброс нагрузки
+Token bucket на каждую пару (правило, пользователь): корзина емкостью burst
+пополняется rate токенами в секунду, запрос забирает токен, без токена - 429 с
+Retry-After. Пользователь берется из пути (/api/user/{user_id}/...) или из
+параметра user_id (промокоды), иначе - адрес клиента.
+MAX_CONCURRENT_REQUESTS ограничивает число одновременных запросов к /api:
+лишние сразу получают 503 вместо ожидания в очереди пула соединений БД.
+Корзины и счетчик живут в памяти процесса, лимиты действуют на каждый воркер.
+"""
+import os
+import re
+import math
+import time
+from typing import List, NamedTuple, Optional
+from urllib.parse import parse_qs
+
+from starlette.responses import JSONResponse
+
+from cache import LRUCache
+
+# "GET /api/user/{user_id}/balance=5:20; POST /api/user/{user_id}/purchase=1:5"
+# (метод или *, шаблон пути, запросов в секунду:burst)
+RATE_LIMITS = os.getenv('RATE_LIMITS', '')
+# Лимит на пользователя для остальных маршрутов /api, например "20:40"; пусто - без лимита
+RATE_LIMIT_DEFAULT = os.getenv('RATE_LIMIT_DEFAULT', '')
+# Сколько корзин держать в памяти (давно не использованные вытесняются)
+RATE_LIMIT_BUCKETS = int(os.getenv('RATE_LIMIT_BUCKETS', '100000'))
+# 0 - без ограничения
+MAX_CONCURRENT_REQUESTS = int(os.getenv('MAX_CONCURRENT_REQUESTS', '0'))
+
+API_PREFIX = "/api/"
+_USER_PATH = re.compile(r"^/api/user/(\d+)(?:/|$)")
+
+
+class Limit(NamedTuple):
+    rate: float  # токенов в секунду
+    burst: float  # емкость корзины
+
+
+class Rule(NamedTuple):
+    method: str
+    template: str
+    pattern: re.Pattern
+    limit: Limit
+
+
+def parse_limit(value: str) -> Limit:
+    """"5:20" - 5 запросов в секунду, всплеск до 20; "5" - burst равен rate"""
+    rate, _, burst = value.strip().partition(":")
+    limit = Limit(float(rate), float(burst or rate))
+    if limit.rate <= 0 or limit.burst < 1:
+        raise ValueError(f"Invalid rate limit: {value!r}")
+    return limit
+
+
+def _compile_template(template: str) -> re.Pattern:
+    # {name} -> один сегмент пути; остальное сравнивается буквально
+    parts = re.split(r"\{(\w+)\}", template)
+    regex = "".join(
+        re.escape(part) if index % 2 == 0 else f"(?P<{part}>[^/]+)"
+        for index, part in enumerate(parts)
+    )
+    return re.compile(f"^{regex}$")
+
+
+def parse_rules(spec: str) -> List[Rule]:
+    rules = []
+    for entry in filter(None, (item.strip() for item in spec.split(";"))):
+        route, _, limit = entry.rpartition("=")
+        method, _, template = route.strip().partition(" ")
+        if not template:
+            raise ValueError(f"Invalid rate limit rule: {entry!r}")
+        template = template.strip()
+        rules.append(Rule(method.upper(), template, _compile_template(template), parse_limit(limit)))
+    return rules
+
+
+class RateLimiter:
+    """Правила, корзины и счетчики; проверка запроса - check()"""
+
+    def __init__(self, rules: List[Rule], default: Optional[Limit] = None,
+                 max_concurrent: int = 0, buckets: int = RATE_LIMIT_BUCKETS):
+        self.rules = rules
+        self.default = default
+        self.max_concurrent = max_concurrent
+        # (шаблон маршрута, ключ клиента) -> [токены, время последнего пополнения]
+        self._buckets = LRUCache(buckets)
+        self.in_flight = 0
+        self.rate_limited = 0
+        self.shed = 0
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        default = parse_limit(RATE_LIMIT_DEFAULT) if RATE_LIMIT_DEFAULT else None
+        return cls(parse_rules(RATE_LIMITS), default, MAX_CONCURRENT_REQUESTS)
+
+    def _match(self, method: str, path: str):
+        for rule in self.rules:
+            if rule.method in (method, "*"):
+                match = rule.pattern.match(path)
+                if match:
+                    return rule.template, rule.limit, match.groupdict().get("user_id")
+        if self.default is not None:
+            match = _USER_PATH.match(path)
+            return "*", self.default, match.group(1) if match else None
+        return None
+
+    def _take(self, key, limit: Limit, now: float) -> float:
+        """Забирает токен; возвращает 0 или сколько секунд ждать следующего"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [limit.burst, now]
+            self._buckets.set(key, bucket)
+        tokens = min(limit.burst, bucket[0] + (now - bucket[1]) * limit.rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0.0
+        bucket[0] = tokens
+        return (1 - tokens) / limit.rate
+
+    def check(self, scope) -> float:
+        """0 - запрос пропускается, иначе секунды до следующей попытки"""
+        matched = self._match(scope["method"], scope["path"])
+        if matched is None:
+            return 0.0
+        template, limit, user_id = matched
+        if user_id is None:
+            user_id = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("user_id", [None])[0]
+        client = scope.get("client")
+        key = (template, f"user:{user_id}" if user_id else f"ip:{client[0] if client else ''}")
+        return self._take(key, limit, time.monotonic())
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_concurrent": self.max_concurrent,
+            "rate_limited": self.rate_limited,
+            "shed": self.shed,
+        }
+
+
+class RateLimitMiddleware:
+    """ASGI middleware: 429 сверх лимита частоты, 503 сверх лимита одновременных запросов"""
+
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(API_PREFIX):
+            await self.app(scope, receive, send)
+            return
+        limiter = self.limiter
+
+        retry_after = limiter.check(scope)
+        if retry_after:
+            limiter.rate_limited += 1
+            response = JSONResponse(
+                {"detail": "Too many requests"}, status_code=429,
+                headers={"Retry-After": str(math.ceil(retry_after))}
+            )
+            await response(scope, receive, send)
+            return
+
+        if limiter.max_concurrent and limiter.in_flight >= limiter.max_concurrent:
+            limiter.shed += 1
+            response = JSONResponse(
+                {"detail": "Server is busy, retry later"}, status_code=503, headers={"Retry-After": "1"}
+            )
+            await response(scope, receive, send)
+            return
+
+        limiter.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.in_flight -= 1
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 
@@ -76,6 +76,10 @@ class PurchaseRequest(BaseModel):
     gift_preview: Optional[str] = None
     gift_price: float
 
+# Checkout request: несколько подарков одной покупкой
+class CheckoutRequest(BaseModel):
+    items: List[PurchaseRequest] = Field(min_length=1, max_length=50)
+
 # Deposit request
 class DepositRequest(BaseModel):
     amount: float
@@ -87,3 +91,11 @@ class BalanceResponse(BaseModel):
     balance_ton: float
     balance_stars: int
 
+# Bootstrap response: все данные для старта мини-аппа одним ответом
+class BootstrapResponse(BaseModel):
+    user: UserResponse
+    balance: BalanceResponse
+    gifts: List[UserGiftResponse]
+    gifts_next_cursor: Optional[str] = None
+    transactions: List[TransactionResponse]
+    transactions_next_cursor: Optional[str] = None
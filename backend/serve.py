@@ -0,0 +1,138 @@
+"""
+Запуск API в продакшене: python serve.py (Procfile: web: python serve.py)
+Для разработки - run.py (автоперезагрузка).
+
+- воркеров столько, сколько ядер доступно процессу (с учетом квоты CPU cgroup
+  в контейнере), WEB_CONCURRENCY задает число явно; на SQLite - один воркер;
+  с репликами без CACHE_BACKEND=redis - тоже один (закрепления чтений за primary
+  не общие), а WEB_CONCURRENCY больше 1 - ошибка запуска;
+- uvloop и httptools, если установлены (входят в uvicorn[standard]);
+- keep-alive дольше простоя соединений у прокси перед сервисом, очередь
+  входящих соединений (backlog);
+- миграции выполняются один раз в родительском процессе до запуска воркеров
+  (воркеры стартуют с MIGRATE_ON_STARTUP=false и не гоняются за схему);
+- SIGTERM: воркеры перестают принимать соединения и дожидаются начатых
+  запросов, но не дольше GRACEFUL_TIMEOUT секунд;
+- воркеры - отдельные процессы (spawn): app.py импортируется в каждом, движки БД,
+  кэши и лимиты создаются в самом воркере, а не наследуются от родителя.
+  Метрики Prometheus собираются со всех воркеров через PROMETHEUS_MULTIPROC_DIR.
+
+Переменные окружения: PORT (8000), HOST (0.0.0.0), WEB_CONCURRENCY,
+KEEPALIVE_TIMEOUT (75), BACKLOG (2048), GRACEFUL_TIMEOUT (25),
+MAX_REQUESTS (0 - воркер не перезапускается по числу запросов), ACCESS_LOG (false).
+"""
+import os
+import glob
+import math
+import tempfile
+import importlib.util
+
+import uvicorn
+from dotenv import load_dotenv
+
+import logconfig
+
+load_dotenv()
+
+log = logconfig.get_logger("capsule.serve")
+
+HOST = os.getenv('HOST', '0.0.0.0')
+PORT = int(os.getenv('PORT', '8000'))
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '0'))
+# Railway/Heroku/балансировщики держат простаивающее соединение до ~60 секунд:
+# сервер не должен закрывать его раньше прокси, иначе гонка дает 502
+KEEPALIVE_TIMEOUT = int(os.getenv('KEEPALIVE_TIMEOUT', '75'))
+BACKLOG = int(os.getenv('BACKLOG', '2048'))
+GRACEFUL_TIMEOUT = int(os.getenv('GRACEFUL_TIMEOUT', '25'))
+MAX_REQUESTS = int(os.getenv('MAX_REQUESTS', '0'))
+ACCESS_LOG = os.getenv('ACCESS_LOG', 'false').lower() in ('1', 'true', 'yes')
+
+
+def available_cpus() -> int:
+    """Ядра, доступные процессу: affinity и квота CPU cgroup v2 (cpu.max в контейнере)"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:  # не Linux
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as stream:
+            quota, period = stream.read().split()
+        if quota != "max":
+            cpus = min(cpus, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return max(cpus, 1)
+
+
+def worker_count() -> int:
+    import database
+    # Без Redis закрепление чтений за primary (ReplicaRouter) живет в памяти воркера:
+    # другой воркер не знает о записи и отдаст пользователю отстающую реплику
+    local_pins = database.REPLICA_URLS and database.REPLICA_PIN_SECONDS > 0 and not database.REPLICA_PIN_SHARED
+    if WEB_CONCURRENCY > 0:
+        if WEB_CONCURRENCY > 1 and local_pins:
+            raise SystemExit("WEB_CONCURRENCY > 1 with DATABASE_REPLICA_URLS requires CACHE_BACKEND=redis")
+        return WEB_CONCURRENCY
+    # SQLite - один файл с блокировкой на запись: воркеры будут ждать друг друга
+    if not os.getenv('DATABASE_URL', '').startswith(('postgres', 'postgresql')):
+        return 1
+    if local_pins:
+        log.warning("replica pins are per process without CACHE_BACKEND=redis, starting one worker")
+        return 1
+    return available_cpus()
+
+
+def prepare_metrics_dir(workers: int):
+    """Общая директория метрик для воркеров; файлы прошлого запуска удаляются"""
+    if workers <= 1:
+        return
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if not directory:
+        directory = tempfile.mkdtemp(prefix="capsule-metrics-")
+        # Воркеры наследуют окружение и импортируют metrics.py уже с ней
+        os.environ['PROMETHEUS_MULTIPROC_DIR'] = directory
+    for path in glob.glob(os.path.join(directory, "*.db")):
+        os.remove(path)
+
+
+def migrate_once():
+    """Миграции до запуска воркеров; движок родителя закрывается, воркеры создают свои"""
+    if os.getenv('MIGRATE_ON_STARTUP', 'true').lower() not in ('1', 'true', 'yes'):
+        return
+    import database
+    version = database.init_db()
+    database.engine.dispose()
+    log.info("database initialized", extra={"schema_version": version})
+    os.environ['MIGRATE_ON_STARTUP'] = 'false'
+
+
+def main():
+    workers = worker_count()
+    migrate_once()
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    prepare_metrics_dir(workers)
+    log.info("starting API", extra={
+        "host": HOST, "port": PORT, "workers": workers, "loop": loop, "http": http,
+        "keepalive_s": KEEPALIVE_TIMEOUT, "backlog": BACKLOG, "graceful_timeout_s": GRACEFUL_TIMEOUT,
+    })
+    uvicorn.run(
+        "app:app",
+        host=HOST,
+        port=PORT,
+        workers=workers,
+        loop=loop,
+        http=http,
+        backlog=BACKLOG,
+        timeout_keep_alive=KEEPALIVE_TIMEOUT,
+        timeout_graceful_shutdown=GRACEFUL_TIMEOUT,
+        limit_max_requests=MAX_REQUESTS or None,
+        access_log=ACCESS_LOG,
+        # Логи uvicorn идут через logconfig (JSON через очередь), а не через его собственный конфиг
+        log_config=None,
+        server_header=False,
+    )
+
+
+if __name__ == "__main__":
+    main()
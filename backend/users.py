@@ -0,0 +1,119 @@
+"""
+Регистрация пользователей через upsert
+INSERT ... ON CONFLICT (user_id) DO UPDATE/DO NOTHING - один запрос вместо
+SELECT + INSERT/UPDATE. Работает на PostgreSQL и SQLite (3.24+).
+"""
+from typing import Iterable, Optional
+
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import User
+
+# Поля профиля, которые обновляются при повторной регистрации
+PROFILE_FIELDS = ('username', 'first_name', 'last_name', 'is_premium')
+
+# Лимит параметров в одном запросе: SQLite - 32766, PostgreSQL - 65535
+MAX_BIND_PARAMS = {'sqlite': 32766, 'postgresql': 65535}
+
+
+def _insert(db: AsyncSession):
+    """insert() с поддержкой ON CONFLICT для диалекта текущей БД"""
+    dialect = db.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return postgresql.insert(User)
+    if dialect == 'sqlite':
+        return sqlite.insert(User)
+    raise NotImplementedError(f"Upsert is not supported for {dialect}")
+
+
+async def ensure_user(db: AsyncSession, user_id: int):
+    """Создает пользователя с нулевым балансом, если его еще нет (без commit)"""
+    await db.execute(
+        _insert(db)
+        .values(user_id=user_id, balance_ton=0.0, balance_stars=0)
+        .on_conflict_do_nothing(index_elements=[User.user_id])
+    )
+
+
+async def ensure_users(db: AsyncSession, user_ids: Iterable[int]):
+    """Создает недостающих пользователей пачками INSERT ... ON CONFLICT DO NOTHING (без commit)"""
+    user_ids = list(user_ids)
+    # user_id и Python-default колонки (балансы, is_premium) - 4 параметра на строку
+    size = MAX_BIND_PARAMS.get(db.get_bind().dialect.name, 32766) // 4
+    for start in range(0, len(user_ids), size):
+        await db.execute(
+            _insert(db)
+            .values([
+                {'user_id': user_id, 'balance_ton': 0.0, 'balance_stars': 0}
+                for user_id in user_ids[start:start + size]
+            ])
+            .on_conflict_do_nothing(index_elements=[User.user_id])
+        )
+
+
+async def upsert_user(db: AsyncSession, user_data: dict) -> User:
+    """
+    Создает пользователя или обновляет профиль существующего и возвращает строку.
+    Как и раньше, пустые поля профиля не затирают сохраненные значения.
+    """
+    stmt = _insert(db).values(**user_data)
+    updates = {
+        field: stmt.excluded[field]
+        for field in PROFILE_FIELDS
+        if user_data.get(field) or (field == 'is_premium' and user_data.get(field) is not None)
+    }
+    if updates:
+        updates['updated_at'] = func.now()
+    else:
+        # DO UPDATE без изменений нужен, чтобы RETURNING вернул существующую строку
+        updates = {'user_id': stmt.excluded.user_id}
+
+    user = await db.scalar(
+        stmt.on_conflict_do_update(index_elements=[User.user_id], set_=updates)
+        .returning(User),
+        execution_options={"populate_existing": True}
+    )
+    await db.commit()
+    return user
+
+
+async def bulk_upsert_users(db: AsyncSession, rows: Iterable[dict], chunk_size: Optional[int] = None) -> int:
+    """
+    Регистрирует пользователей пачкой для бэкфиллов: один INSERT ... ON CONFLICT
+    на пачку строк с одинаковым набором заполненных полей. Заполненные поля
+    перезаписывают сохраненные, пустые не трогаются. Возвращает число строк.
+    """
+    # Строки одного user_id сливаются (поздние поля побеждают): PostgreSQL не дает
+    # ON CONFLICT DO UPDATE изменить одну строку дважды в одном запросе
+    merged = {}
+    total = 0
+    for row in rows:
+        values = merged.setdefault(row['user_id'], {'user_id': row['user_id']})
+        values.update({
+            field: row[field]
+            for field in ('wallet_address',) + PROFILE_FIELDS
+            if row.get(field) not in (None, '')
+        })
+        total += 1
+    # Группируем строки по набору заполненных полей, чтобы пустые поля не затирали данные
+    groups = {}
+    for values in merged.values():
+        groups.setdefault(tuple(values), []).append(values)
+
+    limit = MAX_BIND_PARAMS.get(db.get_bind().dialect.name, 32766)
+    for columns, group in groups.items():
+        # Python-default колонки (балансы, is_premium) тоже уходят параметрами
+        size = chunk_size or limit // (len(columns) + 3)
+        for start in range(0, len(group), size):
+            stmt = _insert(db).values(group[start:start + size])
+            updates = {field: stmt.excluded[field] for field in columns if field != 'user_id'}
+            if updates:
+                updates['updated_at'] = func.now()
+                stmt = stmt.on_conflict_do_update(index_elements=[User.user_id], set_=updates)
+            else:
+                stmt = stmt.on_conflict_do_nothing(index_elements=[User.user_id])
+            await db.execute(stmt)
+    await db.commit()
+    return total
@@ -3,19 +3,24 @@ import sys
 import asyncio
 from typing import Optional
 from datetime import datetime
+from decimal import Decimal
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters, CallbackQueryHandler
-from sqlalchemy import create_engine, func
+from sqlalchemy import create_engine, func, inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
 
 # Импортируем модели (теперь они в той же папке bot/)
 from models import User, UserGift, Transaction, Base
+import logconfig
 
 # Загружаем переменные окружения
 load_dotenv()
 
+log = logconfig.get_logger("capsule.admin_bot")
+
 # Токен бота из переменных окружения
 BOT_TOKEN = os.getenv('ADMIN_BOT_TOKEN', '')
 ADMIN_USER_IDS = os.getenv('ADMIN_USER_IDS', '').split(',')  # Список ID админов через запятую
@@ -34,7 +39,7 @@ if not DATABASE_URL:
     # Локальная разработка - используем SQLite
     default_db_path = os.path.join(os.path.dirname(__file__), '..', 'backend', 'db.sqlite3')
     DATABASE_URL = f'sqlite:///{os.path.abspath(default_db_path)}'
-    print("⚠️ [ADMIN_BOT] DATABASE_URL not set, using SQLite:", DATABASE_URL)
+    log.warning("DATABASE_URL not set, using SQLite", extra={"url": DATABASE_URL})
 else:
     # Скрываем пароль в логах
     db_url_display = DATABASE_URL
@@ -48,43 +53,64 @@ else:
                 if ':' in user_part:
                     user = user_part.split(':')[0]
                     db_url_display = f"{protocol}://{user}:***@{parts[1]}"
-    print(f"✅ [ADMIN_BOT] Using DATABASE_URL: {db_url_display}")
+    log.info("using DATABASE_URL", extra={"url": db_url_display})
 
 if DATABASE_URL.startswith('postgresql'):
-    print("✅ [ADMIN_BOT] Using PostgreSQL")
+    log.info("using PostgreSQL")
     engine = create_engine(DATABASE_URL)
 else:
-    print("⚠️ [ADMIN_BOT] Using SQLite (local development)")
+    log.warning("using SQLite (local development)")
     engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 
-# Инициализируем базу данных (создаем таблицы если их нет)
-try:
-    Base.metadata.create_all(bind=engine)
-    print("✅ База данных инициализирована")
-    
-    # Миграция: обновляем user_id на BigInteger если используется PostgreSQL
-    if DATABASE_URL.startswith('postgresql'):
-        try:
-            from sqlalchemy import text
-            with engine.connect() as conn:
-                # Проверяем текущий тип user_id
-                result = conn.execute(text("""
-                    SELECT data_type 
-                    FROM information_schema.columns 
-                    WHERE table_name = 'users' AND column_name = 'user_id'
-                """))
-                row = result.fetchone()
-                if row and row[0] == 'integer':
-                    print("🔄 Обновление user_id на BigInteger...")
-                    conn.execute(text("ALTER TABLE users ALTER COLUMN user_id TYPE BIGINT"))
-                    conn.execute(text("ALTER TABLE user_gifts ALTER COLUMN user_id TYPE BIGINT"))
-                    conn.execute(text("ALTER TABLE transactions ALTER COLUMN user_id TYPE BIGINT"))
-                    conn.commit()
-                    print("✅ Миграция user_id завершена")
-        except Exception as e:
-            print(f"⚠️ Ошибка миграции (возможно уже выполнена): {e}")
-except Exception as e:
-    print(f"⚠️ Ошибка инициализации БД: {e}")
+# Схемой владеют миграции бэкенда (backend/migrations.py, таблица schema_version);
+# с версии 7 они включают перевод user_id в BIGINT, который раньше делал этот бот
+BACKEND_SCHEMA_VERSION = 7
+
+
+def backend_schema_version() -> int:
+    """Версия схемы, примененная бэкендом; 0, если бэкенд еще не мигрировал БД"""
+    with engine.connect() as conn:
+        if not inspect(conn).has_table("schema_version"):
+            return 0
+        return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def init_db():
+    """
+    Создает таблицы, если их нет (вызывается из main, а не при импорте).
+    Если схема уже мигрирована бэкендом, DDL и проверки типов пропускаются
+    """
+    try:
+        if backend_schema_version() >= BACKEND_SCHEMA_VERSION:
+            log.info("Схема БД актуальна, инициализация пропущена")
+            return
+
+        Base.metadata.create_all(bind=engine)
+        log.info("База данных инициализирована")
+
+        # Миграция: обновляем user_id на BigInteger если используется PostgreSQL
+        if DATABASE_URL.startswith('postgresql'):
+            try:
+                with engine.connect() as conn:
+                    # Проверяем текущий тип user_id
+                    result = conn.execute(text("""
+                        SELECT data_type 
+                        FROM information_schema.columns 
+                        WHERE table_name = 'users' AND column_name = 'user_id'
+                    """))
+                    row = result.fetchone()
+                    if row and row[0] == 'integer':
+                        log.info("Обновление user_id на BigInteger")
+                        conn.execute(text("ALTER TABLE users ALTER COLUMN user_id TYPE BIGINT"))
+                        conn.execute(text("ALTER TABLE user_gifts ALTER COLUMN user_id TYPE BIGINT"))
+                        conn.execute(text("ALTER TABLE transactions ALTER COLUMN user_id TYPE BIGINT"))
+                        conn.commit()
+                        log.info("Миграция user_id завершена")
+            except Exception:
+                log.warning("Ошибка миграции (возможно уже выполнена)", exc_info=True)
+    except Exception:
+        log.exception("Ошибка инициализации БД")
+
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -94,6 +120,77 @@ def get_db():
     return SessionLocal()
 
 
+# Баланс ведется в леджере: transactions.ledger_amount в nanoTON / Stars (как в backend/ledger.py)
+TON_NANO = 10 ** 9
+
+
+def ton_to_nano(amount: float) -> int:
+    return int((Decimal(repr(amount)) * TON_NANO).to_integral_value())
+
+
+def ledger_balances(db, user_ids) -> dict:
+    """Балансы {user_id: (ton, stars)} одним запросом - сумма записей леджера"""
+    balances = {user_id: (0.0, 0) for user_id in user_ids}
+    rows = db.query(
+        Transaction.user_id, Transaction.currency, func.sum(Transaction.ledger_amount)
+    ).filter(
+        Transaction.user_id.in_(list(balances)), Transaction.ledger_amount.isnot(None)
+    ).group_by(Transaction.user_id, Transaction.currency).all()
+    for user_id, currency, total in rows:
+        ton, stars = balances[user_id]
+        if currency == 'TON':
+            balances[user_id] = (total / TON_NANO, stars)
+        elif currency == 'STARS':
+            balances[user_id] = (ton, int(total))
+    return balances
+
+
+# Кэш API (backend/cache.py): при CACHE_BACKEND=redis сбрасываем закэшированные
+# балансы после пополнений из бота, иначе API увидит их только через TTL
+CACHE_KEY_PREFIX = os.getenv('CACHE_KEY_PREFIX', 'capsule:')
+api_cache = None
+if os.getenv('CACHE_BACKEND', 'memory') == 'redis':
+    try:
+        import redis
+        api_cache = redis.Redis.from_url(os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+    except ImportError:
+        log.warning("CACHE_BACKEND=redis, but redis package is not installed; API cache expires by TTL")
+
+
+def invalidate_api_cache(user_ids) -> None:
+    """Удаляет балансы пользователей из кэша API (после commit)"""
+    keys = [f"{CACHE_KEY_PREFIX}balance:{user_id}" for user_id in user_ids]
+    if api_cache is None or not keys:
+        return
+    try:
+        api_cache.delete(*keys)
+    except redis.RedisError as e:
+        log.warning("failed to invalidate API cache", extra={"error": repr(e)})
+
+
+def credit_user_balance(db, user_id: int, amount: float, tx_hash: str) -> float:
+    """
+    Пополняет TON-баланс записью леджера, создавая пользователя при необходимости
+    (INSERT ... ON CONFLICT DO NOTHING). Возвращает новый баланс, commit - за вызывающим
+    """
+    dialect = postgresql if DATABASE_URL.startswith('postgresql') else sqlite
+    db.execute(
+        dialect.insert(User).values(user_id=user_id, balance_ton=0.0, balance_stars=0)
+        .on_conflict_do_nothing(index_elements=[User.user_id])
+    )
+    db.add(Transaction(
+        user_id=user_id,
+        transaction_type='deposit',
+        amount=amount,
+        currency='TON',
+        status='completed',
+        tx_hash=tx_hash,
+        ledger_amount=ton_to_nano(amount)
+    ))
+    db.flush()
+    return ledger_balances(db, [user_id])[user_id][0]
+
+
 def is_admin(user_id: int) -> bool:
     """Проверка, является ли пользователь админом"""
     if not ADMIN_USER_IDS or ADMIN_USER_IDS == ['']:
@@ -154,8 +251,12 @@ async def stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         # Получаем статистику
         total_users = db.query(func.count(User.user_id)).scalar() or 0
-        total_ton = db.query(func.sum(User.balance_ton)).scalar() or 0.0
-        total_stars = db.query(func.sum(User.balance_stars)).scalar() or 0
+        total_ton = (db.query(func.sum(Transaction.ledger_amount)).filter(
+            Transaction.currency == 'TON'
+        ).scalar() or 0) / TON_NANO
+        total_stars = db.query(func.sum(Transaction.ledger_amount)).filter(
+            Transaction.currency == 'STARS'
+        ).scalar() or 0
         total_gifts = db.query(func.count(UserGift.id)).scalar() or 0
         total_transactions = db.query(func.count(Transaction.id)).scalar() or 0
         
@@ -349,7 +450,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     
                 except Exception as e:
                     failed += 1
-                    print(f"❌ Ошибка отправки пользователю {user.user_id}: {e}")
+                    log.warning("Ошибка отправки пользователю", extra={"user_id": user.user_id, "error": str(e)})
                     
             # Итоговое сообщение
             result_message = (
@@ -403,17 +504,15 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
             
             for i, user in enumerate(users):
                 try:
-                    # Обновляем баланс
-                    user.balance_ton += amount
-                    
-                    # Создаем транзакцию
+                    # Пополнение - запись леджера
                     transaction = Transaction(
                         user_id=user.user_id,
                         transaction_type='deposit',
                         amount=amount,
                         currency='TON',
                         status='completed',
-                        tx_hash=f'mass_admin_{query.from_user.id}_{datetime.now().timestamp()}_{i}'
+                        tx_hash=f'mass_admin_{query.from_user.id}_{datetime.now().timestamp()}_{i}',
+                        ledger_amount=ton_to_nano(amount)
                     )
                     db.add(transaction)
                     
@@ -431,11 +530,12 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     
                 except Exception as e:
                     failed += 1
-                    print(f"❌ Ошибка пополнения пользователю {user.user_id}: {e}")
+                    log.error("Ошибка пополнения пользователю", extra={"user_id": user.user_id, "error": str(e)})
                     db.rollback()
             
             # Финальный коммит
             db.commit()
+            invalidate_api_cache([u.user_id for u in users])
             
             # Итоговое сообщение
             result_message = (
@@ -544,45 +644,26 @@ async def balance_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         amount = float(context.args[1])
         
         db = get_db()
-        user = db.query(User).filter(User.user_id == user_id).first()
-        
-        if not user:
-            # Создаем пользователя если его нет
-            user = User(user_id=user_id, balance_ton=0.0, balance_stars=0)
-            db.add(user)
-            db.commit()
-            db.refresh(user)
         
-        # Пополняем баланс
-        old_balance = user.balance_ton
-        user.balance_ton += amount
-        
-        print(f"[ADMIN_BOT] Updating balance for user {user_id}:")
-        print(f"  - Old balance: {old_balance}")
-        print(f"  - Adding: {amount}")
-        print(f"  - New balance: {user.balance_ton}")
-        print(f"  - Database URL: {DATABASE_URL[:50]}..." if len(DATABASE_URL) > 50 else f"  - Database URL: {DATABASE_URL}")
-        
-        # Создаем транзакцию
-        transaction = Transaction(
-            user_id=user_id,
-            transaction_type='deposit',
-            amount=amount,
-            currency='TON',
-            status='completed',
-            tx_hash=f'admin_{update.effective_user.id}_{datetime.now().timestamp()}'
+        # Создаем пользователя если его нет и пополняем баланс одним запросом
+        new_balance = credit_user_balance(
+            db, user_id, amount, f'admin_{update.effective_user.id}_{datetime.now().timestamp()}'
         )
-        db.add(transaction)
+        old_balance = new_balance - amount
+        
         db.commit()
-        db.refresh(user)
+        invalidate_api_cache([user_id])
         
-        print(f"[ADMIN_BOT] Balance updated successfully. Final balance: {user.balance_ton}")
+        log.info("balance credited", extra={
+            "user_id": user_id, "admin_id": update.effective_user.id,
+            "old_balance": old_balance, "amount": amount, "new_balance": new_balance
+        })
         
         await update.message.reply_text(
             f"✅ Баланс обновлен!\n\n"
             f"👤 Пользователь: {user_id}\n"
             f"💰 Выдано: {amount} TON\n"
-            f"💵 Новый баланс: {user.balance_ton:.2f} TON"
+            f"💵 Новый баланс: {new_balance:.2f} TON"
         )
         
     except ValueError:
@@ -606,11 +687,13 @@ async def users_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text("📭 Пользователей пока нет.")
             return
         
+        balances = ledger_balances(db, [user.user_id for user in users])
         message = "👥 <b>Список пользователей:</b>\n\n"
         for user in users:
             username = user.username or user.first_name or "Без имени"
+            balance_ton, balance_stars = balances[user.user_id]
             message += f"• <b>{user.user_id}</b> - {username}\n"
-            message += f"  💰 {user.balance_ton:.2f} TON | ⭐ {user.balance_stars} Stars\n\n"
+            message += f"  💰 {balance_ton:.2f} TON | ⭐ {balance_stars} Stars\n\n"
         
         # Разбиваем на части если сообщение слишком длинное
         if len(message) > 4000:
@@ -646,14 +729,15 @@ async def user_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         gifts_count = db.query(UserGift).filter(UserGift.user_id == user_id).count()
         transactions_count = db.query(Transaction).filter(Transaction.user_id == user_id).count()
+        balance_ton, balance_stars = ledger_balances(db, [user_id])[user_id]
         
         message = (
             f"👤 <b>Информация о пользователе:</b>\n\n"
             f"🆔 ID: {user.user_id}\n"
             f"👤 Имя: {user.first_name or 'Не указано'}\n"
             f"📝 Username: @{user.username or 'Не указано'}\n"
-            f"💰 Баланс TON: {user.balance_ton:.2f}\n"
-            f"⭐ Баланс Stars: {user.balance_stars}\n"
+            f"💰 Баланс TON: {balance_ton:.2f}\n"
+            f"⭐ Баланс Stars: {balance_stars}\n"
             f"🎁 Подарков: {gifts_count}\n"
             f"📊 Транзакций: {transactions_count}\n"
             f"📅 Регистрация: {user.created_at.strftime('%Y-%m-%d %H:%M') if user.created_at else 'Не указано'}"
@@ -825,9 +909,12 @@ async def add_gift_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 def main():
     """Запуск админ-бота"""
     if not BOT_TOKEN:
-        print("❌ Ошибка: ADMIN_BOT_TOKEN не установлен в переменных окружения!")
+        log.error("ADMIN_BOT_TOKEN не установлен в переменных окружения")
         return
     
+    # Инициализируем БД
+    init_db()
+    
     try:
         # Создаем приложение
         application = Application.builder().token(BOT_TOKEN).build()
@@ -850,7 +937,7 @@ def main():
         application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
         application.add_handler(CallbackQueryHandler(button_callback))
         
-        print("🤖 Админ-бот запущен!")
+        log.info("Админ-бот запущен")
         
         # Запускаем бота (отключаем обработку сигналов для работы в потоке)
         application.run_polling(
@@ -858,10 +945,8 @@ def main():
             drop_pending_updates=True,
             stop_signals=None  # Отключаем обработку сигналов для работы в потоке
         )
-    except Exception as e:
-        print(f"❌ Критическая ошибка в админ-боте: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("Критическая ошибка в админ-боте")
         raise
 
 
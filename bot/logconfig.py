@@ -0,0 +1,140 @@
+"""
+Логирование JSON-строками через очередь (общее для backend и ботов;
+bot/logconfig.py - копия этого файла, меняйте оба)
+Вызов логгера в обработчике только кладет запись в очередь: форматирование и
+запись в stdout выполняет фоновый поток QueueListener.
+
+Переменные окружения:
+- LOG_LEVEL - уровень по умолчанию (INFO)
+- LOG_LEVELS - уровни отдельных логгеров: "capsule.balance=DEBUG,sqlalchemy.engine=INFO"
+  (по умолчанию httpx=WARNING: клиент бенчмарков пишет каждый запрос в INFO)
+- LOG_SAMPLING - доля DEBUG-записей частых событий, попадающих в лог:
+  "capsule.balance=0.01" (по умолчанию), 1 - все, 0 - ни одной
+- LOG_FORMAT=text - читаемые строки вместо JSON (локальная разработка)
+
+Использование: log = logconfig.get_logger("capsule.ledger");
+log.info("snapshot refreshed", extra={"users": 10}) - поля extra попадают в JSON.
+"""
+import os
+import sys
+import copy
+import json
+import queue
+import atexit
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_LEVELS = os.getenv('LOG_LEVELS', 'httpx=WARNING')
+LOG_SAMPLING = os.getenv('LOG_SAMPLING', 'capsule.balance=0.01')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json')
+
+# Атрибуты LogRecord, которые не являются полями extra (color_message - дубль msg от uvicorn)
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "color_message"}
+
+_lock = threading.Lock()
+_listener = None
+
+
+def _parse_pairs(spec: str) -> Dict[str, str]:
+    """"a=1,b=2" -> {"a": "1", "b": "2"}"""
+    pairs = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        pairs[name.strip()] = value.strip()
+    return pairs
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON: ts, level, logger, msg, поля extra, exc"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Пропускает только долю DEBUG-записей логгеров из rates (с дочерними);
+    остальные уровни проходят всегда. Стоит до очереди: отброшенная запись ничего не стоит
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or not self.rates:
+            return True
+        name = record.name
+        while name:
+            rate = self.rates.get(name)
+            if rate is not None:
+                return random.random() < rate
+            name = name.rpartition(".")[0]
+        return True
+
+
+class _QueueHandler(QueueHandler):
+    """
+    Стандартный prepare() форматирует запись в строку еще в вызывающем потоке;
+    здесь только фиксируем сообщение и traceback, а JSON собирает фоновый поток
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging():
+    """Настраивает корневой логгер один раз на процесс; повторные вызовы ничего не делают"""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        handler = logging.StreamHandler(sys.stdout)
+        if LOG_FORMAT == 'text':
+            handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+        else:
+            handler.setFormatter(JsonFormatter())
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = _QueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter({
+            name: float(rate) for name, rate in _parse_pairs(LOG_SAMPLING).items()
+        }))
+
+        root = logging.getLogger()
+        root.setLevel(LOG_LEVEL)
+        root.addHandler(queue_handler)
+        for name, level in _parse_pairs(LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level.upper())
+
+        _listener = QueueListener(log_queue, handler, respect_handler_level=True)
+        _listener.start()
+        # Дописываем очередь при выходе из процесса
+        atexit.register(_listener.stop)
+
+
+def get_logger(name: str) -> logging.Logger:
+    setup_logging()
+    return logging.getLogger(name)
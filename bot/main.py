@@ -7,6 +7,10 @@ import os
 import html
 from os import path
 
+import logconfig
+
+log = logconfig.get_logger("capsule.start_bot")
+
 BOT_TOKEN = os.getenv('BOT_TOKEN', '8309506716:AAF7CWJgIPDgB4OBkH-xerRWIfVhLad3238')
 
 _default_tgs = path.join(path.dirname(__file__), 'AnimatedSticker.tgs')
@@ -26,8 +30,8 @@ async def start_command(message: types.Message):
         else:
             sticker_input = START_STICKER
         await bot.send_sticker(chat_id=message.chat.id, sticker=sticker_input)
-    except Exception as e:
-        print(f"send_sticker error: {e}")
+    except Exception:
+        log.exception("send_sticker failed", extra={"chat_id": message.chat.id})
 
     username = message.from_user.username or 'User'
     safe_username = html.escape(username)
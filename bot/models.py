@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, ForeignKey, Text, Boolean, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from sqlalchemy.ext.declarative import declarative_base
@@ -11,6 +11,7 @@ class User(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(BigInteger, unique=True, index=True, nullable=False)  # Telegram user ID (может быть большим числом)
     wallet_address = Column(String(255), nullable=True)  # TON wallet address
+    # Устарело: API ведет баланс в леджере (transactions.ledger_amount), колонки не обновляются
     balance_ton = Column(Float, default=0.0, nullable=False)
     balance_stars = Column(Integer, default=0, nullable=False)
     username = Column(String(255), nullable=True)
@@ -39,6 +40,11 @@ class UserGift(Base):
     # Связи
     user = relationship("User", back_populates="gifts")
 
+    # Один и тот же подарок нельзя купить дважды
+    __table_args__ = (
+        Index('uq_user_gifts_user_gift', 'user_id', 'gift_id', unique=True),
+    )
+
 
 class Transaction(Base):
     __tablename__ = "transactions"
@@ -51,6 +57,9 @@ class Transaction(Base):
     gift_id = Column(String(255), nullable=True)  # Если это покупка подарка
     status = Column(String(50), default='completed')  # 'pending', 'completed', 'failed'
     tx_hash = Column(String(255), nullable=True)  # Хеш транзакции TON
+    # Изменение баланса в минимальных единицах (nanoTON / Stars), со знаком.
+    # NULL - запись только для истории, на баланс не влияет
+    ledger_amount = Column(BigInteger, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # Связи
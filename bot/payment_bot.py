@@ -7,14 +7,18 @@ from typing import Optional
 
 from telegram import Update, LabeledPrice, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, ContextTypes, PreCheckoutQueryHandler, MessageHandler, filters
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Boolean, BigInteger
+from sqlalchemy import create_engine, inspect, Column, Integer, String, Float, DateTime, Boolean, BigInteger
 from sqlalchemy.orm import sessionmaker, declarative_base
 from sqlalchemy.sql import func
 from dotenv import load_dotenv
 
+import logconfig
+
 # Загружаем переменные окружения
 load_dotenv()
 
+log = logconfig.get_logger("capsule.payment_bot")
+
 # Токен бота оплаты
 PAYMENT_BOT_TOKEN = os.getenv('PAYMENT_BOT_TOKEN', '8552103562:AAGpMhknVB7JbiigyB2Z2Iot1L-lI3IlFbY')
 
@@ -50,14 +54,15 @@ class PromoCode(Base):
 
 # Инициализируем базу данных (с задержкой для избежания конфликтов)
 def init_promo_db():
-    """Инициализация БД промокодов"""
+    """Инициализация БД промокодов; если БД уже мигрирована бэкендом (есть schema_version), пропускается"""
     try:
+        if inspect(engine).has_table("schema_version"):
+            log.info("Схема БД ведется миграциями бэкенда, инициализация пропущена")
+            return
         Base.metadata.create_all(bind=engine)
-        print("✅ База данных промокодов инициализирована")
-    except Exception as e:
-        print(f"⚠️ Ошибка инициализации БД промокодов: {e}")
-        import traceback
-        traceback.print_exc()
+        log.info("База данных промокодов инициализирована")
+    except Exception:
+        log.exception("Ошибка инициализации БД промокодов")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
@@ -115,7 +120,9 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         
         prices = [LabeledPrice(label=f"Top up {ton_amount:.2f} TON ({stars_amount} Stars)", amount=stars_amount)]
         
-        print(f"[PAYMENT_BOT] Creating invoice: stars_amount={stars_amount}, ton_amount={ton_amount:.2f}, user_id={update.effective_user.id}")
+        log.info("creating invoice", extra={
+            "stars_amount": stars_amount, "ton_amount": round(ton_amount, 2), "user_id": update.effective_user.id
+        })
         
         # Отправляем инвойс
         try:
@@ -133,11 +140,9 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 prices=prices,
                 start_parameter=f"stars_{stars_amount}",
             )
-            print(f"[PAYMENT_BOT] Invoice sent successfully: {invoice_result}")
+            log.info("invoice sent", extra={"user_id": update.effective_user.id, "message_id": invoice_result.message_id})
         except Exception as invoice_error:
-            print(f"[PAYMENT_BOT] Error sending invoice: {invoice_error}")
-            import traceback
-            traceback.print_exc()
+            log.exception("error sending invoice", extra={"user_id": update.effective_user.id})
             # Показываем более детальную ошибку пользователю
             error_msg = str(invoice_error)
             if "Bad Request" in error_msg or "400" in error_msg:
@@ -153,15 +158,13 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 )
         
     except ValueError as ve:
-        print(f"[PAYMENT_BOT] ValueError: {ve}")
+        log.warning("invalid invoice amount", extra={"error": str(ve)})
         await update.message.reply_text(
             "Invalid amount. Use a number.\n\n"
             "Example: /start stars_500"
         )
-    except Exception as e:
-        print(f"[PAYMENT_BOT] Unexpected error creating invoice: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("unexpected error creating invoice")
         await update.message.reply_text("Error creating payment invoice. Please try again later.")
 
 async def precheckout_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -229,14 +232,14 @@ async def successful_payment_callback(update: Update, context: ContextTypes.DEFA
         
         db.close()
         
-    except Exception as e:
-        print(f"Error processing payment: {e}")
+    except Exception:
+        log.exception("error processing payment")
         await update.message.reply_text("Error processing payment. Please contact support.")
 
 def main():
     """Запуск бота оплаты"""
     if not PAYMENT_BOT_TOKEN:
-        print("❌ Ошибка: PAYMENT_BOT_TOKEN не установлен в переменных окружения!")
+        log.error("PAYMENT_BOT_TOKEN не установлен в переменных окружения")
         return
     
     # Инициализируем БД
@@ -251,7 +254,7 @@ def main():
         application.add_handler(PreCheckoutQueryHandler(precheckout_callback))
         application.add_handler(MessageHandler(filters.SUCCESSFUL_PAYMENT, successful_payment_callback))
         
-        print("💳 Payment bot запущен!")
+        log.info("Payment bot запущен")
         
         # Запускаем бота (отключаем обработку сигналов для работы в потоке)
         application.run_polling(
@@ -259,10 +262,8 @@ def main():
             drop_pending_updates=True,
             stop_signals=None  # Отключаем обработку сигналов для работы в потоке
         )
-    except Exception as e:
-        print(f"❌ Критическая ошибка в боте оплаты: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        log.exception("Критическая ошибка в боте оплаты")
         raise
 
 if __name__ == '__main__':
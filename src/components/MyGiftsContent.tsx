@@ -185,7 +185,8 @@ function GiftCard({ gift, index, onWithdrawClick }: GiftCardProps) {
 
 export function MyGiftsContent() {
   const { searchQuery, searchResults, isSearching, searchError, activeTab: giftsTab } = useMarketContext()
-  const { myGifts } = useUserContext()
+  const { myGifts, loadMoreGifts, hasMoreGifts } = useUserContext()
+  const loadMoreRef = useRef<HTMLDivElement>(null)
   const [loading, setLoading] = useState(false)
   const [error] = useState<string | null>(null)
   const [isModalOpen, setIsModalOpen] = useState(false)
@@ -219,6 +220,34 @@ export function MyGiftsContent() {
   const displayGifts = searchQuery.trim() ? filteredSearchResults : filteredGifts
   const displayLoading = searchQuery.trim() ? isSearching : loading
   const displayError = searchQuery.trim() ? searchError : error
+  const canLoadMore = !searchQuery.trim() && giftsTab !== 'listed' && hasMoreGifts
+
+  // Intersection Observer: следующая страница подарков - когда пользователь докрутил до конца
+  useEffect(() => {
+    if (!canLoadMore) return
+
+    const observer = new IntersectionObserver(
+      (entries) => {
+        entries.forEach((entry) => {
+          if (entry.isIntersecting) {
+            loadMoreGifts()
+          }
+        })
+      },
+      {
+        rootMargin: '200px', // Начинаем загрузку за 200px до конца
+        threshold: 0.1,
+      }
+    )
+
+    if (loadMoreRef.current) {
+      observer.observe(loadMoreRef.current)
+    }
+
+    return () => {
+      observer.disconnect()
+    }
+  }, [canLoadMore, loadMoreGifts, displayGifts.length])
 
   const handleWithdraw = (gift: GiftPreview) => {
     // TODO: Реализовать вывод подарка
@@ -295,6 +324,14 @@ export function MyGiftsContent() {
           />
         ))}
       </div>
+      {/* Элемент для отслеживания скролла - загружаем следующую страницу подарков */}
+      {canLoadMore && (
+        <div ref={loadMoreRef} className="market-content__load-more" style={{
+          height: '10px',
+          width: '100%',
+          marginTop: '20px'
+        }} />
+      )}
     </div>
   )
 }
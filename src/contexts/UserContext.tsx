@@ -1,4 +1,4 @@
-import { createContext, useContext, useState, useEffect } from 'react'
+import { createContext, useContext, useState, useEffect, useCallback } from 'react'
 import type { ReactNode } from 'react'
 import type { GiftPreview } from '../api/types'
 import { getTelegramUserSafe } from '../twa'
@@ -11,6 +11,8 @@ interface UserContextType {
   subtractBalance: (amount: number) => boolean
   refreshBalance: () => Promise<void>
   isLoading: boolean
+  loadMoreGifts: () => Promise<void>
+  hasMoreGifts: boolean
 }
 
 const UserContext = createContext<UserContextType | undefined>(undefined)
@@ -23,11 +25,31 @@ const API_BASE_URL = import.meta.env.VITE_API_URL ||
     ? 'https://capsule-market-production.up.railway.app/api'
     : '/api')
 
+// Подарков на странице: первая приходит в bootstrap, следующие - по мере прокрутки
+const GIFTS_PAGE_SIZE = 50
+
+// Подарок из API (UserGiftResponse) в формате GiftPreview
+function toGiftPreview(g: any): GiftPreview {
+  return {
+    id: g.gift_id,
+    name: g.gift_name,
+    price: g.gift_price,
+    preview: g.gift_preview || undefined,
+    models_count: 0,
+    in_stock: true,
+    rating: 0,
+    tags: []
+  }
+}
+
 export function UserProvider({ children }: { children: ReactNode }) {
   const [balance, setBalanceState] = useState<number>(0.00)
   const [myGifts, setMyGifts] = useState<GiftPreview[]>([])
   const [isLoading, setIsLoading] = useState(false)
   const [userId, setUserId] = useState<number | null>(null)
+  // Курсор следующей страницы подарков (X-Next-Cursor); null - загружено все
+  const [giftsCursor, setGiftsCursor] = useState<string | null>(null)
+  const [isLoadingMoreGifts, setIsLoadingMoreGifts] = useState(false)
 
   // Получаем user_id из Telegram при монтировании
   useEffect(() => {
@@ -58,71 +80,48 @@ export function UserProvider({ children }: { children: ReactNode }) {
     try {
       setIsLoading(true)
       
-      // Создаем/обновляем пользователя с данными из Telegram
+      // Создаем/обновляем пользователя с данными из Telegram.
+      // Не ждем ответа: bootstrap сам создаст пользователя, если его еще нет
       const telegramUser = getTelegramUserSafe()
       if (telegramUser) {
-        try {
-          await fetch(`${API_BASE_URL}/user`, {
-            method: 'POST',
-            headers: {
-              'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-              user_id: userId,
-              username: telegramUser.username || null,
-              first_name: telegramUser.first_name || null,
-              last_name: telegramUser.last_name || null,
-              is_premium: telegramUser.is_premium || false,
-            }),
-          })
-        } catch (error) {
+        fetch(`${API_BASE_URL}/user`, {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+          },
+          body: JSON.stringify({
+            user_id: userId,
+            username: telegramUser.username || null,
+            first_name: telegramUser.first_name || null,
+            last_name: telegramUser.last_name || null,
+            is_premium: telegramUser.is_premium || false,
+          }),
+        }).catch((error) => {
           console.error('Error creating/updating user:', error)
-        }
+        })
       }
       
-      // Загружаем баланс
-      const balanceUrl = `${API_BASE_URL}/user/${userId}/balance`
-      console.log('[UserContext] Loading balance from:', balanceUrl)
-      console.log('[UserContext] API_BASE_URL:', API_BASE_URL)
-      console.log('[UserContext] userId:', userId)
+      // Баланс и первая страница подарков одним запросом; история транзакций на старте не нужна
+      const bootstrapUrl = `${API_BASE_URL}/user/${userId}/bootstrap?gifts_limit=${GIFTS_PAGE_SIZE}&transactions_limit=0`
+      console.log('[UserContext] Loading bootstrap from:', bootstrapUrl)
       
-      const balanceResponse = await fetch(balanceUrl)
-      console.log('[UserContext] Balance response status:', balanceResponse.status)
-      console.log('[UserContext] Balance response ok:', balanceResponse.ok)
+      const bootstrapResponse = await fetch(bootstrapUrl)
+      console.log('[UserContext] Bootstrap response status:', bootstrapResponse.status)
       
-      if (balanceResponse.ok) {
-        const balanceData = await balanceResponse.json()
-        console.log('[UserContext] Balance loaded (full object):', JSON.stringify(balanceData, null, 2))
-        console.log('[UserContext] balance_ton value:', balanceData.balance_ton)
-        console.log('[UserContext] balance_ton type:', typeof balanceData.balance_ton)
-        const newBalance = parseFloat(balanceData.balance_ton) || 0.00
-        console.log('[UserContext] Parsed balance:', newBalance)
-        console.log('[UserContext] Setting balance state to:', newBalance)
-        setBalanceState(newBalance)
-        console.log('[UserContext] Balance state set, current balance should be:', newBalance)
-      } else {
-        const errorText = await balanceResponse.text()
-        console.error('[UserContext] Failed to load balance:', balanceResponse.status, errorText)
-        console.error('[UserContext] Response headers:', Object.fromEntries(balanceResponse.headers.entries()))
-      }
-
-      // Загружаем подарки
-      const giftsResponse = await fetch(`${API_BASE_URL}/user/${userId}/gifts`)
-      if (giftsResponse.ok) {
-        const giftsData = await giftsResponse.json()
-        // Преобразуем данные из API в формат GiftPreview
-        const formattedGifts: GiftPreview[] = giftsData.map((g: any) => ({
-          id: g.gift_id,
-          name: g.gift_name,
-          price: g.gift_price,
-          preview: g.gift_preview || undefined,
-          models_count: 0,
-          in_stock: true,
-          rating: 0,
-          tags: []
-        }))
-        setMyGifts(formattedGifts)
+      if (!bootstrapResponse.ok) {
+        const errorText = await bootstrapResponse.text()
+        console.error('[UserContext] Failed to load bootstrap:', bootstrapResponse.status, errorText)
+        return
       }
+      
+      const bootstrapData = await bootstrapResponse.json()
+      const newBalance = parseFloat(bootstrapData.balance.balance_ton) || 0.00
+      console.log('[UserContext] Setting balance state to:', newBalance)
+      setBalanceState(newBalance)
+      
+      // Следующие страницы подарков загружаются по мере прокрутки (loadMoreGifts)
+      setMyGifts(bootstrapData.gifts.map(toGiftPreview))
+      setGiftsCursor(bootstrapData.gifts_next_cursor)
     } catch (error) {
       console.error('Error loading user data:', error)
     } finally {
@@ -130,6 +129,31 @@ export function UserProvider({ children }: { children: ReactNode }) {
     }
   }
 
+  const loadMoreGifts = useCallback(async () => {
+    if (!userId || !giftsCursor || isLoadingMoreGifts) return
+
+    try {
+      setIsLoadingMoreGifts(true)
+      const giftsUrl = `${API_BASE_URL}/user/${userId}/gifts?limit=${GIFTS_PAGE_SIZE}&cursor=${encodeURIComponent(giftsCursor)}`
+      const giftsResponse = await fetch(giftsUrl)
+      if (!giftsResponse.ok) {
+        console.error('[UserContext] Failed to load gifts page:', giftsResponse.status)
+        return
+      }
+      const page: GiftPreview[] = (await giftsResponse.json()).map(toGiftPreview)
+      // Подарок, купленный в этой сессии, уже добавлен в список через addGift
+      setMyGifts(prev => {
+        const known = new Set(prev.map(g => g.id))
+        return [...prev, ...page.filter(g => !known.has(g.id))]
+      })
+      setGiftsCursor(giftsResponse.headers.get('X-Next-Cursor'))
+    } catch (error) {
+      console.error('[UserContext] Error loading gifts page:', error)
+    } finally {
+      setIsLoadingMoreGifts(false)
+    }
+  }, [userId, giftsCursor, isLoadingMoreGifts])
+
   const setBalance = (newBalance: number) => {
     setBalanceState(newBalance)
   }
@@ -228,6 +252,8 @@ export function UserProvider({ children }: { children: ReactNode }) {
         subtractBalance,
         refreshBalance,
         isLoading,
+        loadMoreGifts,
+        hasMoreGifts: giftsCursor !== null,
       }}
     >
       {children}